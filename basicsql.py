@@ -1,429 +1,2210 @@
 import sqlite3
+import atexit
+import functools
+import json
+import os
+import re
+import threading
+import time
+import types
+from bisect import bisect_left
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from urllib.request import pathname2url
 
-conn = sqlite3.connect('posdb.sqlite3')
-
-c = conn.cursor()
-
-# ตาราง product
-c.execute("""CREATE TABLE IF NOT EXISTS product (
-            ID INTEGER PRIMARY KEY AUTOINCREMENT,
-            barcode TEXT,
-            title TEXT,
-            price REAL,
-            cost REAL,
-            quantity INTEGER,
-            unit TEXT,
-            category TEXT,
-            reorder_point INTEGER,
-            supplier TEXT )""")
-
-# ตาราง sales (แทน transaction เพราะเป็น reserved keyword)
-c.execute("""CREATE TABLE IF NOT EXISTS sales (
-            ID INTEGER PRIMARY KEY AUTOINCREMENT,
-            transaction_id TEXT,
-            datetime TEXT,
-            subtotal REAL,
-            vat REAL,
-            grand_total REAL,
-            received_amount REAL,
-            change_amount REAL,
-            items TEXT )""")
-
-# ==================== ตาราง CUSTOMERS ====================
-c.execute('''CREATE TABLE IF NOT EXISTS customers (
-    customer_id TEXT PRIMARY KEY,
-    customer_name TEXT NOT NULL,
-    phone TEXT,
-    email TEXT,
-    address TEXT,
-    credit_limit REAL DEFAULT 0,
-    credit_days INTEGER DEFAULT 0,
-    total_debt REAL DEFAULT 0,
-    created_date TEXT,
-    notes TEXT
-)''')
-
-# ==================== ตาราง CREDIT_BILLS ====================
-c.execute('''CREATE TABLE IF NOT EXISTS credit_bills (
-    bill_id TEXT PRIMARY KEY,
-    customer_id TEXT NOT NULL,
-    transaction_id TEXT,
-    bill_date TEXT,
-    due_date TEXT,
-    total_amount REAL,
-    paid_amount REAL DEFAULT 0,
-    remaining_amount REAL,
-    status TEXT DEFAULT 'PENDING',
-    payment_date TEXT,
-    notes TEXT,
-    FOREIGN KEY (customer_id) REFERENCES customers(customer_id),
-    FOREIGN KEY (transaction_id) REFERENCES sales(transaction_id)
-)''')
-
-conn.commit()
-print("✅ Database tables created/verified")
+from event_bus import bus, PRODUCT_CHANGED, STOCK_CHANGED, SALE_COMMITTED, BILL_CHANGED
+
+# ==================== CONNECTION ====================
+
+# ไฟล์ฐานข้อมูลเริ่มต้น เปลี่ยนได้ด้วย POS_DB_PATH หรือ init_db() (ใช้ ':memory:' สำหรับทดสอบ)
+DB_PATH = os.environ.get('POS_DB_PATH', 'posdb.sqlite3')
+
+# ระดับการ fsync ตอน commit: FULL ปลอดภัยที่สุด, NORMAL เร็วกว่าบน WAL แต่ถ้าไฟดับ
+# อาจเสียรายการที่ commit ล่าสุด (ฐานข้อมูลไม่เสียหาย) ตั้งค่าผ่าน POS_DB_SYNCHRONOUS ได้
+DB_SYNCHRONOUS = os.environ.get('POS_DB_SYNCHRONOUS', 'FULL').upper()
+DB_CACHE_SIZE_KB = 20000              # page cache ต่อ connection (~20 MB)
+DB_MMAP_SIZE = 64 * 1024 * 1024       # อ่านไฟล์ผ่าน memory map สูงสุด 64 MB
+DB_BUSY_TIMEOUT_MS = 5000             # รอ lock จาก connection อื่นได้นานสุด 5 วินาที
+
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+
+def connect(path=DB_PATH, synchronous=None, journal_mode='WAL', readonly=False):
+    """เปิด connection ใหม่พร้อมตั้งค่า PRAGMA สำหรับงาน POS
+
+    readonly=True เปิดไฟล์แบบอ่านอย่างเดียว (mode=ro) ใช้กับงานรายงาน/ค้นหา
+    """
+    synchronous = (synchronous or DB_SYNCHRONOUS).upper()
+    if synchronous not in SYNCHRONOUS_LEVELS:
+        raise ValueError(f'Invalid synchronous level: {synchronous}')
+    if journal_mode.upper() not in JOURNAL_MODES:
+        raise ValueError(f'Invalid journal mode: {journal_mode}')
+
+    # check_same_thread=False เพราะ ConnectionManager เป็นผู้คุมว่า thread ไหนใช้ได้
+    if readonly:
+        uri = f'file:{pathname2url(os.path.abspath(path))}?mode=ro'
+        connection = sqlite3.connect(uri, uri=True, timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                                     check_same_thread=False)
+    else:
+        connection = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                                     check_same_thread=False)
+        # ไฟล์ใหม่คืนพื้นที่ทีละส่วนได้ด้วย incremental_vacuum (ต้องตั้งก่อนเขียนไฟล์ ไฟล์เดิมไม่มีผล)
+        connection.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        connection.execute(f'PRAGMA journal_mode={journal_mode}')
+        connection.execute(f'PRAGMA synchronous={synchronous}')
+    connection.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+    connection.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+    connection.execute('PRAGMA temp_store=MEMORY')
+    connection.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}')
+    return connection
+
+class ConnectionManager:
+    """แจก connection ให้แต่ละ thread
+
+    reader() คืน connection อ่านอย่างเดียวของ thread ที่เรียก (1 ตัวต่อ thread)
+    writer() ให้ยืม connection เขียนตัวเดียวของโปรแกรมทีละ thread ผ่าน lock
+    ด้วย WAL รายงานที่รันใน thread อื่นจึงอ่านได้พร้อมกับที่หน้าขายกำลังบันทึก
+
+    ไฟล์จะถูกเปิดเมื่อเรียก reader()/writer() ครั้งแรก แล้วเรียก setup(connection) หนึ่งครั้ง
+    (ใช้สร้างตารางและรัน migration)
+    """
+
+    def __init__(self, path=DB_PATH, synchronous=None, journal_mode='WAL', setup=None):
+        self.path = path
+        self.synchronous = synchronous
+        self.journal_mode = journal_mode
+        self._setup = setup
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        self._writer = None
+        self._on_commit = []
+
+    def _open(self):
+        """เปิด connection เขียนถ้ายังไม่ได้เปิด (reader ต้องรอให้ setup สร้างตารางก่อน)"""
+        if self._writer is not None:
+            return self._writer
+        with self._write_lock:
+            if self._writer is None:
+                connection = connect(self.path, self.synchronous, self.journal_mode)
+                if self._setup is not None:
+                    try:
+                        self._setup(connection)
+                        connection.commit()
+                    except BaseException:
+                        connection.close()
+                        raise
+                self._writer = connection
+        return self._writer
+
+    @property
+    def is_open(self):
+        return self._writer is not None
+
+    @property
+    def in_memory(self):
+        return self.path == ':memory:'
+
+    def reader(self):
+        """connection อ่านอย่างเดียวของ thread ปัจจุบัน"""
+        if self.in_memory:
+            # ฐานข้อมูลในหน่วยความจำเปิดซ้ำจาก connection อื่นไม่ได้
+            return self._open()
+        connection = getattr(self._local, 'reader', None)
+        if connection is None:
+            self._open()
+            connection = connect(self.path, self.synchronous, readonly=True)
+            self._local.reader = connection
+            with self._readers_lock:
+                self._readers.append(connection)
+        return connection
+
+    def release_reader(self):
+        """ปิด reader ของ thread ปัจจุบัน (เรียกก่อน background thread จบงาน)"""
+        connection = getattr(self._local, 'reader', None)
+        if connection is None:
+            return
+        self._local.reader = None
+        with self._readers_lock:
+            self._readers.remove(connection)
+        connection.close()
+
+    @contextmanager
+    def writer(self, timeout=None):
+        """ยืม connection เขียน: commit เมื่อจบ with และ rollback เมื่อเกิด exception
+
+        เรียกซ้อนกันใน thread เดียวได้ โดยจะ commit ครั้งเดียวที่ชั้นนอกสุด
+        timeout (วินาที) ถ้ารอ thread อื่นนานกว่านี้จะเกิด TimeoutError (None = รอจนได้)
+        """
+        if not self._write_lock.acquire(timeout=-1 if timeout is None else timeout):
+            raise TimeoutError('database writer is busy')
+        try:
+            connection = self._open()
+            self._write_depth += 1
+            try:
+                yield connection
+                if self._write_depth == 1:
+                    connection.commit()
+                    self._run_on_commit(connection)
+            except BaseException:
+                if self._write_depth == 1:
+                    self._on_commit.clear()
+                    connection.rollback()
+                raise
+            finally:
+                self._write_depth -= 1
+        finally:
+            self._write_lock.release()
+
+    def on_commit(self, callback):
+        """ให้เรียก callback(connection) หลัง writer ชั้นนอกสุด commit สำเร็จ (ยังถือ lock อยู่)
+
+        ใช้ภายใน writer() เท่านั้น ถ้า rollback callback จะถูกทิ้ง
+        """
+        self._on_commit.append(callback)
+
+    def _run_on_commit(self, connection):
+        callbacks, self._on_commit = self._on_commit, []
+        for callback in callbacks:
+            try:
+                callback(connection)
+            except Exception as e:
+                print(f'❌ on_commit callback error: {e}')
+
+    def close(self):
+        """ปิด connection ทั้งหมด (ตอนปิดโปรแกรม)"""
+        with self._readers_lock:
+            for connection in self._readers:
+                connection.close()
+            self._readers.clear()
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+# ==================== TABLES ====================
+
+def create_tables(connection):
+    """สร้างตารางหลักถ้ายังไม่มี"""
+    cur = connection.cursor()
+
+    # ตาราง product
+    cur.execute("""CREATE TABLE IF NOT EXISTS product (
+                ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                barcode TEXT,
+                title TEXT,
+                price REAL,
+                cost REAL,
+                quantity INTEGER,
+                unit TEXT,
+                category TEXT,
+                reorder_point INTEGER,
+                supplier TEXT )""")
+
+    # ตาราง sales (แทน transaction เพราะเป็น reserved keyword)
+    cur.execute("""CREATE TABLE IF NOT EXISTS sales (
+                ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                transaction_id TEXT,
+                datetime TEXT,
+                subtotal REAL,
+                vat REAL,
+                grand_total REAL,
+                received_amount REAL,
+                change_amount REAL,
+                items TEXT )""")
+
+    # ==================== ตาราง CUSTOMERS ====================
+    cur.execute('''CREATE TABLE IF NOT EXISTS customers (
+        customer_id TEXT PRIMARY KEY,
+        customer_name TEXT NOT NULL,
+        phone TEXT,
+        email TEXT,
+        address TEXT,
+        credit_limit REAL DEFAULT 0,
+        credit_days INTEGER DEFAULT 0,
+        total_debt REAL DEFAULT 0,
+        created_date TEXT,
+        notes TEXT
+    )''')
+
+    # ==================== ตาราง CREDIT_BILLS ====================
+    cur.execute('''CREATE TABLE IF NOT EXISTS credit_bills (
+        bill_id TEXT PRIMARY KEY,
+        customer_id TEXT NOT NULL,
+        transaction_id TEXT,
+        bill_date TEXT,
+        due_date TEXT,
+        total_amount REAL,
+        paid_amount REAL DEFAULT 0,
+        remaining_amount REAL,
+        status TEXT DEFAULT 'PENDING',
+        payment_date TEXT,
+        notes TEXT,
+        FOREIGN KEY (customer_id) REFERENCES customers(customer_id),
+        FOREIGN KEY (transaction_id) REFERENCES sales(transaction_id)
+    )''')
+
+    connection.commit()
+
+# ==================== SCHEMA MIGRATIONS ====================
+# แต่ละ migration รันครั้งเดียวต่อฐานข้อมูล และบันทึกเวอร์ชันไว้ในตาราง schema_version
+
+# เงื่อนไขบิลค้างชำระ ต้องเขียนให้ตรงกับ WHERE ของ idx_credit_bills_open_due ทุกตัวอักษร
+# (SQLite ใช้ partial index ได้เมื่อ WHERE ของ query ครอบคลุมเงื่อนไขของ index)
+OPEN_BILL_STATUS = "status IN ('PENDING', 'PARTIAL')"
+
+def _migration_001_indexes(cur):
+    """สร้าง index สำหรับคอลัมน์ที่ค้นหาบ่อย"""
+    # รวม barcode ซ้ำก่อนสร้าง UNIQUE index: เก็บแถวล่าสุด (ID มากสุด) และรวมจำนวนคงเหลือทุกแถวไว้ในแถวนั้น
+    # แถวที่ถูกรวมจะพิมพ์ออก log ทั้งหมด (ราคา/ทุนของแถวเก่าดูย้อนหลังได้)
+    cur.execute("""SELECT barcode, MAX(ID), SUM(quantity) FROM product
+                WHERE barcode IS NOT NULL GROUP BY barcode HAVING COUNT(*) > 1""")
+    duplicates = cur.fetchall()
+    for barcode, keep_id, total_quantity in duplicates:
+        cur.execute('SELECT ID, title, price, cost, quantity FROM product WHERE barcode=? AND ID<>?',
+                    (barcode, keep_id))
+        for row_id, title, price, cost, quantity in cur.fetchall():
+            print(f'⚠️ Merged duplicate product ID {row_id} into ID {keep_id}: barcode={barcode} '
+                  f'title={title} price={price} cost={cost} quantity={quantity}')
+        cur.execute('UPDATE product SET quantity=? WHERE ID=?', (total_quantity, keep_id))
+        cur.execute('DELETE FROM product WHERE barcode=? AND ID<>?', (barcode, keep_id))
+    if duplicates:
+        print(f'Merged duplicate rows of {len(duplicates)} barcodes in product (quantities summed)')
+
+    cur.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_product_barcode ON product(barcode)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_sales_datetime ON sales(datetime)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_sales_transaction_id ON sales(transaction_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_credit_bills_status_due ON credit_bills(status, due_date)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_credit_bills_customer ON credit_bills(customer_id)')
+
+def _sale_item_params(transaction_id, items):
+    """แปลงรายการในตะกร้า [barcode, title, price, quantity] เป็นพารามิเตอร์ของ sale_items"""
+    params = []
+    for barcode, title, price, quantity in items:
+        params.append((transaction_id, str(barcode), title, float(price), str(barcode), int(quantity)))
+    return params
+
+def _migration_002_sale_items(cur):
+    """สร้างตาราง sale_items และย้ายรายการสินค้าจาก JSON ใน sales.items"""
+    cur.execute("""CREATE TABLE IF NOT EXISTS sale_items (
+                ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                transaction_id TEXT NOT NULL,
+                barcode TEXT,
+                title TEXT,
+                unit_price REAL,
+                unit_cost REAL,
+                quantity INTEGER )""")
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_sale_items_transaction ON sale_items(transaction_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_sale_items_barcode ON sale_items(barcode)')
+
+    # อ่าน sales ทีละชุดเพื่อไม่ให้โหลด JSON ทั้งหมดเข้าหน่วยความจำ
+    # unit_cost ของบิลเก่าเป็นค่าประมาณ: ใช้ทุน *ปัจจุบัน* ของสินค้า เพราะ sales.items ไม่ได้เก็บทุนไว้
+    # (รายงานกำไรเดิมก็คำนวณจากทุนปัจจุบันตอนเปิดรายงาน ตัวเลขย้อนหลังจึงเท่าเดิม ณ วันที่ migrate)
+    # บิลที่ขายหลัง migration นี้เก็บทุน ณ เวลาที่ขายจริง
+    reader = cur.connection.cursor()
+    reader.execute('SELECT transaction_id, items FROM sales ORDER BY ID')
+    command = """INSERT INTO sale_items (transaction_id, barcode, title, unit_price, unit_cost, quantity)
+                VALUES (?, ?, ?, ?, COALESCE((SELECT cost FROM product WHERE barcode=?), 0), ?)"""
+    migrated = 0
+    while True:
+        rows = reader.fetchmany(500)
+        if not rows:
+            break
+        batch = []
+        for transaction_id, items_json in rows:
+            try:
+                items = json.loads(items_json) if items_json else []
+                params = _sale_item_params(transaction_id, items)
+            except json.JSONDecodeError:
+                print(f'Skipped sale {transaction_id}: invalid items JSON')
+                continue
+            except (TypeError, ValueError, IndexError) as e:
+                # JSON อ่านได้แต่รูปแบบไม่ใช่ [[barcode, title, price, quantity], ...]
+                print(f'Skipped sale {transaction_id}: unexpected items format ({e})')
+                continue
+            batch.extend(params)
+        cur.executemany(command, batch)
+        migrated += len(batch)
+    if migrated:
+        print(f'Backfilled {migrated} sale items')
+
+def _migration_003_sequences(cur):
+    """สร้างตาราง sequences สำหรับออกเลขที่เอกสาร โดยต่อจากเลขล่าสุดที่มีอยู่"""
+    cur.execute("""CREATE TABLE IF NOT EXISTS sequences (
+                prefix TEXT NOT NULL,
+                period TEXT NOT NULL DEFAULT '',
+                value INTEGER NOT NULL,
+                PRIMARY KEY (prefix, period) ) WITHOUT ROWID""")
+
+    # เลขล่าสุดของรูปแบบเดิม T000001 / INV000001
+    cur.execute("""SELECT MAX(CAST(SUBSTR(transaction_id, 2) AS INTEGER)) FROM sales
+                WHERE transaction_id GLOB 'T[0-9][0-9][0-9][0-9][0-9][0-9]'""")
+    last_transaction = cur.fetchone()[0] or 0
+    cur.execute("""SELECT MAX(CAST(SUBSTR(doc_id, 4) AS INTEGER)) FROM (
+                    SELECT transaction_id AS doc_id FROM sales
+                    UNION ALL SELECT bill_id FROM credit_bills)
+                WHERE doc_id GLOB 'INV[0-9][0-9][0-9][0-9][0-9][0-9]'""")
+    last_invoice = cur.fetchone()[0] or 0
+    cur.executemany("INSERT OR IGNORE INTO sequences (prefix, period, value) VALUES (?, '', ?)",
+                    [('T', last_transaction), ('INV', last_invoice)])
+
+# ตัวนับในตาราง stats และ query ที่ใช้คำนวณใหม่ทั้งหมด (ใช้ตอนสร้างและตอน reconcile)
+STATS_QUERIES = {
+    'total_products': 'SELECT COUNT(*) FROM product',
+    'total_sales': 'SELECT COUNT(*) FROM sales',
+    'total_customers': 'SELECT COUNT(*) FROM customers',
+    'total_debt': 'SELECT COALESCE(SUM(total_debt), 0) FROM customers',
+    'total_credit_bills': 'SELECT COUNT(*) FROM credit_bills',
+    'pending_bills': "SELECT COUNT(*) FROM credit_bills WHERE status IN ('PENDING', 'PARTIAL')",
+    'pending_amount': """SELECT COALESCE(SUM(remaining_amount), 0) FROM credit_bills
+                        WHERE status IN ('PENDING', 'PARTIAL')""",
+}
+
+_PENDING_NEW = "(NEW.status IN ('PENDING', 'PARTIAL'))"
+_PENDING_OLD = "(OLD.status IN ('PENDING', 'PARTIAL'))"
+
+STATS_TRIGGERS = {
+    'trg_stats_product_insert': ('AFTER INSERT ON product', [('total_products', '1')]),
+    'trg_stats_product_delete': ('AFTER DELETE ON product', [('total_products', '-1')]),
+    'trg_stats_sales_insert': ('AFTER INSERT ON sales', [('total_sales', '1')]),
+    'trg_stats_sales_delete': ('AFTER DELETE ON sales', [('total_sales', '-1')]),
+    'trg_stats_customers_insert': ('AFTER INSERT ON customers', [
+        ('total_customers', '1'), ('total_debt', 'COALESCE(NEW.total_debt, 0)')]),
+    'trg_stats_customers_delete': ('AFTER DELETE ON customers', [
+        ('total_customers', '-1'), ('total_debt', '-COALESCE(OLD.total_debt, 0)')]),
+    'trg_stats_customers_debt': ('AFTER UPDATE OF total_debt ON customers', [
+        ('total_debt', 'COALESCE(NEW.total_debt, 0) - COALESCE(OLD.total_debt, 0)')]),
+    'trg_stats_credit_bills_insert': ('AFTER INSERT ON credit_bills', [
+        ('total_credit_bills', '1'),
+        ('pending_bills', _PENDING_NEW),
+        ('pending_amount', f'CASE WHEN {_PENDING_NEW} THEN COALESCE(NEW.remaining_amount, 0) ELSE 0 END')]),
+    'trg_stats_credit_bills_delete': ('AFTER DELETE ON credit_bills', [
+        ('total_credit_bills', '-1'),
+        ('pending_bills', f'-{_PENDING_OLD}'),
+        ('pending_amount', f'-CASE WHEN {_PENDING_OLD} THEN COALESCE(OLD.remaining_amount, 0) ELSE 0 END')]),
+    'trg_stats_credit_bills_update': ('AFTER UPDATE OF status, remaining_amount ON credit_bills', [
+        ('pending_bills', f'{_PENDING_NEW} - {_PENDING_OLD}'),
+        ('pending_amount', f'CASE WHEN {_PENDING_NEW} THEN COALESCE(NEW.remaining_amount, 0) ELSE 0 END'
+                           f' - CASE WHEN {_PENDING_OLD} THEN COALESCE(OLD.remaining_amount, 0) ELSE 0 END')]),
+}
+
+def _migration_004_stats(cur):
+    """สร้างตาราง stats พร้อม trigger ที่อัปเดตตัวนับทุกครั้งที่ข้อมูลเปลี่ยน"""
+    cur.execute("""CREATE TABLE IF NOT EXISTS stats (
+                name TEXT PRIMARY KEY,
+                value REAL NOT NULL DEFAULT 0 ) WITHOUT ROWID""")
+    for name, command in STATS_QUERIES.items():
+        value = cur.execute(command).fetchone()[0]
+        cur.execute('INSERT OR REPLACE INTO stats (name, value) VALUES (?, ?)', (name, value))
+
+    for trigger, (event, updates) in STATS_TRIGGERS.items():
+        body = ' '.join(f"UPDATE stats SET value = value + ({delta}) WHERE name = '{name}';"
+                        for name, delta in updates)
+        cur.execute(f'CREATE TRIGGER IF NOT EXISTS {trigger} {event} BEGIN {body} END')
+
+def _migration_005_stock_ledger(cur):
+    """สร้างสมุดบัญชีสต็อก stock_movements และ stock_snapshots รายวัน
+
+    ยอดคงเหลือปัจจุบันถูกบันทึกเป็นรายการ OPENING เพื่อให้ผลรวมของ movement เท่ากับ product.quantity
+    """
+    cur.execute("""CREATE TABLE IF NOT EXISTS stock_movements (
+                ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                barcode TEXT NOT NULL,
+                moved_at TEXT NOT NULL,
+                kind TEXT NOT NULL CHECK (kind IN ('SALE', 'RECEIPT', 'ADJUSTMENT', 'RETURN')),
+                quantity_change INTEGER NOT NULL,
+                reference TEXT )""")
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_stock_movements_barcode ON stock_movements(barcode, moved_at)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_stock_movements_moved_at ON stock_movements(moved_at)')
+    cur.execute("""CREATE TABLE IF NOT EXISTS stock_snapshots (
+                day TEXT NOT NULL,
+                barcode TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                PRIMARY KEY (barcode, day) ) WITHOUT ROWID""")
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_stock_snapshots_day ON stock_snapshots(day)')
+
+    opened_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    cur.execute("""INSERT INTO stock_movements (barcode, moved_at, kind, quantity_change, reference)
+                SELECT barcode, ?, 'ADJUSTMENT', COALESCE(quantity, 0), 'OPENING'
+                FROM product WHERE barcode IS NOT NULL""", (opened_at,))
+
+# trigger ที่ทำให้ product_fts ตรงกับตาราง product เสมอ (external content ต้องลบด้วยค่าเดิม)
+_PRODUCT_FTS_DELETE = ("INSERT INTO product_fts(product_fts, rowid, barcode, title) "
+                       "VALUES ('delete', OLD.ID, OLD.barcode, OLD.title);")
+_PRODUCT_FTS_INSERT = "INSERT INTO product_fts(rowid, barcode, title) VALUES (NEW.ID, NEW.barcode, NEW.title);"
+
+PRODUCT_FTS_TRIGGERS = [
+    ('trg_product_fts_insert', 'AFTER INSERT', _PRODUCT_FTS_INSERT),
+    ('trg_product_fts_delete', 'AFTER DELETE', _PRODUCT_FTS_DELETE),
+    ('trg_product_fts_update', 'AFTER UPDATE OF barcode, title',
+     _PRODUCT_FTS_DELETE + ' ' + _PRODUCT_FTS_INSERT),
+]
+
+def _migration_006_product_fts(cur):
+    """สร้างดัชนีค้นหาสินค้า product_fts (FTS5 แบบ trigram ค้นคำไทยที่ไม่มีช่องว่างได้)
+
+    ถ้า SQLite ของเครื่องไม่มี FTS5/trigram จะข้ามไป search_products() จะใช้ LIKE แทน
+    """
+    try:
+        cur.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(
+                    barcode, title, content='product', content_rowid='ID', tokenize='trigram')""")
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ ไม่สามารถสร้าง product_fts ได้ ({e}) จะค้นหาด้วย LIKE แทน")
+        return
+    for trigger, event, body in PRODUCT_FTS_TRIGGERS:
+        cur.execute(f'CREATE TRIGGER IF NOT EXISTS {trigger} {event} ON product BEGIN {body} END')
+    cur.execute("INSERT INTO product_fts(product_fts) VALUES ('rebuild')")
+
+def _migration_007_open_bills_index(cur):
+    """index บางส่วน (partial index) ของบิลที่ยังค้างชำระ เรียงตาม due_date
+
+    WHERE ของ index ตรงกับ query บิลค้าง/เกินกำหนด SQLite จึงใช้ index นี้เสมอไม่ขึ้นกับสถิติของตาราง
+    และไม่ต้องเรียงผลใหม่ (บิลที่ชำระแล้วซึ่งเป็นส่วนใหญ่ไม่อยู่ใน index)
+    """
+    cur.execute(f'CREATE INDEX IF NOT EXISTS idx_credit_bills_open_due ON credit_bills(due_date) '
+                f'WHERE {OPEN_BILL_STATUS}')
+
+def _migration_008_credit_bills_transaction_index(cur):
+    """index บิลเครดิตตามเลขที่ขาย (archive_old_sales ย้าย/ลบบิลตาม transaction_id ทุกชุด
+    ถ้าไม่มี index แต่ละชุดต้องอ่านบิลทั้งตารางสองรอบระหว่างถือ write lock)"""
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_credit_bills_transaction ON credit_bills(transaction_id)')
+
+MIGRATIONS = [
+    (1, 'indexes for barcode, sales and credit bill lookups', _migration_001_indexes),
+    (2, 'normalized sale_items table', _migration_002_sale_items),
+    (3, 'document number sequences', _migration_003_sequences),
+    (4, 'trigger-maintained stats counters', _migration_004_stats),
+    (5, 'stock movement ledger and daily snapshots', _migration_005_stock_ledger),
+    (6, 'FTS5 trigram product search index', _migration_006_product_fts),
+    (7, 'partial index for open credit bills by due date', _migration_007_open_bills_index),
+    (8, 'credit bills by transaction_id index', _migration_008_credit_bills_transaction_index),
+]
+
+def get_schema_version(connection):
+    """ดึงเวอร์ชันของ schema ปัจจุบัน"""
+    connection.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TEXT
+    )''')
+    return connection.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+def run_migrations(connection):
+    """รัน migration ที่ยังไม่ได้ทำ แต่ละเวอร์ชันอยู่ใน transaction ของตัวเอง"""
+    current = get_schema_version(connection)
+    connection.commit()
+
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        cur = connection.cursor()
+        try:
+            cur.execute('BEGIN')
+            migrate(cur)
+            cur.execute('INSERT INTO schema_version VALUES (?, ?, ?)',
+                        (version, description, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        current = version
+        print(f'✅ Migration {version}: {description}')
+
+    return current
+
+def _prepare_database(connection):
+    """สร้างตารางและรัน migration (เรียกตอนเปิดฐานข้อมูลครั้งแรก)"""
+    create_tables(connection)
+    print("✅ Database tables created/verified")
+    run_migrations(connection)
+
+def init_db(path=None, create=True, synchronous=None, journal_mode='WAL'):
+    """เลือกไฟล์ฐานข้อมูลที่ฟังก์ชันทั้งหมดในโมดูลนี้ใช้ แล้วคืน ConnectionManager ตัวใหม่
+
+    path=None ใช้ DB_PATH (POS_DB_PATH) ส่วน ':memory:' ได้ฐานข้อมูลชั่วคราวในหน่วยความจำ
+    create=True สร้างไฟล์/ตาราง/migration ที่ยังไม่มี, create=False เปิดไฟล์เดิมตามที่เป็นอยู่
+    (ไม่พบไฟล์จะเกิด FileNotFoundError) connection จะเปิดจริงเมื่อมีการใช้งานครั้งแรก
+    """
+    global db
+    path = path or DB_PATH
+    if not create and path != ':memory:' and not os.path.exists(path):
+        raise FileNotFoundError(f'ไม่พบไฟล์ฐานข้อมูล {path}')
+    if db is not None:
+        db.close()
+    db = ConnectionManager(path, synchronous, journal_mode,
+                           setup=_prepare_database if create else None)
+    return db
+
+def init_db_from_args(argv):
+    """ถ้ามี --db PATH ใน argv ให้เปิดไฟล์นั้นแทน (ตัด --db ออกจาก argv ให้โปรแกรมอ่านตัวเลือกอื่นต่อ)"""
+    if '--db' not in argv:
+        return db
+    index = argv.index('--db')
+    if index + 1 >= len(argv):
+        raise SystemExit('❌ ต้องระบุไฟล์ฐานข้อมูลหลัง --db')
+    path = argv[index + 1]
+    del argv[index:index + 2]
+    return init_db(path)
+
+# import โมดูลนี้ไม่เปิดไฟล์ ฐานข้อมูลถูกเปิดตอนเรียกฟังก์ชันครั้งแรก
+db = None
+init_db()
+
+# ==================== QUERY STATISTICS ====================
+# นับจำนวนครั้งที่เรียก เวลา (histogram) และจำนวนแถวที่คืน แยกตามชื่อฟังก์ชันฐานข้อมูล
+# เปิดด้วย POS_QUERY_STATS=1 หรือ enable_query_stats() ถ้าปิดอยู่ตัวห่อแค่เช็ค flag แล้วเรียกต่อ
+# เมื่อเปิดไว้ สถิติจะถูกบันทึกลง query_stats.json ตอนปิดโปรแกรม ดูได้ด้วย python basicsql.py --stats
+# ใส่ @_timed ชั้นเดียว: ตัวห่อบางๆ (เช่น view_product -> iter_products) ไม่ต้องใส่ ไม่เช่นนั้นนับซ้ำ
+
+QUERY_STATS_ENABLED = os.environ.get('POS_QUERY_STATS', '0') == '1'
+QUERY_STATS_FILE = 'query_stats.json'
+LATENCY_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500)
+
+_query_stats = {}
+_query_stats_lock = threading.Lock()
+
+def _record_query(name, elapsed_ms, rows):
+    with _query_stats_lock:
+        entry = _query_stats.get(name)
+        if entry is None:
+            entry = _query_stats[name] = {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0,
+                                          'histogram': [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+        entry['calls'] += 1
+        entry['total_ms'] += elapsed_ms
+        entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+        entry['rows'] += rows
+        entry['histogram'][bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+def _timed_rows(name, rows, start):
+    """ห่อ generator ของ iter_* ให้จับเวลาจนกว่าจะอ่านครบ"""
+    count = 0
+    try:
+        for row in rows:
+            count += 1
+            yield row
+    finally:
+        _record_query(name, (time.perf_counter() - start) * 1000, count)
+
+def _row_count(result):
+    """จำนวนแถวจากค่าที่ฟังก์ชันคืน: list ของแถวนับตามความยาว แถวเดียว/ค่าอื่นนับเป็น 1"""
+    if isinstance(result, list) and (not result or isinstance(result[0], (tuple, list))):
+        return len(result)
+    return int(result is not None)
+
+def _timed(func):
+    """decorator เก็บสถิติของฟังก์ชันฐานข้อมูล (ไม่ทำอะไรเมื่อปิดการเก็บสถิติ)"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not QUERY_STATS_ENABLED:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        result = None
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            if isinstance(result, types.GeneratorType):
+                result = _timed_rows(name, result, start)
+            else:
+                _record_query(name, (time.perf_counter() - start) * 1000, _row_count(result))
+        return result
+    return wrapper
+
+def enable_query_stats(enabled=True):
+    """เปิด/ปิดการเก็บสถิติ query ระหว่างโปรแกรมทำงาน"""
+    global QUERY_STATS_ENABLED
+    QUERY_STATS_ENABLED = enabled
+
+def reset_query_stats():
+    with _query_stats_lock:
+        _query_stats.clear()
+
+def get_query_stats():
+    """คืนสำเนาสถิติ {ชื่อฟังก์ชัน: {calls, total_ms, max_ms, rows, histogram}}"""
+    with _query_stats_lock:
+        return {name: dict(entry, histogram=list(entry['histogram']))
+                for name, entry in _query_stats.items()}
+
+def format_query_stats(stats=None):
+    """จัดสถิติเป็นตาราง เรียงตามเวลารวมมากไปน้อย"""
+    stats = get_query_stats() if stats is None else stats
+    if not stats:
+        return 'No query statistics recorded'
+    buckets = [f'<{limit:g}' for limit in LATENCY_BUCKETS_MS] + [f'>={LATENCY_BUCKETS_MS[-1]:g}']
+    lines = [f"{'Query':<32}{'calls':>8}{'total ms':>11}{'avg ms':>9}{'max ms':>9}{'rows':>9}  "
+             + ' '.join(f'{b:>5}' for b in buckets)]
+    for name, entry in sorted(stats.items(), key=lambda item: item[1]['total_ms'], reverse=True):
+        lines.append(f"{name:<32}{entry['calls']:>8}{entry['total_ms']:>11.1f}"
+                     f"{entry['total_ms'] / entry['calls']:>9.2f}{entry['max_ms']:>9.2f}"
+                     f"{entry['rows']:>9}  " + ' '.join(f'{n:>5}' for n in entry['histogram']))
+    return '\n'.join(lines)
+
+def save_query_stats(path=QUERY_STATS_FILE):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(get_query_stats(), f, ensure_ascii=False, indent=2)
+
+def _save_query_stats_at_exit():
+    if QUERY_STATS_ENABLED and _query_stats:
+        save_query_stats()
+
+atexit.register(_save_query_stats_at_exit)
+
+# ==================== STREAMING ====================
+# ฟังก์ชัน iter_* คืน generator ที่อ่านผลลัพธ์ทีละชุด ใช้กับรายงาน/export ข้อมูลทั้งปี
+# โดยใช้หน่วยความจำคงที่ ส่วนฟังก์ชันเดิมที่คืน list ยังใช้ได้เหมือนเดิม
+
+FETCH_CHUNK = 1000
+
+def _iter_rows(command, params=()):
+    """รัน query บน reader ของ thread นี้ แล้ว yield ทีละแถวจาก fetchmany"""
+    cur = db.reader().cursor()
+    try:
+        cur.execute(command, params)
+        while True:
+            rows = cur.fetchmany(FETCH_CHUNK)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cur.close()
 
 # ==================== PRODUCT FUNCTIONS ====================
 
+@_timed
 def insert_product(barcode, title, price, cost, quantity, unit, category, reorder_point, supplier):
-    with conn:
+    with db.writer() as connection:
         command = 'INSERT INTO product VALUES (?,?,?,?,?,?,?,?,?,?)'
-        c.execute(command, (None, barcode, title, price, cost, quantity, unit, category, reorder_point, supplier))
-        conn.commit()
-        print('saved')
+        connection.execute(command, (None, barcode, title, price, cost, quantity, unit, category, reorder_point, supplier))
+        _log_stock_movements(connection, [(barcode, 'RECEIPT', quantity, 'NEW')])
+        _publish_on_commit(PRODUCT_CHANGED, barcodes=[str(barcode)])
+    print('saved')
 
+@_timed
 def update_product(barcode, title, price, cost, quantity, unit, category, reorder_point, supplier):
     """อัปเดตข้อมูลสินค้า"""
-    with conn:
+    with db.writer() as connection:
+        row = connection.execute('SELECT quantity FROM product WHERE barcode=?', (barcode,)).fetchone()
         command = 'UPDATE product SET title=?, price=?, cost=?, quantity=?, unit=?, category=?, reorder_point=?, supplier=? WHERE barcode=?'
-        c.execute(command, (title, price, cost, quantity, unit, category, reorder_point, supplier, barcode))
-        conn.commit()
-        print(f'Product {barcode} updated')
+        connection.execute(command, (title, price, cost, quantity, unit, category, reorder_point, supplier, barcode))
+        if row is not None:
+            _log_stock_movements(connection, [(barcode, 'ADJUSTMENT', int(quantity) - (row[0] or 0), 'EDIT')])
+        _publish_on_commit(PRODUCT_CHANGED, barcodes=[str(barcode)])
+    print(f'Product {barcode} updated')
 
+@_timed
 def update_stock(barcode, quantity_sold):
     """อัปเดตจำนวนสต็อกหลังขาย"""
-    with conn:
+    with db.writer() as connection:
         command = 'UPDATE product SET quantity = quantity - ? WHERE barcode = ? AND quantity >= ?'
-        c.execute(command, (quantity_sold, barcode, quantity_sold))
-        if c.rowcount == 0:
-            print(f'Warning: Insufficient stock for barcode {barcode}')
-        else:
-            conn.commit()
-            print(f'Stock updated for {barcode}: -{quantity_sold}')
+        cur = connection.execute(command, (quantity_sold, barcode, quantity_sold))
+        if cur.rowcount:
+            _log_stock_movements(connection, [(barcode, 'SALE', -quantity_sold, None)])
+    if cur.rowcount == 0:
+        print(f'Warning: Insufficient stock for barcode {barcode}')
+    else:
+        print(f'Stock updated for {barcode}: -{quantity_sold}')
 
+@_timed
+def adjust_stock(barcode, quantity_change, kind='ADJUSTMENT', reference=None):
+    """เพิ่ม/ลดสต็อกพร้อมบันทึกลง stock_movements (RECEIPT รับเข้า, RETURN รับคืน, ADJUSTMENT ปรับยอด)
+
+    คืนค่า False ถ้าไม่พบสินค้า
+    """
+    with db.writer() as connection:
+        cur = connection.execute('UPDATE product SET quantity = quantity + ? WHERE barcode=?',
+                                 (quantity_change, barcode))
+        if cur.rowcount == 0:
+            return False
+        _log_stock_movements(connection, [(barcode, kind, quantity_change, reference)])
+    print(f'Stock {kind.lower()} for {barcode}: {quantity_change:+}')
+    return True
+
+@_timed
 def get_product_by_barcode(barcode):
     """ดึงข้อมูลสินค้าตาม barcode"""
-    with conn:
-        command = 'SELECT * FROM product WHERE barcode=?'
-        c.execute(command, (barcode,))
-        data = c.fetchone()
-        return data
+    command = 'SELECT * FROM product WHERE barcode=?'
+    return db.reader().execute(command, (barcode,)).fetchone()
+
+@_timed
+def iter_products(allfield=True):
+    """อ่านสินค้าทีละแถว (แบบ streaming ของ view_product)"""
+    if allfield:
+        command = 'SELECT * FROM product'
+    else:
+        command = 'SELECT barcode,title,price,cost,quantity,unit,category,reorder_point FROM product'
+    return _iter_rows(command)
 
 def view_product(allfield=True):
-    with conn:
-        if allfield:
-            command = 'SELECT * FROM product'
-        else:
-            command = 'SELECT barcode,title,price,cost,quantity,unit,category,reorder_point FROM product'
-        c.execute(command)
-        data = c.fetchall()
-    return data
+    return list(iter_products(allfield))
+
+PRODUCT_IMPORT_BATCH = 500
+
+def _clean_product_row(row):
+    """ตรวจและแปลงแถวสินค้า (barcode, title, price, cost, quantity, unit, category,
+    reorder_point[, supplier]) ให้เป็นชนิดข้อมูลที่ถูกต้อง"""
+    if len(row) not in (8, 9):
+        raise ValueError(f'ต้องมี 8-9 คอลัมน์ แต่พบ {len(row)}')
+    barcode, title, price, cost, quantity, unit, category, reorder_point = row[:8]
+    supplier = row[8] if len(row) == 9 else ''
+
+    barcode, title, unit, category = (str(v or '').strip() for v in (barcode, title, unit, category))
+    if not all([barcode, title, unit, category]):
+        raise ValueError('ข้อมูลไม่ครบถ้วน')
+    try:
+        price, cost = float(str(price).strip()), float(str(cost).strip())
+        quantity, reorder_point = int(str(quantity).strip()), int(str(reorder_point).strip() or 1)
+    except ValueError as e:
+        raise ValueError(f'ข้อมูลตัวเลขไม่ถูกต้อง ({e})')
+    if min(price, cost, quantity, reorder_point) < 0:
+        raise ValueError('ตัวเลขต้องไม่ติดลบ')
+    return (barcode, title, price, cost, quantity, unit, category, reorder_point,
+            str(supplier or '').strip())
+
+@_timed
+def upsert_products(rows, batch_size=PRODUCT_IMPORT_BATCH):
+    """เพิ่มหรืออัปเดตสินค้าหลายรายการใน transaction เดียว (ใช้กับการนำเข้า CSV)
+
+    rows: iterable ของ (barcode, title, price, cost, quantity, unit, category,
+          reorder_point[, supplier]) ถ้า barcode มีอยู่แล้วจะอัปเดตข้อมูลแทนการเพิ่มซ้ำ
+    คืนค่า (จำนวนที่บันทึกสำเร็จ, [(ลำดับแถวเริ่มจาก 0, ข้อความผิดพลาด), ...])
+    """
+    command = """INSERT INTO product (barcode, title, price, cost, quantity, unit, category, reorder_point, supplier)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(barcode) DO UPDATE SET
+                    title=excluded.title, price=excluded.price, cost=excluded.cost,
+                    quantity=excluded.quantity, unit=excluded.unit, category=excluded.category,
+                    reorder_point=excluded.reorder_point, supplier=excluded.supplier"""
+    saved = 0
+    errors = []
+
+    def flush(cur, batch):
+        # จำนวนคงเหลือเดิม เพื่อบันทึกส่วนต่างลง stock_movements
+        barcodes = list({params[0] for _, params in batch})
+        old = dict(cur.execute(f"SELECT barcode, quantity FROM product WHERE barcode IN ({','.join('?' * len(barcodes))})",
+                               barcodes).fetchall())
+
+        # ลอง executemany ทั้งชุดก่อน ถ้าพังค่อยบันทึกทีละแถวเพื่อหาแถวที่ผิด
+        cur.execute('SAVEPOINT import_batch')
+        try:
+            cur.executemany(command, [params for _, params in batch])
+            cur.execute('RELEASE import_batch')
+            written = [params for _, params in batch]
+        except sqlite3.Error:
+            cur.execute('ROLLBACK TO import_batch')
+            cur.execute('RELEASE import_batch')
+            written = []
+            for index, params in batch:
+                try:
+                    cur.execute(command, params)
+                    written.append(params)
+                except sqlite3.Error as e:
+                    errors.append((index, str(e)))
 
+        movements = []
+        for params in written:
+            barcode, quantity = params[0], params[4]
+            kind = 'ADJUSTMENT' if barcode in old else 'RECEIPT'
+            movements.append((barcode, kind, quantity - (old.get(barcode) or 0), 'IMPORT'))
+            old[barcode] = quantity
+        _log_stock_movements(cur, movements)
+        _publish_on_commit(PRODUCT_CHANGED, barcodes=[str(params[0]) for params in written])
+        return len(written)
+
+    with db.writer() as connection:
+        cur = connection.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        batch = []
+        for index, row in enumerate(rows):
+            try:
+                batch.append((index, _clean_product_row(row)))
+            except (ValueError, TypeError) as e:
+                errors.append((index, str(e)))
+                continue
+            if len(batch) >= batch_size:
+                saved += flush(cur, batch)
+                batch = []
+        if batch:
+            saved += flush(cur, batch)
+
+    print(f'Imported {saved} products ({len(errors)} errors)')
+    return saved, errors
+
+@_timed
 def delete_product(barcode):
-    with conn:
+    with db.writer() as connection:
+        row = connection.execute('SELECT quantity FROM product WHERE barcode=?', (barcode,)).fetchone()
         command = 'DELETE FROM product WHERE barcode=(?)'
-        c.execute(command,([barcode]))
-        conn.commit()
+        connection.execute(command,([barcode]))
+        if row is not None:
+            _log_stock_movements(connection, [(barcode, 'ADJUSTMENT', -(row[0] or 0), 'DELETE')])
+        _publish_on_commit(PRODUCT_CHANGED, barcodes=[str(barcode)])
+
+PRODUCT_SEARCH_MIN_FTS = 3    # trigram ต้องมีอย่างน้อย 3 ตัวอักษร สั้นกว่านี้ใช้ LIKE
+
+def _has_product_fts():
+    command = "SELECT 1 FROM sqlite_master WHERE type='table' AND name='product_fts'"
+    return db.reader().execute(command).fetchone() is not None
 
+@_timed
+def search_products(query, limit=100, offset=0, allfield=False):
+    """ค้นหาสินค้าจากบางส่วนของชื่อหรือบาร์โค้ด (ไม่สนตัวพิมพ์เล็ก/ใหญ่)
+
+    คืนแถวคอลัมน์เดียวกับ view_product(allfield) เรียงตามลำดับที่เพิ่ม ครั้งละไม่เกิน limit แถว
+    query ว่างคืนสินค้าทั้งหมด (แบ่งหน้าด้วย limit/offset) limit=None คืนทุกแถวที่ตรง
+    """
+    if allfield:
+        fields = 'p.*'
+    else:
+        fields = 'p.barcode,p.title,p.price,p.cost,p.quantity,p.unit,p.category,p.reorder_point'
+    query = (query or '').strip()
+    limit = -1 if limit is None else limit
+
+    if not query:
+        command = f'SELECT {fields} FROM product p ORDER BY p.ID LIMIT ? OFFSET ?'
+        params = (limit, offset)
+    elif len(query) >= PRODUCT_SEARCH_MIN_FTS and _has_product_fts():
+        # ใส่ในเครื่องหมายคำพูดให้เป็น phrase เดียว อักขระพิเศษของ FTS5 จะไม่ถูกตีความ
+        phrase = '"' + query.replace('"', '""') + '"'
+        command = f"""SELECT {fields} FROM product_fts f JOIN product p ON p.ID = f.rowid
+                    WHERE product_fts MATCH ? ORDER BY f.rowid LIMIT ? OFFSET ?"""
+        params = (phrase, limit, offset)
+    else:
+        pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        command = f"""SELECT {fields} FROM product p
+                    WHERE p.title LIKE ? ESCAPE '\\' OR p.barcode LIKE ? ESCAPE '\\'
+                    ORDER BY p.ID LIMIT ? OFFSET ?"""
+        params = (pattern, pattern, limit, offset)
+    return db.reader().execute(command, params).fetchall()
+
+@_timed
 def search_barcode(barcode):
-    with conn:
-        command = 'SELECT barcode,title,price,cost,quantity,unit,category,reorder_point FROM product WHERE barcode=(?)'
-        c.execute(command,([barcode]))
-        result = c.fetchone()
-        if result:
-            data = list(result)
-            return data
+    record = catalog.get(barcode)
+    if record is not None:
+        return list(record)
+    if catalog.ready:
         return None
+    command = 'SELECT barcode,title,price,cost,quantity,unit,category,reorder_point FROM product WHERE barcode=(?)'
+    result = db.reader().execute(command,([barcode])).fetchone()
+    if result:
+        data = list(result)
+        return data
+    return None
+
+# ==================== PRODUCT CATALOG ====================
+# สำเนาตาราง product ในหน่วยความจำ {barcode: (barcode, title, price, cost, quantity, unit,
+# category, reorder_point)} ให้การสแกนหาสินค้าไม่ต้องถามฐานข้อมูล
+# โหลดครั้งแรกใน background thread และอัปเดตเฉพาะ barcode ที่เปลี่ยนหลัง commit
+
+CATALOG_COLUMNS = 'barcode,title,price,cost,quantity,unit,category,reorder_point'
+CATALOG_REFRESH_CHUNK = 500
+
+class ProductCatalog:
+    """cache สินค้าตาม barcode ระหว่างโหลดยังไม่ ready ผู้เรียกต้องถามฐานข้อมูลเอง"""
+
+    def __init__(self):
+        self._records = {}
+        self._lock = threading.Lock()
+        self._source = None           # ConnectionManager ที่โหลดมา (init_db เปลี่ยนแล้วถือว่าหมดอายุ)
+        self._loading = False
+        self._pending = []            # การเปลี่ยนแปลงที่เกิดระหว่างโหลด
+
+    @property
+    def ready(self):
+        return self._source is db
+
+    def __len__(self):
+        return len(self._records) if self.ready else 0
+
+    def get(self, barcode):
+        """record ของสินค้า หรือ None ถ้าไม่พบ/ยังโหลดไม่เสร็จ"""
+        if self._source is not db:
+            return None
+        return self._records.get(barcode)
+
+    def products(self):
+        """record ของสินค้าทั้งหมดตามลำดับที่เพิ่ม (ยังไม่ ready คืน list ว่าง)"""
+        with self._lock:
+            if self._source is not db:
+                return []
+            return list(self._records.values())
+
+    def load(self):
+        """อ่านสินค้าทั้งหมดจากฐานข้อมูล (ใช้เวลาตามจำนวนสินค้า ควรเรียกผ่าน load_async)"""
+        source = db
+        with self._lock:
+            self._loading = True
+            self._pending = []
+        try:
+            start = time.perf_counter()
+            records = {row[0]: row for row in
+                       _iter_rows(f'SELECT {CATALOG_COLUMNS} FROM product WHERE barcode IS NOT NULL')}
+        except BaseException:
+            with self._lock:
+                self._loading = False
+            raise
+        with self._lock:
+            # ใส่การเปลี่ยนแปลงที่ commit ระหว่างโหลด ซึ่งใหม่กว่าข้อมูลที่อ่านได้
+            for barcode, record in self._pending:
+                if record is None:
+                    records.pop(barcode, None)
+                else:
+                    records[barcode] = record
+            self._records = records
+            self._source = source
+            self._loading = False
+            self._pending = []
+        print(f'✅ Product catalog loaded: {len(records)} products ({(time.perf_counter() - start) * 1000:.0f} ms)')
+
+    def load_async(self, done=None):
+        """โหลดใน background thread แล้วเรียก done() เมื่อเสร็จ"""
+        def run():
+            try:
+                self.load()
+            except Exception as e:
+                print(f'❌ Product catalog load failed: {e}')
+            finally:
+                if not db.in_memory:
+                    db.release_reader()
+            if done is not None:
+                done()
+
+        if db.in_memory:
+            run()
+            return None
+        thread = threading.Thread(target=run, name='catalog-load', daemon=True)
+        thread.start()
+        return thread
+
+    def refresh(self, connection, barcodes):
+        """อ่าน barcode ที่เปลี่ยนจาก connection แล้วแทนที่ใน cache (ไม่พบ = ลบออก)"""
+        with self._lock:
+            if not self._loading and self._source is not db:
+                return
+            barcodes = list(dict.fromkeys(barcodes))
+            for start in range(0, len(barcodes), CATALOG_REFRESH_CHUNK):
+                chunk = barcodes[start:start + CATALOG_REFRESH_CHUNK]
+                rows = {row[0]: row for row in connection.execute(
+                    f"SELECT {CATALOG_COLUMNS} FROM product WHERE barcode IN ({','.join('?' * len(chunk))})",
+                    chunk)}
+                for barcode in chunk:
+                    record = rows.get(barcode)
+                    if self._loading:
+                        self._pending.append((barcode, record))
+                    if self._source is db:
+                        if record is None:
+                            self._records.pop(barcode, None)
+                        else:
+                            self._records[barcode] = record
+
+catalog = ProductCatalog()
+
+def _publish_on_commit(event, **payload):
+    """ประกาศ event หลัง transaction ปัจจุบัน commit (เรียกภายใน db.writer() ถ้า rollback จะไม่ประกาศ)"""
+    db.on_commit(lambda connection: bus.publish(event, **payload))
+
+def _catalog_changed(barcodes):
+    """ให้ catalog อ่าน barcode เหล่านี้ใหม่หลัง transaction ปัจจุบัน commit (เรียกภายใน db.writer())"""
+    barcodes = [str(barcode) for barcode in barcodes]
+    if barcodes:
+        db.on_commit(lambda connection: catalog.refresh(connection, barcodes))
+
+# ==================== STOCK LEDGER ====================
+# ทุกการเปลี่ยน product.quantity บันทึกลง stock_movements ใน transaction เดียวกัน
+# product.quantity ยังเป็นยอดปัจจุบันที่หน้าขาย/dashboard/จุดสั่งซื้ออ่าน ส่วน stock_snapshots
+# เก็บยอดสิ้นวันเฉพาะสินค้าที่มีการเคลื่อนไหวในวันนั้น (maintenance.py บันทึกวันละครั้งตอนเครื่องว่าง)
+# การหายอด ณ วันใดจึงใช้ snapshot ล่าสุดที่ไม่เกินวันนั้น แล้ว replay เฉพาะ movement หลังจากนั้น
+
+STOCK_MOVEMENT_KINDS = ('SALE', 'RECEIPT', 'ADJUSTMENT', 'RETURN')
+STOCK_SNAPSHOT_MAX_DAYS = 400    # เริ่ม snapshot ครั้งแรกย้อนหลังได้มากสุดกี่วัน
+STOCK_SNAPSHOT_BATCH = 500       # จำนวนสินค้าต่อหนึ่ง transaction ของ snapshot
+
+def _log_stock_movements(cur, movements, moved_at=None):
+    """บันทึก [(barcode, kind, quantity_change, reference)] (ข้ามรายการที่เปลี่ยน 0)"""
+    movements = list(movements)
+    moved_at = moved_at or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    # ทุกการเพิ่ม/แก้/ลบสินค้าและตัดสต็อกผ่านฟังก์ชันนี้ จึงแจ้ง catalog และแท็บต่างๆ ที่นี่ที่เดียว
+    barcodes = [str(barcode) for barcode, _, _, _ in movements]
+    _catalog_changed(barcodes)
+    if barcodes:
+        _publish_on_commit(STOCK_CHANGED, barcodes=barcodes)
+    cur.executemany("""INSERT INTO stock_movements (barcode, moved_at, kind, quantity_change, reference)
+                    VALUES (?, ?, ?, ?, ?)""",
+                    [(str(barcode), moved_at, kind, int(change), reference)
+                     for barcode, kind, change, reference in movements if change])
+
+def _next_day(day):
+    return (datetime.strptime(str(day)[:10], '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+
+def _next_snapshot_day(connection, day):
+    """วันแรกตั้งแต่ day ที่มี movement และยังไม่ถึงวันนี้ คืน (วัน, '') หรือ None"""
+    row = connection.execute('SELECT substr(MIN(moved_at), 1, 10) FROM stock_movements WHERE moved_at >= ?',
+                             (day,)).fetchone()
+    if row[0] is None or row[0] >= datetime.now().strftime('%Y-%m-%d'):
+        return None
+    return row[0], ''
+
+def stock_snapshot_position(connection):
+    """ตำแหน่งที่ต้องทำ snapshot ต่อ (วัน, barcode ล่าสุดที่บันทึกแล้วของวันนั้น) หรือ None ถ้าทำถึงเมื่อวานแล้ว
+
+    แต่ละชุดบันทึกสินค้าเรียงตาม barcode และ commit ทั้งชุด snapshot ล่าสุดจึงบอกตำแหน่งได้โดยไม่ต้องเก็บสถานะแยก
+    """
+    last = connection.execute('SELECT MAX(day) FROM stock_snapshots').fetchone()[0]
+    if last is None:
+        earliest = (datetime.now() - timedelta(days=STOCK_SNAPSHOT_MAX_DAYS)).strftime('%Y-%m-%d')
+        return _next_snapshot_day(connection, earliest)
+    if last >= datetime.now().strftime('%Y-%m-%d'):
+        return None
+    after = connection.execute('SELECT MAX(barcode) FROM stock_snapshots WHERE day=?', (last,)).fetchone()[0]
+    return last, after
+
+def snapshot_stock_batch(connection, position, limit=STOCK_SNAPSHOT_BATCH):
+    """บันทึกยอดสิ้นวันของสินค้าที่มี movement ในวันนั้นไม่เกิน limit รายการ ต่อจาก position
+
+    ยอดสิ้นวัน = snapshot ก่อนหน้าของสินค้านั้น (ไม่มีถือเป็น 0) + movement หลัง snapshot นั้นจนสิ้นวัน
+    ต้องเรียกภายใน db.writer() คืนค่า (position ถัดไปหรือ None ถ้าทำถึงเมื่อวานแล้ว, จำนวนแถวที่บันทึก)
+    """
+    day, after = position
+    end = _next_day(day)
+    command = """WITH moved AS (
+                    SELECT DISTINCT barcode FROM stock_movements
+                    WHERE moved_at >= ? AND moved_at < ? AND barcode > ?
+                    ORDER BY barcode LIMIT ?),
+                prev AS (
+                    SELECT moved.barcode, s.day, s.quantity FROM moved
+                    LEFT JOIN stock_snapshots s ON s.barcode = moved.barcode
+                        AND s.day = (SELECT MAX(day) FROM stock_snapshots
+                                     WHERE barcode = moved.barcode AND day < ?))
+                INSERT OR REPLACE INTO stock_snapshots (barcode, day, quantity)
+                SELECT prev.barcode, ?, COALESCE(prev.quantity, 0) + (
+                    SELECT COALESCE(SUM(m.quantity_change), 0) FROM stock_movements m
+                    WHERE m.barcode = prev.barcode
+                    AND m.moved_at >= COALESCE(date(prev.day, '+1 day'), '') AND m.moved_at < ?)
+                FROM prev
+                RETURNING barcode"""
+    barcodes = [row[0] for row in connection.execute(command, (day, end, after, limit, day, day, end))]
+    if len(barcodes) == limit:
+        return (day, max(barcodes)), len(barcodes)
+    return _next_snapshot_day(connection, end), len(barcodes)
+
+@_timed
+def take_stock_snapshots(batch_size=STOCK_SNAPSHOT_BATCH):
+    """บันทึก snapshot ที่ค้างทั้งหมดจนถึงเมื่อวาน ชุดละ batch_size สินค้าต่อ transaction คืนจำนวนแถวที่บันทึก
+
+    งานประจำวันใน maintenance.py ทำแบบเดียวกันแต่แบ่ง slice ตามงบเวลา (ใช้จาก command line/ทดสอบ)
+    """
+    with db.writer() as connection:
+        position = stock_snapshot_position(connection)
+    written = 0
+    while position is not None:
+        with db.writer() as connection:
+            position, count = snapshot_stock_batch(connection, position, batch_size)
+        written += count
+    print(f'Stock snapshots taken: {written} rows')
+    return written
+
+@_timed
+def get_stock_on(barcode, day):
+    """ยอดคงเหลือของสินค้า ณ สิ้นวัน day ('YYYY-MM-DD') จาก snapshot ล่าสุด + movement ที่เหลือ"""
+    cur = db.reader().cursor()
+    row = cur.execute("""SELECT day, quantity FROM stock_snapshots
+                      WHERE barcode=? AND day <= ? ORDER BY day DESC LIMIT 1""",
+                      (str(barcode), str(day)[:10])).fetchone()
+    base, since = (row[1], _next_day(row[0])) if row else (0, '')
+    replay = cur.execute("""SELECT COALESCE(SUM(quantity_change), 0) FROM stock_movements
+                         WHERE barcode=? AND moved_at >= ? AND moved_at < ?""",
+                         (str(barcode), since, _next_day(day))).fetchone()[0]
+    return base + replay
+
+@_timed
+def get_stock_levels_on(day):
+    """ยอดคงเหลือทุกสินค้า ณ สิ้นวัน day คืนค่า {barcode: quantity}
+
+    แต่ละสินค้าใช้ snapshot ล่าสุดที่ไม่เกิน day แล้วบวก movement หลังจากนั้นจนสิ้นวัน (อ่านอย่างเดียว)
+    """
+    day = str(day)[:10]
+    if day >= datetime.now().strftime('%Y-%m-%d'):
+        return dict(db.reader().execute('SELECT barcode, quantity FROM product WHERE barcode IS NOT NULL'))
+    command = """SELECT p.barcode, COALESCE(s.quantity, 0) + (
+                    SELECT COALESCE(SUM(m.quantity_change), 0) FROM stock_movements m
+                    WHERE m.barcode = p.barcode
+                    AND m.moved_at >= COALESCE(date(s.day, '+1 day'), '') AND m.moved_at < ?)
+                FROM product p
+                LEFT JOIN stock_snapshots s ON s.barcode = p.barcode
+                    AND s.day = (SELECT MAX(day) FROM stock_snapshots WHERE barcode = p.barcode AND day <= ?)
+                WHERE p.barcode IS NOT NULL"""
+    return dict(db.reader().execute(command, (_next_day(day), day)))
+
+@_timed
+def get_stock_movements(barcode, limit=100):
+    """ประวัติการเคลื่อนไหวสต็อกล่าสุดของสินค้า (moved_at, kind, quantity_change, reference)"""
+    command = """SELECT moved_at, kind, quantity_change, reference FROM stock_movements
+                WHERE barcode=? ORDER BY moved_at DESC, ID DESC LIMIT ?"""
+    return db.reader().execute(command, (str(barcode), limit)).fetchall()
+
+# ==================== DOCUMENT NUMBERS ====================
+# เลขที่เอกสารออกจากตาราง sequences (เพิ่มค่าทีละ 1 ภายใน write transaction)
+# ไม่ต้องนับแถวในตาราง และไม่ซ้ำแม้ลบข้อมูลเก่าหรือหลายเครื่องขายพร้อมกัน
+
+# prefix: (รีเซ็ตทุกวัน, จำนวนหลัก)
+DOCUMENT_SEQUENCES = {
+    'T': (False, 6),      # เลขที่ขาย T000001
+    'INV': (False, 6),    # ใบวางบิล INV000001
+    'BILL': (True, 4),    # บิลเครดิต BILL202501310001
+}
+
+def _sequence_period(prefix, now=None):
+    if prefix not in DOCUMENT_SEQUENCES:
+        raise ValueError(f'Unknown document prefix: {prefix}')
+    daily, digits = DOCUMENT_SEQUENCES[prefix]
+    period = (now or datetime.now()).strftime('%Y%m%d') if daily else ''
+    return period, digits
+
+def _next_document_id(cur, prefix, now=None):
+    """เพิ่มค่า sequence และคืนเลขที่เอกสาร (ต้องเรียกภายใน write transaction)"""
+    period, digits = _sequence_period(prefix, now)
+    cur.execute("""INSERT INTO sequences (prefix, period, value) VALUES (?, ?, 1)
+                ON CONFLICT(prefix, period) DO UPDATE SET value = value + 1""", (prefix, period))
+    cur.execute('SELECT value FROM sequences WHERE prefix=? AND period=?', (prefix, period))
+    return f'{prefix}{period}{cur.fetchone()[0]:0{digits}d}'
+
+@_timed
+def reserve_document_ids(prefix, count):
+    """จองเลขที่เอกสารติดกัน count เลขใน transaction เดียว (ใช้กับ sale journal)"""
+    period, digits = _sequence_period(prefix)
+    with db.writer() as connection:
+        connection.execute("""INSERT INTO sequences (prefix, period, value) VALUES (?, ?, ?)
+                           ON CONFLICT(prefix, period) DO UPDATE SET value = value + excluded.value""",
+                           (prefix, period, count))
+        last = connection.execute('SELECT value FROM sequences WHERE prefix=? AND period=?',
+                                  (prefix, period)).fetchone()[0]
+    return [f'{prefix}{period}{value:0{digits}d}' for value in range(last - count + 1, last + 1)]
+
+@_timed
+def release_document_ids(prefix, document_ids):
+    """คืนเลขที่จองไว้แต่ไม่ได้ใช้ (เรียงต่อกันจนถึงเลขล่าสุด) ถ้ายังไม่มีใครจองเลขต่อจากนั้น
+
+    คืนค่า True ถ้าคืนได้ (เลขถัดไปจะเริ่มที่เลขแรกของ document_ids)
+    """
+    if not document_ids:
+        return True
+    period, digits = _sequence_period(prefix)
+    start = len(prefix) + len(period)
+    first, last = int(document_ids[0][start:]), int(document_ids[-1][start:])
+    with db.writer() as connection:
+        cur = connection.execute('UPDATE sequences SET value=? WHERE prefix=? AND period=? AND value=?',
+                                 (first - 1, prefix, period, last))
+    return cur.rowcount == 1
+
+@_timed
+def next_document_id(prefix):
+    """จองเลขที่เอกสารถัดไปของ prefix (T, INV, BILL)"""
+    with db.writer() as connection:
+        return _next_document_id(connection.cursor(), prefix)
+
+@_timed
+def peek_document_id(prefix):
+    """ดูเลขที่เอกสารถัดไปโดยไม่จอง (ใช้แสดงตัวอย่างในฟอร์ม)"""
+    period, digits = _sequence_period(prefix)
+    row = db.reader().execute('SELECT value FROM sequences WHERE prefix=? AND period=?',
+                              (prefix, period)).fetchone()
+    return f'{prefix}{period}{(row[0] if row else 0) + 1:0{digits}d}'
 
 # ==================== SALES/TRANSACTION FUNCTIONS ====================
+# กรองช่วงวันที่บนคอลัมน์ datetime ตรงๆ แบบครึ่งเปิด (>= วันแรก และ < วันถัดจากวันสุดท้าย)
+# ห้ามครอบคอลัมน์ด้วย date() เพราะ SQLite จะใช้ idx_sales_datetime ไม่ได้และต้องสแกนทั้งตาราง
+
+def _day_range(start_date, end_date):
+    """แปลงช่วงวันที่ 'YYYY-MM-DD' (รวมวันสุดท้าย) เป็นพารามิเตอร์ (วันแรก, วันถัดจากวันสุดท้าย)"""
+    end = datetime.strptime(str(end_date)[:10], '%Y-%m-%d') + timedelta(days=1)
+    return str(start_date)[:10], end.strftime('%Y-%m-%d')
+
+@_timed
+def iter_sales_by_date_range(start_date, end_date):
+    """อ่านข้อมูลการขายตามช่วงวันที่ทีละแถว"""
+    with _report_schemas(db.reader(), start_date, end_date) as schemas:
+        command = ' UNION ALL '.join(f'SELECT * FROM {schema}.sales WHERE datetime >= ? AND datetime < ?'
+                                     for schema in schemas) + ' ORDER BY datetime DESC'
+        yield from _iter_rows(command, _day_range(start_date, end_date) * len(schemas))
 
 def get_sales_by_date_range(start_date, end_date):
     """ดึงข้อมูลการขายตามช่วงวันที่"""
-    with conn:
-        command = 'SELECT * FROM sales WHERE date(datetime) BETWEEN ? AND ? ORDER BY datetime DESC'
-        c.execute(command, (start_date, end_date))
-        data = c.fetchall()
-        return data
+    return list(iter_sales_by_date_range(start_date, end_date))
 
+@_timed
 def insert_transaction(transaction_id, subtotal, vat, grand_total, received_amount, change_amount, items):
     """บันทึกข้อมูลการขาย"""
-    with conn:
+    with db.writer() as connection:
         current_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         command = 'INSERT INTO sales VALUES (?,?,?,?,?,?,?,?,?)'
-        c.execute(command, (None, transaction_id, current_datetime, subtotal, vat, grand_total, received_amount, change_amount, items))
-        conn.commit()
-        print(f'Transaction {transaction_id} saved')
+        connection.execute(command, (None, transaction_id, current_datetime, subtotal, vat, grand_total, received_amount, change_amount, items))
+
+        # บันทึกรายการสินค้าแยกแถว พร้อมต้นทุน ณ เวลาขาย
+        command = """INSERT INTO sale_items (transaction_id, barcode, title, unit_price, unit_cost, quantity)
+                    VALUES (?, ?, ?, ?, COALESCE((SELECT cost FROM product WHERE barcode=?), 0), ?)"""
+        sale_items = json.loads(items)
+        connection.executemany(command, _sale_item_params(transaction_id, sale_items))
+        _publish_on_commit(SALE_COMMITTED, transaction_id=transaction_id, bill_id=None,
+                           barcodes=[str(item[0]) for item in sale_items])
+    print(f'Transaction {transaction_id} saved')
+
+@_timed
+def get_sale_items(transaction_id):
+    """ดึงรายการสินค้าของการขาย ในรูปแบบเดียวกับตะกร้า [barcode, title, price, quantity] (รวมการขายที่ย้ายไป archive)"""
+    command = """SELECT barcode, title, unit_price, quantity FROM {schema}.sale_items
+                WHERE transaction_id=? ORDER BY ID"""
+    return [list(row) for row in _lookup_with_archives(command, (transaction_id,))]
+
+@_timed
+def iter_sale_lines_by_date_range(start_date, end_date):
+    """อ่านรายการสินค้าที่ขายตามช่วงวันที่ทีละแถว (ใช้คำนวณกำไร)"""
+    with _report_schemas(db.reader(), start_date, end_date) as schemas:
+        if len(schemas) > 1:
+            command = f"""SELECT datetime, transaction_id, barcode, title, quantity, unit_price, unit_cost
+                        FROM ({_sale_lines_union(schemas)})
+                        ORDER BY datetime DESC, line_id"""
+            yield from _iter_rows(command, _day_range(start_date, end_date) * len(schemas))
+            return
+        command = """SELECT s.datetime, s.transaction_id, si.barcode, si.title,
+                           si.quantity, si.unit_price, si.unit_cost
+                    FROM sales s
+                    JOIN sale_items si ON si.transaction_id = s.transaction_id
+                    WHERE s.datetime >= ? AND s.datetime < ?
+                    ORDER BY s.datetime DESC, si.ID"""
+        yield from _iter_rows(command, _day_range(start_date, end_date))
+
+def get_sale_lines_by_date_range(start_date, end_date):
+    """ดึงรายการสินค้าที่ขายตามช่วงวันที่ (ใช้คำนวณกำไร)"""
+    return list(iter_sale_lines_by_date_range(start_date, end_date))
+
+@_timed
+def get_product_sales_summary(start_date, end_date):
+    """สรุปยอดขายรายสินค้า: barcode, title, จำนวน, รายได้, ต้นทุน"""
+    with _report_schemas(db.reader(), start_date, end_date) as schemas:
+        if len(schemas) > 1:
+            command = f"""SELECT barcode, MAX(title), SUM(quantity),
+                               SUM(unit_price * quantity), SUM(unit_cost * quantity)
+                        FROM ({_sale_lines_union(schemas)})
+                        GROUP BY barcode
+                        ORDER BY SUM(unit_price * quantity) DESC"""
+            return db.reader().execute(command, _day_range(start_date, end_date) * len(schemas)).fetchall()
+    command = """SELECT si.barcode, MAX(si.title), SUM(si.quantity),
+                       SUM(si.unit_price * si.quantity), SUM(si.unit_cost * si.quantity)
+                FROM sales s
+                JOIN sale_items si ON si.transaction_id = s.transaction_id
+                WHERE s.datetime >= ? AND s.datetime < ?
+                GROUP BY si.barcode
+                ORDER BY SUM(si.unit_price * si.quantity) DESC"""
+    return db.reader().execute(command, _day_range(start_date, end_date)).fetchall()
+
+@_timed
+def get_daily_sales_summary(start_date, end_date):
+    """สรุปยอดขายรายวัน: วันที่, จำนวนบิล, รายได้, ต้นทุน"""
+    with _report_schemas(db.reader(), start_date, end_date) as schemas:
+        if len(schemas) > 1:
+            command = f"""SELECT date(datetime), COUNT(DISTINCT transaction_id),
+                               SUM(unit_price * quantity), SUM(unit_cost * quantity)
+                        FROM ({_sale_lines_union(schemas)})
+                        GROUP BY date(datetime)
+                        ORDER BY date(datetime)"""
+            return db.reader().execute(command, _day_range(start_date, end_date) * len(schemas)).fetchall()
+    command = """SELECT date(s.datetime), COUNT(DISTINCT s.transaction_id),
+                       SUM(si.unit_price * si.quantity), SUM(si.unit_cost * si.quantity)
+                FROM sales s
+                JOIN sale_items si ON si.transaction_id = s.transaction_id
+                WHERE s.datetime >= ? AND s.datetime < ?
+                GROUP BY date(s.datetime)
+                ORDER BY date(s.datetime)"""
+    return db.reader().execute(command, _day_range(start_date, end_date)).fetchall()
+
+@_timed
+def iter_transactions():
+    """อ่านข้อมูลการขายทั้งหมดทีละแถว"""
+    command = 'SELECT * FROM sales ORDER BY datetime DESC'
+    return _iter_rows(command)
 
 def view_transactions():
     """ดูข้อมูลการขายทั้งหมด"""
-    with conn:
-        command = 'SELECT * FROM sales ORDER BY datetime DESC'
-        c.execute(command)
-        data = c.fetchall()
-        return data
+    return list(iter_transactions())
 
 def generate_transaction_id():
     """สร้าง transaction ID อัตโนมัติ"""
-    with conn:
-        command = 'SELECT COUNT(*) FROM sales'
-        c.execute(command)
-        count = c.fetchone()[0]
-        return f"T{count + 1:06d}"  # T000001, T000002, etc.
+    return next_document_id('T')
 
 # ==================== CUSTOMER FUNCTIONS ====================
 
-def insert_customer(customer_id, name, phone='', email='', address='', 
+@_timed
+def insert_customer(customer_id, name, phone='', email='', address='',
                    credit_limit=0, credit_days=0, notes=''):
     """เพิ่มลูกค้าใหม่"""
-    with conn:
+    with db.writer() as connection:
         created_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
+
         command = '''INSERT INTO customers VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?)'''
-        c.execute(command, (customer_id, name, phone, email, address, credit_limit, 
-                           credit_days, created_date, notes))
-        conn.commit()
-        print(f'Customer {customer_id} added')
+        connection.execute(command, (customer_id, name, phone, email, address, credit_limit,
+                                     credit_days, created_date, notes))
+    print(f'Customer {customer_id} added')
 
-def update_customer(customer_id, name, phone, email, address, 
+@_timed
+def update_customer(customer_id, name, phone, email, address,
                    credit_limit, credit_days, notes):
     """แก้ไขข้อมูลลูกค้า"""
-    with conn:
-        command = '''UPDATE customers SET 
+    with db.writer() as connection:
+        command = '''UPDATE customers SET
                     customer_name=?, phone=?, email=?, address=?,
                     credit_limit=?, credit_days=?, notes=?
                     WHERE customer_id=?'''
-        c.execute(command, (name, phone, email, address, credit_limit, credit_days, 
-                           notes, customer_id))
-        conn.commit()
-        print(f'Customer {customer_id} updated')
+        connection.execute(command, (name, phone, email, address, credit_limit, credit_days,
+                                     notes, customer_id))
+    print(f'Customer {customer_id} updated')
 
+@_timed
 def delete_customer(customer_id):
     """ลบลูกค้า"""
-    with conn:
+    with db.writer() as connection:
         command = 'DELETE FROM customers WHERE customer_id=?'
-        c.execute(command, (customer_id,))
-        conn.commit()
-        print(f'Customer {customer_id} deleted')
+        connection.execute(command, (customer_id,))
+    print(f'Customer {customer_id} deleted')
 
+@_timed
 def get_all_customers():
     """ดึงข้อมูลลูกค้าทั้งหมด"""
-    with conn:
-        command = 'SELECT * FROM customers ORDER BY customer_name'
-        c.execute(command)
-        data = c.fetchall()
-        return data
+    command = 'SELECT * FROM customers ORDER BY customer_name'
+    return db.reader().execute(command).fetchall()
 
+@_timed
 def get_customer_by_id(customer_id):
     """ดึงข้อมูลลูกค้าจาก ID"""
-    with conn:
-        command = 'SELECT * FROM customers WHERE customer_id=?'
-        c.execute(command, (customer_id,))
-        data = c.fetchone()
-        return data
+    command = 'SELECT * FROM customers WHERE customer_id=?'
+    return db.reader().execute(command, (customer_id,)).fetchone()
 
+@_timed
 def update_customer_debt(customer_id, amount):
     """อัปเดตยอดหนี้ลูกค้า"""
-    with conn:
+    with db.writer() as connection:
         command = 'UPDATE customers SET total_debt = total_debt + ? WHERE customer_id=?'
-        c.execute(command, (amount, customer_id))
-        conn.commit()
-        print(f'Customer {customer_id} debt updated: +{amount}')
+        connection.execute(command, (amount, customer_id))
+        _publish_on_commit(BILL_CHANGED, bill_id=None, customer_id=customer_id)
+    print(f'Customer {customer_id} debt updated: +{amount}')
 
 # ==================== CREDIT BILL FUNCTIONS ====================
 
-def insert_credit_bill(bill_id, customer_id, transaction_id, credit_days, 
+def _insert_credit_bill(cur, bill_id, customer_id, transaction_id, credit_days,
+                        total_amount, notes=''):
+    bill_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    due_date = (datetime.now() + timedelta(days=credit_days)).strftime('%Y-%m-%d')
+
+    command = '''INSERT INTO credit_bills
+                (bill_id, customer_id, transaction_id, bill_date, due_date,
+                 total_amount, remaining_amount, status, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, 'PENDING', ?)'''
+    cur.execute(command, (bill_id, customer_id, transaction_id, bill_date, due_date,
+                          total_amount, total_amount, notes))
+
+    # อัปเดตยอดหนี้ลูกค้า
+    command2 = 'UPDATE customers SET total_debt = total_debt + ? WHERE customer_id=?'
+    cur.execute(command2, (total_amount, customer_id))
+    _publish_on_commit(BILL_CHANGED, bill_id=bill_id, customer_id=customer_id)
+
+@_timed
+def insert_credit_bill(bill_id, customer_id, transaction_id, credit_days,
                       total_amount, notes=''):
     """สร้างบิลเครดิตใหม่"""
-    with conn:
-        bill_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        due_date = (datetime.now() + timedelta(days=credit_days)).strftime('%Y-%m-%d')
-        
-        command = '''INSERT INTO credit_bills 
-                    (bill_id, customer_id, transaction_id, bill_date, due_date, 
-                     total_amount, remaining_amount, status, notes) 
-                    VALUES (?, ?, ?, ?, ?, ?, ?, 'PENDING', ?)'''
-        c.execute(command, (bill_id, customer_id, transaction_id, bill_date, due_date, 
-                           total_amount, total_amount, notes))
-        
-        # อัปเดตยอดหนี้ลูกค้า
-        command2 = 'UPDATE customers SET total_debt = total_debt + ? WHERE customer_id=?'
-        c.execute(command2, (total_amount, customer_id))
-        
-        conn.commit()
-        print(f'Credit bill {bill_id} created for customer {customer_id}')
+    with db.writer() as connection:
+        _insert_credit_bill(connection.cursor(), bill_id, customer_id, transaction_id,
+                            credit_days, total_amount, notes)
+    print(f'Credit bill {bill_id} created for customer {customer_id}')
 
+@_timed
 def pay_credit_bill(bill_id, payment_amount):
     """ชำระบิลเครดิต"""
-    with conn:
-        # ดึงข้อมูลบิล
+    with db.writer() as connection:
+        # ดึงข้อมูลบิลผ่าน connection เขียน เพื่อให้ยอดคงเหลือไม่เปลี่ยนระหว่างคำนวณ
         command = 'SELECT customer_id, remaining_amount FROM credit_bills WHERE bill_id=?'
-        c.execute(command, (bill_id,))
-        result = c.fetchone()
-        
+        result = connection.execute(command, (bill_id,)).fetchone()
+
         if not result:
             return False, "ไม่พบบิลนี้"
-        
+
         customer_id, remaining = result
-        
+
         if payment_amount > remaining:
             return False, "จำนวนเงินชำระมากกว่ายอดค้างชำระ"
-        
+
         new_remaining = remaining - payment_amount
         new_status = 'PAID' if new_remaining == 0 else 'PARTIAL'
         payment_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
+
         # อัปเดตบิล
-        command = '''UPDATE credit_bills SET 
+        command = '''UPDATE credit_bills SET
                     paid_amount = paid_amount + ?,
                     remaining_amount = ?,
                     status = ?,
                     payment_date = ?
                     WHERE bill_id=?'''
-        c.execute(command, (payment_amount, new_remaining, new_status, payment_date, bill_id))
-        
+        connection.execute(command, (payment_amount, new_remaining, new_status, payment_date, bill_id))
+
         # อัปเดตยอดหนี้ลูกค้า
         command2 = 'UPDATE customers SET total_debt = total_debt - ? WHERE customer_id=?'
-        c.execute(command2, (payment_amount, customer_id))
-        
-        conn.commit()
-        print(f'Payment {payment_amount} received for bill {bill_id}')
-        return True, "ชำระเงินสำเร็จ"
+        connection.execute(command2, (payment_amount, customer_id))
+        _publish_on_commit(BILL_CHANGED, bill_id=bill_id, customer_id=customer_id)
+
+    print(f'Payment {payment_amount} received for bill {bill_id}')
+    return True, "ชำระเงินสำเร็จ"
+
+@_timed
+def delete_credit_bill(bill_id):
+    """ลบบิลเครดิต และลดยอดหนี้ลูกค้าตามยอดที่ยังค้างชำระ"""
+    with db.writer() as connection:
+        command = 'SELECT customer_id, remaining_amount FROM credit_bills WHERE bill_id=?'
+        result = connection.execute(command, (bill_id,)).fetchone()
+        if not result:
+            return False
+
+        customer_id, remaining = result
+        connection.execute('DELETE FROM credit_bills WHERE bill_id=?', (bill_id,))
+        connection.execute('UPDATE customers SET total_debt = total_debt - ? WHERE customer_id=?',
+                           (remaining, customer_id))
+        _publish_on_commit(BILL_CHANGED, bill_id=bill_id, customer_id=customer_id)
+    print(f'Credit bill {bill_id} deleted')
+    return True
+
+@_timed
+def iter_credit_bills():
+    """อ่านบิลเครดิตทั้งหมดทีละแถว"""
+    command = '''SELECT cb.*, cu.customer_name
+                FROM credit_bills cb
+                LEFT JOIN customers cu ON cb.customer_id = cu.customer_id
+                ORDER BY cb.bill_date DESC'''
+    return _iter_rows(command)
 
 def get_all_credit_bills():
     """ดึงบิลเครดิตทั้งหมด"""
-    with conn:
-        command = '''SELECT cb.*, cu.customer_name 
-                    FROM credit_bills cb
-                    LEFT JOIN customers cu ON cb.customer_id = cu.customer_id
-                    ORDER BY cb.bill_date DESC'''
-        c.execute(command)
-        data = c.fetchall()
-        return data
+    return list(iter_credit_bills())
 
+@_timed
 def get_pending_credit_bills():
     """ดึงบิลเครดิตที่ค้างชำระ"""
-    with conn:
-        command = '''SELECT cb.*, cu.customer_name 
-                    FROM credit_bills cb
-                    LEFT JOIN customers cu ON cb.customer_id = cu.customer_id
-                    WHERE cb.status IN ('PENDING', 'PARTIAL')
-                    ORDER BY cb.due_date ASC'''
-        c.execute(command)
-        data = c.fetchall()
-        return data
+    command = '''SELECT cb.*, cu.customer_name
+                FROM credit_bills cb
+                LEFT JOIN customers cu ON cb.customer_id = cu.customer_id
+                WHERE cb.status IN ('PENDING', 'PARTIAL')
+                ORDER BY cb.due_date ASC'''
+    # ค้นผ่าน idx_credit_bills_open_due (partial index เรียงตาม due_date อยู่แล้ว)
+    return db.reader().execute(command).fetchall()
 
+@_timed
 def get_overdue_credit_bills():
     """ดึงบิลเครดิตที่เกินกำหนด"""
-    with conn:
-        today = datetime.now().strftime('%Y-%m-%d')
-        command = '''SELECT cb.*, cu.customer_name 
-                    FROM credit_bills cb
-                    LEFT JOIN customers cu ON cb.customer_id = cu.customer_id
-                    WHERE cb.status IN ('PENDING', 'PARTIAL') 
-                    AND cb.due_date < ?
-                    ORDER BY cb.due_date ASC'''
-        c.execute(command, (today,))
-        data = c.fetchall()
-        return data
+    today = datetime.now().strftime('%Y-%m-%d')
+    command = '''SELECT cb.*, cu.customer_name
+                FROM credit_bills cb
+                LEFT JOIN customers cu ON cb.customer_id = cu.customer_id
+                WHERE cb.status IN ('PENDING', 'PARTIAL')
+                AND cb.due_date < ?
+                ORDER BY cb.due_date ASC'''
+    return db.reader().execute(command, (today,)).fetchall()
 
+@_timed
 def get_customer_credit_bills(customer_id):
     """ดึงบิลเครดิตของลูกค้า"""
-    with conn:
-        command = '''SELECT * FROM credit_bills 
-                    WHERE customer_id=? 
-                    ORDER BY bill_date DESC'''
-        c.execute(command, (customer_id,))
-        data = c.fetchall()
-        return data
+    command = '''SELECT * FROM credit_bills
+                WHERE customer_id=?
+                ORDER BY bill_date DESC'''
+    return db.reader().execute(command, (customer_id,)).fetchall()
 
+@_timed
 def get_credit_bill_by_id(bill_id):
-    """ดึงข้อมูลบิลเครดิตจาก ID"""
-    with conn:
-        command = '''SELECT cb.*, cu.customer_name, cu.phone 
-                    FROM credit_bills cb
-                    LEFT JOIN customers cu ON cb.customer_id = cu.customer_id
-                    WHERE cb.bill_id=?'''
-        c.execute(command, (bill_id,))
-        data = c.fetchone()
-        return data
+    """ดึงข้อมูลบิลเครดิตจาก ID (รวมบิลที่ชำระแล้วและย้ายไป archive)"""
+    command = '''SELECT cb.*, cu.customer_name, cu.phone
+                FROM {schema}.credit_bills cb
+                LEFT JOIN main.customers cu ON cb.customer_id = cu.customer_id
+                WHERE cb.bill_id=?'''
+    rows = _lookup_with_archives(command, (bill_id,))
+    return rows[0] if rows else None
 
+@_timed
 def get_credit_statistics():
     """ดึงสถิติระบบเครดิต"""
-    with conn:
-        stats = {}
-        
-        # จำนวนบิลค้างชำระ
-        c.execute("SELECT COUNT(*) FROM credit_bills WHERE status IN ('PENDING', 'PARTIAL')")
-        stats['pending_count'] = c.fetchone()[0]
-        
-        # จำนวนบิลเกินกำหนด
-        today = datetime.now().strftime('%Y-%m-%d')
-        c.execute("SELECT COUNT(*) FROM credit_bills WHERE status IN ('PENDING', 'PARTIAL') AND due_date < ?", (today,))
-        stats['overdue_count'] = c.fetchone()[0]
-        
-        # ยอดหนี้รวมทั้งหมด
-        c.execute("SELECT SUM(total_debt) FROM customers")
-        result = c.fetchone()[0]
-        stats['total_debt'] = result if result else 0
-        
-        # ยอดเงินที่ต้องรับในเดือนนี้
-        first_day = datetime.now().replace(day=1).strftime('%Y-%m-%d')
-        last_day = (datetime.now().replace(day=1) + timedelta(days=32)).replace(day=1).strftime('%Y-%m-%d')
-        c.execute("SELECT SUM(remaining_amount) FROM credit_bills WHERE status IN ('PENDING', 'PARTIAL') AND due_date BETWEEN ? AND ?", 
-                 (first_day, last_day))
-        result = c.fetchone()[0]
-        stats['due_this_month'] = result if result else 0
-        
-        return stats
+    counters = get_stats()
+    cur = db.reader().cursor()
+    stats = {
+        'pending_count': int(counters['pending_bills']),   # จำนวนบิลค้างชำระ
+        'pending_amount': counters['pending_amount'],      # ยอดค้างชำระรวมของบิล
+        'total_debt': counters['total_debt'],              # ยอดหนี้รวมทั้งหมด
+    }
+
+    # ตัวเลขที่ขึ้นกับวันที่ปัจจุบันเก็บเป็นตัวนับไม่ได้ จึงค้นผ่าน idx_credit_bills_open_due
+    today = datetime.now().strftime('%Y-%m-%d')
+    cur.execute("SELECT COUNT(*) FROM credit_bills WHERE status IN ('PENDING', 'PARTIAL') AND due_date < ?", (today,))
+    stats['overdue_count'] = cur.fetchone()[0]
+
+    # ยอดเงินที่ต้องรับในเดือนนี้
+    first_day = datetime.now().replace(day=1).strftime('%Y-%m-%d')
+    last_day = (datetime.now().replace(day=1) + timedelta(days=32)).replace(day=1).strftime('%Y-%m-%d')
+    cur.execute("SELECT SUM(remaining_amount) FROM credit_bills WHERE status IN ('PENDING', 'PARTIAL') AND due_date BETWEEN ? AND ?",
+                (first_day, last_day))
+    result = cur.fetchone()[0]
+    stats['due_this_month'] = result if result else 0
+
+    return stats
+
+# ==================== CHECKOUT ====================
+
+class InsufficientStockError(Exception):
+    """สต็อกสินค้าไม่พอสำหรับรายการในตะกร้า"""
+    def __init__(self, barcode, available, requested):
+        self.barcode = barcode
+        self.available = available
+        self.requested = requested
+        super().__init__(f'Insufficient stock for barcode {barcode}: '
+                         f'{available} available, {requested} requested')
+
+def _sale_quantities(items):
+    """รวมจำนวนต่อ barcode เผื่อมีสินค้าเดียวกันหลายแถว"""
+    needed = {}
+    for barcode, title, price, quantity in items:
+        needed[str(barcode)] = needed.get(str(barcode), 0) + int(quantity)
+    return needed
+
+def _insert_sale(cur, transaction_id, current_datetime, items, payment):
+    """บันทึก sales และ sale_items ของหนึ่งบิล (ต้นทุน ณ เวลาขายอ่านจากตาราง product)"""
+    command = 'INSERT INTO sales VALUES (?,?,?,?,?,?,?,?,?)'
+    cur.execute(command, (None, transaction_id, current_datetime, payment['subtotal'],
+                          payment['vat'], payment['grand_total'], payment.get('received_amount', 0),
+                          payment.get('change_amount', 0), json.dumps(items)))
+
+    command = """INSERT INTO sale_items (transaction_id, barcode, title, unit_price, unit_cost, quantity)
+                VALUES (?, ?, ?, ?, COALESCE((SELECT cost FROM product WHERE barcode=?), 0), ?)"""
+    cur.executemany(command, _sale_item_params(transaction_id, items))
+
+def _deduct_stock(cur, needed, transaction_id, current_datetime, allow_negative=False):
+    """ตัดสต็อก {barcode: จำนวน} พร้อมบันทึก stock_movements
+
+    allow_negative=True ใช้กับบิลที่ยืนยันกับลูกค้าไปแล้ว (sale journal) ต้องตัดแม้สต็อกจะติดลบ
+    """
+    if allow_negative:
+        command = 'UPDATE product SET quantity = quantity - ? WHERE barcode = ?'
+        cur.executemany(command, [(quantity, barcode) for barcode, quantity in needed.items()])
+    else:
+        command = 'UPDATE product SET quantity = quantity - ? WHERE barcode = ? AND quantity >= ?'
+        cur.executemany(command, [(quantity, barcode, quantity) for barcode, quantity in needed.items()])
+    _log_stock_movements(cur, [(barcode, 'SALE', -quantity, transaction_id)
+                               for barcode, quantity in needed.items()], current_datetime)
+
+@_timed
+def commit_sale(cart, payment, customer=None):
+    """บันทึกการขายทั้งบิลภายใน transaction เดียว
+
+    cart: รายการ [barcode, title, price, quantity]
+    payment: dict ที่มี subtotal, vat, grand_total, received_amount, change_amount
+    customer: dict ที่มี customer_id, credit_days และ notes (ถ้ามี) สำหรับการวางบิล
+
+    สร้างเลขที่ขาย บันทึก sales/sale_items ตัดสต็อก และสร้างบิลเครดิต (ถ้ามี customer)
+    แล้ว commit ครั้งเดียว หากสินค้ารายการใดสต็อกไม่พอ จะ rollback ทั้งหมด
+    และโยน InsufficientStockError ที่ระบุ barcode นั้น
+    คืนค่า dict: transaction_id, bill_id (None ถ้าขายเงินสด), datetime
+    """
+    items = [list(item) for item in cart]
+    if not items:
+        raise ValueError('Cart is empty')
+
+    needed = _sale_quantities(items)
+
+    now = datetime.now()
+    current_datetime = now.strftime('%Y-%m-%d %H:%M:%S')
+    with db.writer() as connection:
+        cur = connection.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        # ถือ write lock แล้ว สต็อกที่อ่านได้จะไม่เปลี่ยนจนกว่าจะ commit
+        for barcode, quantity in needed.items():
+            cur.execute('SELECT quantity FROM product WHERE barcode=?', (barcode,))
+            row = cur.fetchone()
+            available = row[0] if row else 0
+            if row is None or available < quantity:
+                raise InsufficientStockError(barcode, available, quantity)
+
+        transaction_id = _next_document_id(cur, 'T', now)
+        if customer is not None:
+            payment = dict(payment, received_amount=0, change_amount=0)
+        _insert_sale(cur, transaction_id, current_datetime, items, payment)
+        _deduct_stock(cur, needed, transaction_id, current_datetime)
+
+        bill_id = None
+        if customer is not None:
+            bill_id = _next_document_id(cur, 'BILL', now)
+            _insert_credit_bill(cur, bill_id, customer['customer_id'], transaction_id,
+                                customer.get('credit_days', 0), payment['grand_total'],
+                                customer.get('notes', ''))
+        _publish_on_commit(SALE_COMMITTED, transaction_id=transaction_id, bill_id=bill_id,
+                           barcodes=list(needed))
+
+    print(f'Sale {transaction_id} committed ({len(items)} items)')
+    return {'transaction_id': transaction_id, 'bill_id': bill_id, 'datetime': current_datetime}
+
+@_timed
+def commit_invoice(items, payment, customer_id, credit_days, notes='', transaction_id=None):
+    """บันทึกใบวางบิล (sales, sale_items และบิลเครดิตเลขเดียวกัน) ภายใน transaction เดียว
+
+    items: รายการ [barcode, title, price, quantity]
+    payment: dict ที่มี subtotal, vat, grand_total
+    transaction_id=None จองเลข INV ถัดไปใน transaction นี้ ถ้าบันทึกไม่สำเร็จเลขจะไม่ถูกใช้
+    ใบวางบิลไม่ตัดสต็อก (เหมือน insert_transaction เดิม) คืนค่า dict: transaction_id, bill_id, datetime
+    """
+    items = [list(item) for item in items]
+    if not items:
+        raise ValueError('Invoice has no items')
+
+    current_datetime = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    payment = dict(payment, received_amount=0, change_amount=0)
+    with db.writer() as connection:
+        cur = connection.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        if transaction_id is None:
+            transaction_id = _next_document_id(cur, 'INV')
+        _insert_sale(cur, transaction_id, current_datetime, items, payment)
+        _insert_credit_bill(cur, transaction_id, customer_id, transaction_id,
+                            credit_days, payment['grand_total'], notes)
+        _publish_on_commit(SALE_COMMITTED, transaction_id=transaction_id, bill_id=transaction_id,
+                           barcodes=list(_sale_quantities(items)))
+
+    print(f'Invoice {transaction_id} committed ({len(items)} items)')
+    return {'transaction_id': transaction_id, 'bill_id': transaction_id, 'datetime': current_datetime}
+
+@_timed
+def apply_journaled_sales(sales):
+    """บันทึกบิลเงินสดจาก sale journal หลายบิลใน transaction เดียว
+
+    sales: dict ที่มี transaction_id (จองไว้แล้วด้วย reserve_document_ids), datetime, items, payment
+    บิลที่มีในตาราง sales แล้วจะถูกข้าม (replay ซ้ำหลังเครื่องดับได้) คืนค่าจำนวนบิลที่บันทึก
+    """
+    sales = list(sales)
+    if not sales:
+        return 0
+    with db.writer() as connection:
+        cur = connection.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        ids = [sale['transaction_id'] for sale in sales]
+        existing = set()
+        for start in range(0, len(ids), CATALOG_REFRESH_CHUNK):
+            chunk = ids[start:start + CATALOG_REFRESH_CHUNK]
+            cur.execute(f"SELECT transaction_id FROM sales WHERE transaction_id IN ({','.join('?' * len(chunk))})",
+                        chunk)
+            existing.update(row[0] for row in cur.fetchall())
+
+        applied = 0
+        for sale in sales:
+            transaction_id = sale['transaction_id']
+            if transaction_id in existing:
+                continue
+            items = [list(item) for item in sale['items']]
+            needed = _sale_quantities(items)
+            _insert_sale(cur, transaction_id, sale['datetime'], items, sale['payment'])
+            _deduct_stock(cur, needed, transaction_id, sale['datetime'], allow_negative=True)
+            _publish_on_commit(SALE_COMMITTED, transaction_id=transaction_id, bill_id=None,
+                               barcodes=list(needed))
+            existing.add(transaction_id)
+            applied += 1
+
+    print(f'Applied {applied} journaled sales ({len(sales) - applied} already saved)')
+    return applied
+
+# ==================== ARCHIVE ====================
+# ข้อมูลขายเก่าถูกย้ายไปไฟล์ archive/posdb-archive-YYYY.sqlite3 (แยกตามปีของการขาย)
+# ทีละชุดเล็กๆ ฐานข้อมูลหลักจึงเล็กและเร็ว ส่วนรายงานที่ช่วงวันที่คร่อมปีเก่าจะ ATTACH
+# ไฟล์ archive มาอ่านรวมด้วย UNION ALL อัตโนมัติ
+
+ARCHIVE_DIR = 'archive'           # โฟลเดอร์ archive ข้างไฟล์ฐานข้อมูล
+ARCHIVE_BATCH = 500
+ARCHIVE_TABLES = ('sales', 'sale_items', 'credit_bills')
+ARCHIVE_NAME = re.compile(r'posdb-archive-(\d{4})\.sqlite3')
+
+def _archive_dir():
+    """โฟลเดอร์ archive ของฐานข้อมูลที่เปิดอยู่ (ฐานข้อมูลในหน่วยความจำใช้โฟลเดอร์ปัจจุบัน)"""
+    if db.in_memory:
+        return ARCHIVE_DIR
+    return os.path.join(os.path.dirname(os.path.abspath(db.path)), ARCHIVE_DIR)
+
+def _archive_path(year):
+    return os.path.join(_archive_dir(), f'posdb-archive-{year}.sqlite3')
+
+def _archive_years():
+    """ปีที่มีไฟล์ archive เรียงจากใหม่ไปเก่า"""
+    folder = _archive_dir()
+    if not os.path.isdir(folder):
+        return []
+    matches = (ARCHIVE_NAME.fullmatch(name) for name in os.listdir(folder))
+    return sorted((int(match.group(1)) for match in matches if match), reverse=True)
+
+# จำนวนผู้ใช้ archive ที่ attach อยู่ต่อ connection: {(id(connection), alias): count}
+# DETACH เมื่อผู้ใช้คนสุดท้ายเลิกใช้ (generator รายงานสองตัวใน thread เดียวอาจใช้ไฟล์เดียวกัน)
+_attached_archives = {}
+_attached_archives_lock = threading.Lock()
+
+def _attach_archive(connection, year, readonly=True):
+    """ATTACH ไฟล์ archive ของปีนั้นเป็น schema archive_YYYY ต้องเรียก _detach_archive คู่กันเสมอ"""
+    alias = f'archive_{int(year)}'
+    key = (id(connection), alias)
+    with _attached_archives_lock:
+        count = _attached_archives.get(key, 0)
+        if count == 0:
+            path = os.path.abspath(_archive_path(year))
+            if readonly and not db.in_memory:
+                path = f'file:{pathname2url(path)}?mode=ro'
+            connection.execute(f'ATTACH DATABASE ? AS {alias}', (path,))
+        _attached_archives[key] = count + 1
+    return alias
+
+def _detach_archive(connection, alias):
+    """เลิกใช้ archive ที่ attach ไว้ (DETACH จริงเมื่อไม่มีผู้ใช้เหลือ) SQLite attach ได้ไม่เกิน 10 ไฟล์"""
+    key = (id(connection), alias)
+    with _attached_archives_lock:
+        count = _attached_archives.pop(key, 0) - 1
+        if count > 0:
+            _attached_archives[key] = count
+        else:
+            connection.execute(f'DETACH DATABASE {alias}')
+
+@contextmanager
+def _report_schemas(connection, start_date, end_date):
+    """schema ที่ต้องค้นสำหรับช่วงวันที่: main และ archive ของปีที่มีไฟล์อยู่ (DETACH เมื่อจบ with)"""
+    aliases = []
+    try:
+        for year in range(int(str(start_date)[:4]), int(str(end_date)[:4]) + 1):
+            if os.path.exists(_archive_path(year)):
+                aliases.append(_attach_archive(connection, year))
+        yield ['main'] + aliases
+    finally:
+        for alias in aliases:
+            _detach_archive(connection, alias)
+
+def _lookup_with_archives(command, params):
+    """รัน command ({schema} = ชื่อ schema) บน main ถ้าไม่พบแถวใดจึงค้น archive ทีละปีจากใหม่ไปเก่า
+
+    ใช้กับการค้นตามเลขที่เอกสาร ซึ่งไม่รู้ว่าอยู่ปีไหน แต่ละไฟล์ attach แล้ว DETACH ทันที
+    """
+    connection = db.reader()
+    rows = connection.execute(command.format(schema='main'), params).fetchall()
+    if rows:
+        return rows
+    for year in _archive_years():
+        alias = _attach_archive(connection, year)
+        try:
+            rows = connection.execute(command.format(schema=alias), params).fetchall()
+        finally:
+            _detach_archive(connection, alias)
+        if rows:
+            break
+    return rows
+
+def _sale_lines_union(schemas):
+    """SQL รายการขายจากทุก schema ต่อกันด้วย UNION ALL (ใช้เป็น subquery ของรายงาน)"""
+    return ' UNION ALL '.join(f"""SELECT s.datetime, s.transaction_id, si.barcode, si.title,
+                       si.quantity, si.unit_price, si.unit_cost, si.ID AS line_id
+                FROM {schema}.sales s
+                JOIN {schema}.sale_items si ON si.transaction_id = s.transaction_id
+                WHERE s.datetime >= ? AND s.datetime < ?""" for schema in schemas)
+
+def _create_archive_tables(connection, alias):
+    """สร้างตารางใน archive ด้วยโครงสร้างเดียวกับฐานข้อมูลหลัก"""
+    for table in ARCHIVE_TABLES:
+        sql = connection.execute("SELECT sql FROM main.sqlite_master WHERE type='table' AND name=?",
+                                 (table,)).fetchone()[0]
+        connection.execute(sql.replace(f'CREATE TABLE {table}',
+                                       f'CREATE TABLE IF NOT EXISTS {alias}.{table}', 1))
+    connection.execute(f'CREATE INDEX IF NOT EXISTS {alias}.idx_sales_datetime ON sales(datetime)')
+    connection.execute(f'CREATE INDEX IF NOT EXISTS {alias}.idx_sales_transaction_id ON sales(transaction_id)')
+    connection.execute(f'CREATE INDEX IF NOT EXISTS {alias}.idx_sale_items_transaction ON sale_items(transaction_id)')
+    connection.execute(f'CREATE INDEX IF NOT EXISTS {alias}.idx_credit_bills_customer ON credit_bills(customer_id)')
+
+def _archive_batch(connection, alias, sale_ids, transaction_ids):
+    """ย้ายการขายหนึ่งชุดไป archive: คัดลอกแล้ว commit ก่อน จึงค่อยลบจากฐานข้อมูลหลัก
+
+    ใช้ INSERT OR IGNORE ตาม primary key ถ้างานสะดุดกลางทางแล้วรันซ้ำจะไม่เกิดแถวซ้ำ
+    """
+    id_marks = ','.join('?' * len(sale_ids))
+    tid_marks = ','.join('?' * len(transaction_ids))
+
+    # เลขที่ขายรูปแบบเดิมอาจซ้ำกับการขายที่ยังอยู่ อย่าย้ายรายการสินค้าของเลขนั้น
+    shared = {row[0] for row in connection.execute(
+        f"""SELECT DISTINCT transaction_id FROM main.sales
+            WHERE transaction_id IN ({tid_marks}) AND ID NOT IN ({id_marks})""",
+        transaction_ids + sale_ids)}
+    line_tids = [tid for tid in transaction_ids if tid not in shared] or [None]
+    line_marks = ','.join('?' * len(line_tids))
+
+    connection.execute('BEGIN IMMEDIATE')
+    connection.execute(f'INSERT OR IGNORE INTO {alias}.sales SELECT * FROM main.sales WHERE ID IN ({id_marks})',
+                       sale_ids)
+    connection.execute(f"""INSERT OR IGNORE INTO {alias}.sale_items SELECT * FROM main.sale_items
+                           WHERE transaction_id IN ({line_marks})""", line_tids)
+    connection.execute(f"""INSERT OR IGNORE INTO {alias}.credit_bills SELECT * FROM main.credit_bills
+                           WHERE transaction_id IN ({line_marks})""", line_tids)
+    connection.commit()
+
+    connection.execute('BEGIN IMMEDIATE')
+    connection.execute(f'DELETE FROM main.credit_bills WHERE transaction_id IN ({line_marks})', line_tids)
+    connection.execute(f'DELETE FROM main.sale_items WHERE transaction_id IN ({line_marks})', line_tids)
+    connection.execute(f'DELETE FROM main.sales WHERE ID IN ({id_marks})', sale_ids)
+    connection.commit()
+
+def _archive_bill_batch(connection, alias, bill_ids):
+    """ย้ายบิลเครดิตที่ไม่มีการขายคู่กันใน main.sales (ทำแบบเดียวกับ _archive_batch)"""
+    marks = ','.join('?' * len(bill_ids))
+    connection.execute('BEGIN IMMEDIATE')
+    connection.execute(f'INSERT OR IGNORE INTO {alias}.credit_bills SELECT * FROM main.credit_bills '
+                       f'WHERE bill_id IN ({marks})', bill_ids)
+    connection.commit()
+    connection.execute('BEGIN IMMEDIATE')
+    connection.execute(f'DELETE FROM main.credit_bills WHERE bill_id IN ({marks})', bill_ids)
+    connection.commit()
+
+@_timed
+def archive_old_sales(days=365, batch_size=ARCHIVE_BATCH):
+    """ย้ายการขาย (พร้อม sale_items และบิลเครดิตที่ชำระแล้ว) ที่เก่ากว่า days วันไปไฟล์ archive
+
+    ทำทีละ batch_size บิล แต่ละชุดใช้ transaction สั้นๆ หน้าขายจึงบันทึกแทรกได้ระหว่างชุด
+    การขายที่มีบิลเครดิตค้างชำระจะยังอยู่ในฐานข้อมูลหลัก บิลเครดิตที่ชำระแล้วแต่ไม่มีการขายคู่กัน
+    ถูกย้ายตามวันที่ของบิล คืนค่าจำนวนบิลขายที่ย้าย
+    """
+    cutoff_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+    # บิลเครดิตที่ชำระแล้วแต่ไม่มีการขายคู่กัน (บิลที่สร้างเอง/บิลเก่าที่ transaction_id ว่าง)
+    # เลือกตามวันที่ของบิลเอง ไม่เช่นนั้นจะค้างในฐานข้อมูลหลักตลอดไป
+    bill_command = '''SELECT bill_id, substr(COALESCE(bill_date, payment_date), 1, 4) FROM main.credit_bills cb
+                WHERE COALESCE(bill_date, payment_date) < ?
+                AND substr(COALESCE(bill_date, payment_date), 1, 4) GLOB '[0-9][0-9][0-9][0-9]'
+                AND status NOT IN ('PENDING', 'PARTIAL')
+                AND (transaction_id IS NULL
+                     OR NOT EXISTS (SELECT 1 FROM main.sales s WHERE s.transaction_id = cb.transaction_id))
+                LIMIT ?'''
+    command = '''SELECT ID, transaction_id, substr(datetime, 1, 4) FROM main.sales s
+                WHERE datetime < ?
+                AND NOT EXISTS (SELECT 1 FROM main.credit_bills cb
+                                WHERE cb.transaction_id = s.transaction_id
+                                AND cb.status IN ('PENDING', 'PARTIAL'))
+                ORDER BY datetime
+                LIMIT ?'''
+    os.makedirs(_archive_dir(), exist_ok=True)
+    archived = 0
+    archived_bills = 0
+    created = set()
+
+    @contextmanager
+    def archive_alias(connection, year):
+        # attach ทีละปีเฉพาะระหว่างย้ายชุดนั้น (SQLite attach พร้อมกันได้ไม่เกิน 10 ไฟล์)
+        alias = _attach_archive(connection, year, readonly=False)
+        try:
+            if alias not in created:
+                _create_archive_tables(connection, alias)
+                connection.commit()
+                created.add(alias)
+            yield alias
+        finally:
+            _detach_archive(connection, alias)
+
+    while True:
+        with db.writer() as connection:
+            rows = connection.execute(command, (cutoff_date, batch_size)).fetchall()
+            if not rows:
+                break
+            by_year = {}
+            for sale_id, transaction_id, year in rows:
+                ids, tids = by_year.setdefault(year, ([], []))
+                ids.append(sale_id)
+                tids.append(transaction_id)
+            for year, (ids, tids) in by_year.items():
+                with archive_alias(connection, year) as alias:
+                    _archive_batch(connection, alias, ids, tids)
+        archived += len(rows)
+
+    while True:
+        with db.writer() as connection:
+            rows = connection.execute(bill_command, (cutoff_date, batch_size)).fetchall()
+            if not rows:
+                break
+            by_year = {}
+            for bill_id, year in rows:
+                by_year.setdefault(year, []).append(bill_id)
+            for year, bill_ids in by_year.items():
+                with archive_alias(connection, year) as alias:
+                    _archive_bill_batch(connection, alias, bill_ids)
+        archived_bills += len(rows)
+
+    print(f'Archived {archived} old sales records and {archived_bills} unlinked credit bills to {_archive_dir()}')
+    return archived
 
 # ==================== UTILITY FUNCTIONS ====================
 
 def cleanup_old_data(days=365):
-    """ลบข้อมูลเก่าที่เกินกำหนด (ระวัง!)"""
-    with conn:
-        cutoff_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
-        
-        # ลบ transactions เก่า (ไม่รวมบิลเครดิตที่ยังไม่ชำระ)
-        command = '''DELETE FROM sales 
-                    WHERE date(datetime) < ? 
-                    AND transaction_id NOT IN (
-                        SELECT transaction_id FROM credit_bills 
-                        WHERE status IN ('PENDING', 'PARTIAL')
-                    )'''
-        c.execute(command, (cutoff_date,))
-        deleted_sales = c.rowcount
-        
-        conn.commit()
-        print(f'Cleaned up {deleted_sales} old sales records')
-        return deleted_sales
-
-def backup_database(backup_path='backup_posdb.sqlite3'):
-    """สำรองฐานข้อมูล"""
+    """ย้ายข้อมูลการขายที่เก่ากว่า days วันไปไฟล์ archive รายปี (ไม่ลบประวัติทิ้งแล้ว)"""
+    return archive_old_sales(days)
+
+BACKUP_DIR = 'backups'
+BACKUP_KEEP = 14                 # เก็บไฟล์สำรองล่าสุดไว้กี่ชุด
+BACKUP_PAGES_PER_STEP = 256      # คัดลอกครั้งละกี่ page (ปล่อย lock ระหว่างรอบ)
+BACKUP_STEP_SLEEP = 0.005        # พักระหว่างรอบ (วินาที) ให้งานขายได้ทำงาน
+BACKUP_MAX_RESTARTS = 3          # ถ้ามีการเขียนแทรกจนต้องเริ่มใหม่เกินนี้ ให้คัดลอกรวดเดียว
+
+class _BackupRestarted(Exception):
+    pass
+
+# ชื่อไฟล์สำรองที่เสร็จแล้วเท่านั้น (ไม่รวม *.tmp ที่กำลังเขียนอยู่)
+BACKUP_NAME = re.compile(r'posdb-\d{8}-\d{6}\.sqlite3(\.gz)?')
+
+def _rotate_backups(folder, keep):
+    """ลบไฟล์สำรองเก่าที่เกินจำนวน keep (ชื่อไฟล์มี timestamp จึงเรียงตามเวลาได้)"""
+    backups = sorted(name for name in os.listdir(folder) if BACKUP_NAME.fullmatch(name))
+    for name in backups[:-keep] if keep > 0 else []:
+        os.remove(os.path.join(folder, name))
+        print(f'Removed old backup {name}')
+
+def backup_database(backup_path=None, progress=None, compress=True, keep=BACKUP_KEEP):
+    """สำรองฐานข้อมูลขณะเปิดใช้งานด้วย SQLite backup API
+
+    อ่านผ่าน reader (WAL) ทีละ BACKUP_PAGES_PER_STEP page จึงไม่บล็อกการบันทึกการขาย
+    ถ้าไม่ระบุ backup_path จะสร้าง backups/posdb-YYYYmmdd-HHMMSS.sqlite3.gz และลบชุดเก่า
+    ไฟล์สำรองจะถูกตรวจด้วย PRAGMA quick_check ก่อนบีบอัด
+    progress(คัดลอกแล้ว, ทั้งหมด) ถูกเรียกจาก thread ที่สำรอง
+    คืนค่า path ของไฟล์สำรอง หรือ None ถ้าล้มเหลว
+    """
+    import gzip
     import shutil
+
+    rotating = backup_path is None
+    if rotating:
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        backup_path = os.path.join(BACKUP_DIR, f'posdb-{stamp}.sqlite3')
+    temp_path = backup_path + '.tmp'
+
+    # ถ้ามีการเขียนระหว่างรอบ SQLite จะเริ่มคัดลอกใหม่ทั้งหมด (remaining เพิ่มขึ้น)
+    state = {'remaining': None, 'restarts': 0}
+
+    def on_progress(status, remaining, total):
+        if state['remaining'] is not None and remaining > state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > BACKUP_MAX_RESTARTS:
+                raise _BackupRestarted()
+        state['remaining'] = remaining
+        if progress:
+            progress(total - remaining, total)
+
     try:
-        shutil.copy2('posdb.sqlite3', backup_path)
+        source = db.reader()
+        target = sqlite3.connect(temp_path)
+        try:
+            try:
+                source.backup(target, pages=BACKUP_PAGES_PER_STEP, progress=on_progress,
+                              sleep=BACKUP_STEP_SLEEP)
+            except _BackupRestarted:
+                # ร้านขายถี่จนรอบย่อยไม่จบ: คัดลอกจาก snapshot เดียว (WAL ไม่บล็อกผู้เขียน)
+                source.backup(target, pages=-1, progress=on_progress)
+            # ไฟล์สำรองไม่ต้องใช้ WAL จะได้เปิดแบบอ่านอย่างเดียวได้โดยไม่ต้องมี -shm
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+
+        # ตรวจไฟล์ที่ได้ก่อนนำไปใช้
+        check = sqlite3.connect(f'file:{pathname2url(os.path.abspath(temp_path))}?mode=ro', uri=True)
+        try:
+            result = check.execute('PRAGMA quick_check').fetchone()[0]
+        finally:
+            check.close()
+        if result != 'ok':
+            raise sqlite3.DatabaseError(f'quick_check failed: {result}')
+
+        if compress:
+            # บีบอัดลงไฟล์ชั่วคราวก่อน ไฟล์ .gz ที่ยังเขียนไม่เสร็จจึงไม่มีชื่อเหมือนไฟล์สำรองจริง
+            backup_path += '.gz'
+            with open(temp_path, 'rb') as src, gzip.open(backup_path + '.tmp', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(backup_path + '.tmp', backup_path)
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, backup_path)
+
+        if rotating:
+            _rotate_backups(BACKUP_DIR, keep)
         print(f'✅ Database backed up to {backup_path}')
-        return True
+        return backup_path
     except Exception as e:
+        for path in (temp_path, backup_path + '.tmp'):
+            if os.path.exists(path):
+                os.remove(path)
         print(f'❌ Backup failed: {e}')
+        return None
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            db.release_reader()
+
+def backup_database_async(done=None, progress=None, **kwargs):
+    """สำรองฐานข้อมูลใน background thread แล้วเรียก done(path หรือ None) เมื่อเสร็จ
+
+    done/progress ถูกเรียกจาก thread สำรอง ฝั่ง Tkinter ต้องส่งต่อเข้า main thread เอง
+    """
+    def run():
+        path = backup_database(progress=progress, **kwargs)
+        if done:
+            done(path)
+
+    thread = threading.Thread(target=run, name='pos-backup', daemon=True)
+    thread.start()
+    return thread
+
+VACUUM_PROGRESS_OPS = 100000     # เรียก progress ระหว่าง VACUUM ทุกกี่คำสั่งของ SQLite VM
+
+def needs_vacuum_conversion():
+    """ไฟล์เดิม (สร้างก่อนตั้ง auto_vacuum=INCREMENTAL) ยังต้องแปลงด้วย convert_to_incremental_vacuum()"""
+    if db.in_memory:
         return False
+    # อ่านผ่าน connection เขียน: connection อ่านจำค่า auto_vacuum ตอนเปิดไว้ ไม่เห็นผลของการแปลง
+    with db.writer() as connection:
+        return connection.execute('PRAGMA auto_vacuum').fetchone()[0] != 2
+
+@_timed
+def convert_to_incremental_vacuum(progress=None):
+    """เปลี่ยนไฟล์เป็น auto_vacuum=INCREMENTAL ด้วย VACUUM เต็มรูปแบบหนึ่งครั้ง
+
+    ทำครั้งเดียวต่อไฟล์ หลังจากนั้นงานดูแลตอนว่างคืนพื้นที่ทีละส่วนด้วย incremental_vacuum ได้
+    ใช้เวลาตามขนาดไฟล์และถือ connection เขียนตลอด (ขายไม่ได้ระหว่างนั้น) จึงไม่อยู่ในงบเวลาของ maintenance
+    progress(วินาทีที่ผ่านไป) ถูกเรียกจาก thread ที่แปลง คืนค่า True ถ้าแปลงสำเร็จหรือแปลงไว้แล้ว
+    """
+    start = time.perf_counter()
 
+    def on_progress():
+        if progress:
+            progress(time.perf_counter() - start)
+        return 0
+
+    try:
+        with db.writer() as connection:
+            if connection.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+                return True
+            pages = connection.execute('PRAGMA page_count').fetchone()[0]
+            print(f'Converting database to auto_vacuum=INCREMENTAL ({pages} pages)...')
+            connection.set_progress_handler(on_progress, VACUUM_PROGRESS_OPS)
+            try:
+                connection.execute('PRAGMA auto_vacuum=INCREMENTAL')
+                connection.execute('VACUUM')
+            finally:
+                connection.set_progress_handler(None, 0)
+            mode = connection.execute('PRAGMA auto_vacuum').fetchone()[0]
+        if mode != 2:
+            raise sqlite3.DatabaseError(f'auto_vacuum is still {mode} after VACUUM')
+        print(f'✅ Database converted to auto_vacuum=INCREMENTAL ({time.perf_counter() - start:.1f} s)')
+        return True
+    except Exception as e:
+        print(f'❌ auto_vacuum conversion failed: {e}')
+        return False
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            db.release_reader()
+
+def convert_to_incremental_vacuum_async(done=None, progress=None):
+    """convert_to_incremental_vacuum ใน background thread แล้วเรียก done(True/False) เมื่อเสร็จ"""
+    def run():
+        converted = convert_to_incremental_vacuum(progress=progress)
+        if done:
+            done(converted)
+
+    thread = threading.Thread(target=run, name='pos-vacuum', daemon=True)
+    thread.start()
+    return thread
+
+@_timed
+def get_stats():
+    """อ่านตัวนับทั้งหมดจากตาราง stats (อัปเดตโดย trigger) คืนค่า {ชื่อ: ค่า}"""
+    return dict(db.reader().execute('SELECT name, value FROM stats'))
+
+@_timed
+def reconcile_stats(fix=True):
+    """คำนวณตัวนับใหม่จากข้อมูลจริง แล้วรายงานตัวที่ไม่ตรง {ชื่อ: (ค่าที่เก็บ, ค่าจริง)}
+
+    fix=True จะแก้ค่าในตาราง stats ให้ตรงกับค่าจริง
+    """
+    drift = {}
+    with db.writer() as connection:
+        connection.execute('BEGIN IMMEDIATE')
+        stored = dict(connection.execute('SELECT name, value FROM stats'))
+        for name, command in STATS_QUERIES.items():
+            actual = connection.execute(command).fetchone()[0]
+            if name not in stored or abs(stored[name] - actual) > 0.005:
+                drift[name] = (stored.get(name), actual)
+                if fix:
+                    connection.execute('INSERT OR REPLACE INTO stats (name, value) VALUES (?, ?)',
+                                       (name, actual))
+    for name, (stored_value, actual) in drift.items():
+        print(f'⚠️ stats.{name}: stored {stored_value}, actual {actual}')
+    print(f'Reconciled stats: {len(drift)} counters drifted')
+    return drift
+
+@_timed
 def get_database_info():
     """แสดงข้อมูลสถิติฐานข้อมูล"""
-    with conn:
-        info = {}
-        
-        c.execute("SELECT COUNT(*) FROM product")
-        info['total_products'] = c.fetchone()[0]
-        
-        c.execute("SELECT COUNT(*) FROM sales")
-        info['total_sales'] = c.fetchone()[0]
-        
-        c.execute("SELECT COUNT(*) FROM customers")
-        info['total_customers'] = c.fetchone()[0]
-        
-        c.execute("SELECT COUNT(*) FROM credit_bills")
-        info['total_credit_bills'] = c.fetchone()[0]
-        
-        c.execute("SELECT COUNT(*) FROM credit_bills WHERE status IN ('PENDING', 'PARTIAL')")
-        info['pending_bills'] = c.fetchone()[0]
-        
-        return info
+    counters = get_stats()
+    return {name: int(counters[name]) for name in
+            ('total_products', 'total_sales', 'total_customers', 'total_credit_bills', 'pending_bills')}
 
 # ==================== TESTING ====================
 
+def test_date_range_index():
+    """ตรวจ EXPLAIN QUERY PLAN ว่า query ตามช่วงวันที่ใช้ idx_sales_datetime"""
+    connection = db.reader()
+    statements = []
+    connection.set_trace_callback(statements.append)
+    try:
+        get_sales_by_date_range('2024-01-01', '2024-01-31')
+        get_sale_lines_by_date_range('2024-01-01', '2024-01-31')
+        get_product_sales_summary('2024-01-01', '2024-01-31')
+        get_daily_sales_summary('2024-01-01', '2024-01-31')
+    finally:
+        connection.set_trace_callback(None)
+
+    passed = True
+    for sql in statements:
+        # ค่าพารามิเตอร์ไม่มีผลต่อแผน จึงผูก NULL แทนได้ (กรณี trace ไม่ได้แทนค่าให้)
+        plan = connection.execute('EXPLAIN QUERY PLAN ' + sql, (None,) * sql.count('?')).fetchall()
+        details = [row[3] for row in plan]
+        # ต้องเป็น SEARCH (ค้นช่วงใน index) ไม่ใช่ SCAN ที่ไล่ทั้ง index/ตาราง
+        uses_index = any(detail.startswith('SEARCH') and 'idx_sales_datetime' in detail
+                         for detail in details)
+        full_scan = any(detail.startswith('SCAN') for detail in details)
+        name = ' '.join(sql.split())[:70]
+        if uses_index and not full_scan:
+            print(f'✅ {name}')
+        else:
+            passed = False
+            print(f'❌ {name}')
+            for detail in details:
+                print(f'      {detail}')
+    return passed
+
+
 if __name__ == '__main__':
+    import sys
+
+    init_db_from_args(sys.argv)
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'test':
+        sys.exit(0 if test_date_range_index() else 1)
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'reconcile':
+        # คำนวณตัวนับในตาราง stats ใหม่และแสดงค่าที่คลาดเคลื่อน
+        reconcile_stats()
+        sys.exit(0)
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--stats':
+        # แสดงสถิติที่โปรแกรมบันทึกไว้ตอนปิด (ต้องรันโปรแกรมด้วย POS_QUERY_STATS=1)
+        stats_path = sys.argv[2] if len(sys.argv) > 2 else QUERY_STATS_FILE
+        if not os.path.exists(stats_path):
+            print(f'❌ ไม่พบไฟล์สถิติ {stats_path} (รันโปรแกรมด้วย POS_QUERY_STATS=1 ก่อน)')
+            sys.exit(1)
+        with open(stats_path, encoding='utf-8') as f:
+            print(format_query_stats(json.load(f)))
+        sys.exit(0)
+
     print("=" * 60)
     print("POS Database System - Version 1.4 (Credit System)")
     print("=" * 60)
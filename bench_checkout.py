@@ -0,0 +1,167 @@
+# bench_checkout.py - วัดเวลา commit ต่อการขาย 1 บิล ภายใต้การตั้งค่า journal/synchronous ต่างๆ
+#
+# ใช้งาน: python bench_checkout.py [จำนวนบิล] [โฟลเดอร์ทดสอบ]
+# ท้ายสุดวัดช่วงคิวยาว (BURST_CUSTOMERS บิลติดกัน) เทียบ commit_sale กับ sale journal
+# ทั้งตอนฐานข้อมูลว่าง และตอนมีงานเขียนอื่นถือ connection อยู่ (นำเข้าราคาสินค้าวนซ้ำใน thread อื่น
+# แทนงานหลังร้าน/ดูแลฐานข้อมูลที่เขียนพร้อมกับการขาย)
+# ช่วงฐานข้อมูลว่าง journal ไม่ได้เร็วกว่า (all acked ใกล้เคียงหรือช้ากว่า commit_sale เล็กน้อย)
+# ความต่างอยู่ที่ max/all acked ช่วงที่มีงานเขียนอื่น ซึ่ง commit_sale ต้องรองานนั้นจบ
+# ควรรันบนเครื่องและดิสก์เดียวกับเครื่อง POS จริง เพราะเวลา fsync ขึ้นกับฮาร์ดดิสก์
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+SETTINGS = [
+    # (ชื่อ, journal_mode, synchronous)
+    ('rollback journal / FULL (เดิม)', 'DELETE', 'FULL'),
+    ('WAL / FULL', 'WAL', 'FULL'),
+    ('WAL / NORMAL', 'WAL', 'NORMAL'),
+]
+
+PRODUCT_COUNT = 500
+ITEMS_PER_SALE = 5
+BURST_CUSTOMERS = 20
+BURST_ROUNDS = 10
+BACKGROUND_PRODUCTS = 1000    # จำนวนสินค้าที่งานเขียนเบื้องหลังนำเข้าต่อรอบ
+
+
+def make_products(basicsql, path, **settings):
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    with contextlib.redirect_stdout(io.StringIO()):
+        basicsql.init_db(path, **settings)
+        basicsql.upsert_products((f'B{i:05d}', f'สินค้า {i}', 10.0, 6.0, 1000000,
+                                  'ชิ้น', 'ทดสอบ', 5, '') for i in range(PRODUCT_COUNT))
+
+
+def make_sale(n):
+    cart = [[f'B{(n * ITEMS_PER_SALE + k) % PRODUCT_COUNT:05d}', 'สินค้า', 10.0, 1]
+            for k in range(ITEMS_PER_SALE)]
+    payment = {'subtotal': 50.0, 'vat': 3.5, 'grand_total': 53.5,
+               'received_amount': 100.0, 'change_amount': 46.5}
+    return cart, payment
+
+
+def run_setting(basicsql, folder, name, journal_mode, synchronous, sales):
+    """สร้างฐานข้อมูลใหม่ตามการตั้งค่า แล้ววัดเวลา commit_sale ทีละบิล"""
+    # สลับ connection ของ basicsql ไปยังไฟล์ทดสอบ
+    path = os.path.join(folder, f'bench_{journal_mode}_{synchronous}.sqlite3')
+    make_products(basicsql, path, synchronous=synchronous, journal_mode=journal_mode)
+
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for n in range(sales):
+            cart, payment = make_sale(n)
+            start = time.perf_counter()
+            basicsql.commit_sale(cart, payment)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f'{name:<32} mean {statistics.mean(latencies):7.2f} ms   '
+          f'p50 {statistics.median(latencies):7.2f} ms   p95 {p95:7.2f} ms   '
+          f'max {latencies[-1]:7.2f} ms')
+
+
+def background_writer(basicsql, stop, durations):
+    """นำเข้าราคาสินค้า BACKGROUND_PRODUCTS รายการวนซ้ำจนกว่าจะ stop (ถือ connection เขียนทุกรอบ)"""
+    rows = [(f'I{i:05d}', f'นำเข้า {i}', 10.0, 6.0, 100, 'ชิ้น', 'นำเข้า', 5, '')
+            for i in range(BACKGROUND_PRODUCTS)]
+    price = 10.0
+    try:
+        while not stop.is_set():
+            price += 0.25
+            start = time.perf_counter()
+            basicsql.upsert_products((row[0], row[1], price) + row[3:] for row in rows)
+            durations.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.01)
+    finally:
+        basicsql.db.release_reader()
+
+
+def run_burst(basicsql, folder, use_journal, background=False):
+    """ลูกค้า BURST_CUSTOMERS คนจ่ายเงินติดกัน คืนค่า (เวลาตอบกลับแต่ละบิล, เวลาจนตอบครบ, เวลาจนบันทึกลงฐานข้อมูลครบ)"""
+    import sale_journal
+    name = ('journal' if use_journal else 'direct') + ('_busy' if background else '')
+    make_products(basicsql, os.path.join(folder, f'bench_burst_{name}.sqlite3'))
+    acks, acked, applied = [], [], []
+    stop, durations = threading.Event(), []
+    with contextlib.redirect_stdout(io.StringIO()):
+        basicsql.catalog.load()
+        journal = sale_journal.SaleJournal().open() if use_journal else None
+        writer = None
+        if background:
+            writer = threading.Thread(target=background_writer, args=(basicsql, stop, durations))
+            writer.start()
+            time.sleep(0.2)
+        try:
+            for burst in range(BURST_ROUNDS):
+                start = time.perf_counter()
+                for n in range(BURST_CUSTOMERS):
+                    cart, payment = make_sale(burst * BURST_CUSTOMERS + n)
+                    sale_start = time.perf_counter()
+                    if journal is not None:
+                        journal.submit(cart, payment)
+                    else:
+                        basicsql.commit_sale(cart, payment)
+                    acks.append((time.perf_counter() - sale_start) * 1000)
+                acked.append((time.perf_counter() - start) * 1000)
+                if journal is not None:
+                    journal.flush()
+                applied.append((time.perf_counter() - start) * 1000)
+        finally:
+            stop.set()
+            if writer is not None:
+                writer.join()
+            if journal is not None:
+                journal.close()
+    if durations:
+        print(f'  (background import: {len(durations)} runs, median {statistics.median(durations):.0f} ms each)')
+    sales = basicsql.db.reader().execute('SELECT COUNT(*) FROM sales').fetchone()[0]
+    if sales != BURST_ROUNDS * BURST_CUSTOMERS:
+        raise RuntimeError(f'{name}: expected {BURST_ROUNDS * BURST_CUSTOMERS} sales, found {sales}')
+    return acks, acked, applied
+
+
+def report_burst(name, acks, acked, applied):
+    acks = sorted(acks)
+    p95 = acks[int(len(acks) * 0.95) - 1]
+    print(f'{name:<32} ack p50 {statistics.median(acks):7.2f} ms   p95 {p95:7.2f} ms   max {acks[-1]:7.2f} ms   '
+          f'all acked {statistics.median(acked):7.1f} ms   all saved {statistics.median(applied):7.1f} ms')
+
+
+def main():
+    sales = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    folder = sys.argv[2] if len(sys.argv) > 2 else tempfile.mkdtemp(prefix='posbench_')
+    os.makedirs(folder, exist_ok=True)
+
+    # import basicsql จากโฟลเดอร์ทดสอบ เพื่อไม่ให้แตะ posdb.sqlite3 ของร้าน
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(folder)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import basicsql
+
+    print('=' * 100)
+    print(f'Checkout commit latency: {sales} sales x {ITEMS_PER_SALE} items, folder {folder}')
+    print('=' * 100)
+    for name, journal_mode, synchronous in SETTINGS:
+        run_setting(basicsql, folder, name, journal_mode, synchronous, sales)
+
+    print('=' * 100)
+    print(f'Burst: {BURST_CUSTOMERS} customers back to back x {BURST_ROUNDS} rounds (median per round)')
+    print('=' * 100)
+    report_burst('commit_sale (direct)', *run_burst(basicsql, folder, use_journal=False))
+    report_burst('sale journal (write-behind)', *run_burst(basicsql, folder, use_journal=True))
+    print(f'-- with a background writer importing {BACKGROUND_PRODUCTS} products in a loop --')
+    report_burst('commit_sale (direct)', *run_burst(basicsql, folder, use_journal=False, background=True))
+    report_burst('sale journal (write-behind)', *run_burst(basicsql, folder, use_journal=True, background=True))
+
+
+if __name__ == '__main__':
+    main()
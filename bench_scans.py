@@ -0,0 +1,217 @@
+# bench_scans.py - วัดเวลาตั้งแต่สแกน 500 ครั้งติดกัน (burst) จนหน้าจอแสดงผลสุดท้าย
+#
+# ใช้งาน: python bench_scans.py [จำนวนสแกน] [โฟลเดอร์ทดสอบ]
+# เทียบ 2 แบบ:
+#   ทีละสแกน  - แบบเดิม: ค้นฐานข้อมูล สร้างตารางใหม่ทั้งตาราง และตั้ง timer ใหม่ทุกครั้งที่สแกน
+#   คิว       - ScanQueue: ต่อคิวแล้วใส่ตะกร้าและอัปเดตตารางครั้งเดียวต่อรอบ after_idle
+# ถ้าเปิดหน้าต่าง Tk ได้จะวัดกับ ttk.Treeview จริง (หน้าต่างถูกซ่อน) ถ้าไม่ได้จะวัดเฉพาะส่วนค้นหา/ตะกร้า
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+try:
+    import tkinter
+    from tkinter import ttk
+except ImportError:
+    tkinter = None
+
+PRODUCT_COUNT = 5000
+DISTINCT_ITEMS = 60           # จำนวนสินค้าไม่ซ้ำในตะกร้า (burst มีสแกนซ้ำ)
+UNKNOWN_RATE = 0.01           # สัดส่วน barcode ที่ไม่มีในระบบ
+
+
+def make_database(basicsql, folder):
+    path = os.path.join(folder, 'bench_scans.sqlite3')
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    with contextlib.redirect_stdout(io.StringIO()):
+        basicsql.init_db(path)
+        basicsql.upsert_products((f'S{i:06d}', f'สินค้า {i}', 10.0 + i % 90, 6.0, 1000000,
+                                  'ชิ้น', 'ทดสอบ', 5, '') for i in range(PRODUCT_COUNT))
+
+
+def make_burst(scans):
+    rng = random.Random(42)
+    items = [f'S{rng.randrange(PRODUCT_COUNT):06d}' for _ in range(DISTINCT_ITEMS)]
+    return [f'X{n:06d}' if rng.random() < UNKNOWN_RATE else rng.choice(items)
+            for n in range(scans)]
+
+
+def row_values(item):
+    price = float(item[2])
+    return [item[0], item[1], f'{price:,.2f}', item[3], f'{price * item[3]:,.2f}']
+
+
+def per_scan_lookup(basicsql, barcode):
+    """ค้นแบบเดิม (อ่านจากฐานข้อมูลทุกครั้ง ไม่ผ่าน catalog)"""
+    command = 'SELECT barcode,title,price,cost,quantity,unit,category,reorder_point FROM product WHERE barcode=(?)'
+    row = basicsql.db.reader().execute(command, (barcode,)).fetchone()
+    return list(row) if row else None
+
+
+class TkTable:
+    """ตารางตะกร้าบน ttk.Treeview จริง"""
+
+    def __init__(self):
+        self.root = tkinter.Tk()
+        self.root.withdraw()
+        self.table = ttk.Treeview(self.root, columns=[1, 2, 3, 4, 5], show='headings')
+        self.table.pack()
+        self.total = tkinter.StringVar(self.root)
+        self.rows = {}
+        self.timer = None
+
+    def rebuild(self, cart):
+        self.table.delete(*self.table.get_children())
+        for item in cart.values():
+            self.table.insert('', 'end', values=row_values(item))
+        self.total.set(f'{cart.totals()[2]:,.2f}')
+
+    def update_rows(self, cart, barcodes):
+        for barcode in barcodes:
+            values = row_values(cart[barcode])
+            if barcode in self.rows:
+                self.table.item(self.rows[barcode], values=values)
+            else:
+                self.rows[barcode] = self.table.insert('', 'end', values=values)
+        self.total.set(f'{cart.totals()[2]:,.2f}')
+
+    def stack_timer(self):
+        self.root.after(2000, lambda: None)
+
+    def reuse_timer(self):
+        if self.timer is not None:
+            self.root.after_cancel(self.timer)
+        self.timer = self.root.after(2000, lambda: None)
+
+    def schedule(self, callback):
+        self.root.after_idle(callback)
+
+    def settle(self):
+        self.root.update_idletasks()
+        self.root.update()
+
+    def close(self):
+        self.root.destroy()
+
+
+class NoTable:
+    """ไม่มี tkinter/จอแสดงผล: ไม่วัดส่วนหน้าจอ และรัน callback ที่นัดไว้ต่อจาก burst (แทนรอบ idle)"""
+
+    def __init__(self):
+        self.scheduled = []
+
+    def rebuild(self, cart):
+        pass
+
+    def update_rows(self, cart, barcodes):
+        pass
+
+    def stack_timer(self):
+        pass
+
+    reuse_timer = stack_timer
+
+    def schedule(self, callback):
+        self.scheduled.append(callback)
+
+    def settle(self):
+        while self.scheduled:
+            self.scheduled.pop(0)()
+
+    def close(self):
+        pass
+
+
+def make_ui():
+    if tkinter is not None:
+        try:
+            return TkTable()
+        except tkinter.TclError:
+            pass
+    return NoTable()
+
+
+def run_per_scan(basicsql, ui, burst):
+    """แบบเดิม: ทุกสแกนค้นฐานข้อมูล สร้างตารางใหม่ และตั้ง timer เพิ่ม"""
+    from cart import Cart
+    cart = Cart()
+    start = time.perf_counter()
+    for barcode in burst:
+        data = per_scan_lookup(basicsql, barcode)
+        if data:
+            cart.add(data[0], data[1], data[2], 1)
+        ui.rebuild(cart)
+        ui.stack_timer()
+    ui.settle()
+    return (time.perf_counter() - start) * 1000, cart
+
+
+def run_queue(ui, burst):
+    """ScanQueue: burst ทั้งหมดเข้าคิวก่อนรอบ idle แล้วอัปเดตหน้าจอครั้งเดียว"""
+    from cart import Cart
+    from scan_queue import ScanQueue
+    cart = Cart()
+    flushes = []
+
+    def applied(result):
+        flushes.append(result['scans'])
+        ui.update_rows(cart, result['changed'])
+        ui.reuse_timer()
+
+    queue = ScanQueue(cart, schedule=ui.schedule, on_applied=applied)
+    start = time.perf_counter()
+    for barcode in burst:
+        queue.put(barcode)
+    ui.settle()
+    return (time.perf_counter() - start) * 1000, cart, flushes
+
+
+def main():
+    scans = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    folder = sys.argv[2] if len(sys.argv) > 2 else tempfile.mkdtemp(prefix='posbench_')
+    os.makedirs(folder, exist_ok=True)
+    os.environ.setdefault('POS_DB_PATH', os.path.join(folder, 'bench_scans.sqlite3'))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import basicsql
+    make_database(basicsql, folder)
+    with contextlib.redirect_stdout(io.StringIO()):
+        basicsql.catalog.load()
+    burst = make_burst(scans)
+
+    print(f'Scan burst: {scans} scans, {DISTINCT_ITEMS} distinct products, '
+          f'{PRODUCT_COUNT} products in database')
+    ui = make_ui()
+    if isinstance(ui, NoTable):
+        print('Tk display not available: timing lookup + cart only (no Treeview)')
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            old_ms, old_cart = run_per_scan(basicsql, ui, burst)
+    finally:
+        ui.close()
+    ui = make_ui()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            new_ms, new_cart, flushes = run_queue(ui, burst)
+    finally:
+        ui.close()
+
+    if old_cart.totals() != new_cart.totals() or len(old_cart) != len(new_cart):
+        print('❌ Final cart differs between the two paths')
+        sys.exit(1)
+
+    print(f'{"per-scan (old)":<16} {old_ms:9.1f} ms to final state   {old_ms * 1000 / scans:8.1f} µs/scan')
+    print(f'{"queued":<16} {new_ms:9.1f} ms to final state   {new_ms * 1000 / scans:8.1f} µs/scan   '
+          f'{len(flushes)} UI update(s)')
+    print(f'Speed-up: {old_ms / new_ms:.1f}x   cart: {len(new_cart)} lines, '
+          f'total {new_cart.totals()[2]:,.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# bench_streaming.py - เทียบหน่วยความจำระหว่าง view_transactions() (fetchall)
+# กับ iter_transactions() (fetchmany ทีละชุด) บนตาราง sales ขนาดใหญ่
+#
+# ใช้งาน: python bench_streaming.py [จำนวนแถว] [โฟลเดอร์ทดสอบ]
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+SEED_BATCH = 10000
+
+
+def seed_sales(basicsql, rows):
+    """เติมตาราง sales ด้วยข้อมูลจำลองจนครบจำนวนแถว"""
+    existing = basicsql.db.reader().execute('SELECT COUNT(*) FROM sales').fetchone()[0]
+    if existing >= rows:
+        return
+    items = json.dumps([['B00001', 'สินค้าทดสอบ', 10.0, 2], ['B00002', 'สินค้าทดสอบ', 25.0, 1]])
+    command = 'INSERT INTO sales VALUES (?,?,?,?,?,?,?,?,?)'
+    with basicsql.db.writer() as connection:
+        for start in range(existing, rows, SEED_BATCH):
+            batch = []
+            for n in range(start, min(start + SEED_BATCH, rows)):
+                day = f'2024-{n % 12 + 1:02d}-{n % 28 + 1:02d} {n % 24:02d}:{n % 60:02d}:00'
+                batch.append((None, f'T{n + 1:07d}', day, 45.0, 3.15, 48.15, 50.0, 1.85, items))
+            connection.executemany(command, batch)
+
+
+def measure(label, consume):
+    """วัดเวลาและหน่วยความจำสูงสุดของ consume()"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = consume()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{label:<36} rows {count:>9,}   time {elapsed:6.2f} s   peak {peak / 1024 / 1024:8.1f} MB')
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    folder = sys.argv[2] if len(sys.argv) > 2 else tempfile.mkdtemp(prefix='posbench_')
+    os.makedirs(folder, exist_ok=True)
+
+    # import basicsql จากโฟลเดอร์ทดสอบ เพื่อไม่ให้แตะ posdb.sqlite3 ของร้าน
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(folder)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import basicsql
+
+    print('=' * 100)
+    print(f'Sales query memory: {rows:,} rows, folder {folder}')
+    print('=' * 100)
+    seed_sales(basicsql, rows)
+
+    def fetch_all():
+        total = 0
+        for sale in basicsql.view_transactions():
+            total += 1
+        return total
+
+    def stream():
+        total = 0
+        for sale in basicsql.iter_transactions():
+            total += 1
+        return total
+
+    measure('view_transactions() (fetchall)', fetch_all)
+    measure('iter_transactions() (fetchmany)', stream)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# cart.py - ตะกร้าสินค้าของหน้าขาย เก็บยอดรวมแบบสะสม (ไม่ต้องรวมใหม่ทั้งตะกร้าทุกครั้งที่สแกน)
+
+VAT_RATE = 0.07
+
+class Cart:
+    """ตะกร้าสินค้า {barcode: [barcode, title, price, quantity]}
+
+    อ่านได้เหมือน dict (in, [], get, values, len) แต่แก้ไขผ่าน add/remove/clear
+    เท่านั้น เพื่อให้ subtotal ถูกปรับตามทุกครั้ง
+    """
+
+    def __init__(self):
+        self._items = {}
+        self.subtotal = 0.0
+
+    def __contains__(self, barcode):
+        return barcode in self._items
+
+    def __getitem__(self, barcode):
+        return self._items[barcode]
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def get(self, barcode, default=None):
+        return self._items.get(barcode, default)
+
+    def values(self):
+        return self._items.values()
+
+    def quantity(self, barcode):
+        item = self._items.get(barcode)
+        return item[3] if item else 0
+
+    def add(self, barcode, title, price, quantity=1):
+        """เพิ่มจำนวนสินค้า (สินค้าใหม่จะถูกเพิ่มเป็นแถวใหม่) คืนค่าแถวของสินค้านั้น"""
+        item = self._items.get(barcode)
+        if item is None:
+            item = self._items[barcode] = [barcode, title, price, 0]
+        item[3] += int(quantity)
+        self.subtotal += float(item[2]) * int(quantity)
+        return item
+
+    def remove(self, barcode):
+        """เอาสินค้าออกจากตะกร้า คืนค่าแถวที่เอาออก (None ถ้าไม่มี)"""
+        item = self._items.pop(barcode, None)
+        if item is not None:
+            self.subtotal -= float(item[2]) * item[3]
+        if not self._items:
+            self.subtotal = 0.0     # ตัดเศษทศนิยมที่สะสมจากการบวกลบ float
+        return item
+
+    def clear(self):
+        self._items.clear()
+        self.subtotal = 0.0
+
+    def totals(self):
+        """คืนค่า (subtotal, vat, grand_total)"""
+        # ปัดเศษ float ที่สะสมจากการบวกทีละรายการ (เช่น 8954.999999999925 -> 8955.0)
+        subtotal = round(self.subtotal, 6)
+        vat = subtotal * VAT_RATE
+        return subtotal, vat, subtotal + vat
@@ -0,0 +1,132 @@
+# event_bus.py - แจ้งการเปลี่ยนแปลงข้อมูลระหว่างส่วนต่างๆ ของโปรแกรม (publish/subscribe)
+#
+# basicsql ประกาศ event หลัง transaction commit แล้วเท่านั้น แท็บต่างๆ ไม่ต้องเรียกรีเฟรชกันเอง
+# DirtyTabs จดว่าแท็บไหนมีข้อมูลเก่า แล้วรีเฟรชตอนที่แท็บนั้นถูกเปิดดู (แท็บที่เปิดอยู่รีเฟรชตอน idle)
+# การขายหนึ่งบิลจึงไม่ต้องรอสร้างตาราง/รายงานของแท็บที่ไม่มีใครดูอยู่
+import queue
+import threading
+
+PRODUCT_CHANGED = 'product_changed'   # barcodes: เพิ่ม/แก้ไข/ลบสินค้า
+STOCK_CHANGED = 'stock_changed'       # barcodes: จำนวนคงเหลือเปลี่ยน
+SALE_COMMITTED = 'sale_committed'     # transaction_id, bill_id, barcodes
+BILL_CHANGED = 'bill_changed'         # bill_id, customer_id: สร้าง/ชำระ/ลบบิลเครดิต
+
+EVENTS = (PRODUCT_CHANGED, STOCK_CHANGED, SALE_COMMITTED, BILL_CHANGED)
+POLL_MS = 100                 # Tk รับ event ที่มาจาก thread อื่นทุกกี่มิลลิวินาที
+
+class EventBus:
+    """เก็บ callback ต่อชื่อ event แล้วเรียกทุกตัวเมื่อ publish (callback(**payload))"""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._root = None
+        self._thread_id = None
+        self._queue = queue.Queue()   # event จาก thread อื่น รอส่งใน Tk thread
+
+    def start(self, root):
+        """หลังเรียกแล้ว event ที่ publish จาก thread อื่น (เช่น sale journal) จะถูกส่งใน Tk thread"""
+        self._root = root
+        self._thread_id = threading.get_ident()
+        root.after(POLL_MS, self._poll)
+
+    def _poll(self):
+        while True:
+            try:
+                event, payload = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._dispatch(event, payload)
+        self._root.after(POLL_MS, self._poll)
+
+    def subscribe(self, event, callback):
+        if event not in EVENTS:
+            raise ValueError(f'Unknown event: {event}')
+        self._subscribers.setdefault(event, []).append(callback)
+        return callback
+
+    def unsubscribe(self, event, callback):
+        callbacks = self._subscribers.get(event, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+
+    def publish(self, event, **payload):
+        """เรียก callback ตามลำดับที่ subscribe ตัวที่ error ไม่ทำให้ตัวอื่นไม่ได้รับ event"""
+        if self._root is not None and threading.get_ident() != self._thread_id:
+            self._queue.put((event, payload))
+            return
+        self._dispatch(event, payload)
+
+    def _dispatch(self, event, payload):
+        for callback in list(self._subscribers.get(event, [])):
+            try:
+                callback(**payload)
+            except Exception as e:
+                print(f'❌ Event {event} handler error: {e}')
+
+bus = EventBus()
+
+class DirtyTabs:
+    """รีเฟรชแท็บเมื่อถูกแสดงเท่านั้น
+
+    register(key, refresh, events, refresh_rows=None)
+        refresh(): สร้างข้อมูลทั้งแท็บใหม่
+        refresh_rows(barcodes): อัปเดตเฉพาะแถวที่เปลี่ยน (ใช้เมื่อทุก event ที่ค้างระบุ barcodes)
+    show(key): เรียกจาก CustomTabSystem.switch_tab เมื่อแท็บถูกเปิด
+    root: หน้าต่าง Tk ใช้ after_idle รีเฟรชแท็บที่เปิดอยู่ (รวมหลาย event เป็นครั้งเดียว)
+    """
+
+    def __init__(self, root=None, bus=bus):
+        self.root = root
+        self.bus = bus
+        self.tabs = {}
+        self.visible = None
+        self._scheduled = False
+
+    def register(self, key, refresh, events, refresh_rows=None):
+        self.tabs[key] = {'refresh': refresh, 'refresh_rows': refresh_rows,
+                          'dirty': False, 'full': False, 'barcodes': set()}
+        for event in events:
+            self.bus.subscribe(event, lambda key=key, **payload: self.mark(key, payload.get('barcodes')))
+
+    def mark(self, key, barcodes=None):
+        tab = self.tabs[key]
+        tab['dirty'] = True
+        if barcodes is None or tab['refresh_rows'] is None:
+            tab['full'] = True
+        else:
+            tab['barcodes'].update(str(barcode) for barcode in barcodes)
+        if key == self.visible:
+            self._schedule_visible()
+
+    def is_dirty(self, key):
+        return key in self.tabs and self.tabs[key]['dirty']
+
+    def _schedule_visible(self):
+        if self.root is None:
+            self.refresh(self.visible)
+        elif not self._scheduled:
+            self._scheduled = True
+            self.root.after_idle(self._refresh_visible)
+
+    def _refresh_visible(self):
+        self._scheduled = False
+        self.refresh(self.visible)
+
+    def show(self, key):
+        """แท็บ key ถูกเปิด รีเฟรชถ้ามีข้อมูลค้าง"""
+        self.visible = key
+        self.refresh(key)
+
+    def refresh(self, key):
+        tab = self.tabs.get(key)
+        if tab is None or not tab['dirty']:
+            return
+        full, barcodes = tab['full'], tab['barcodes']
+        tab['dirty'], tab['full'], tab['barcodes'] = False, False, set()
+        try:
+            if full:
+                tab['refresh']()
+            elif barcodes:
+                tab['refresh_rows'](sorted(barcodes))
+        except Exception as e:
+            print(f'❌ Error refreshing tab {key}: {e}')
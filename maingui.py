@@ -1,7 +1,22 @@
 from tkinter import *
 from tkinter import ttk, messagebox
 import os
+import sys
+import basicsql
 from basicsql import *
+from maintenance import MaintenanceScheduler
+from print_queue import print_queue
+import sale_journal
+from event_bus import bus, DirtyTabs, PRODUCT_CHANGED, STOCK_CHANGED, SALE_COMMITTED, BILL_CHANGED
+
+# เลือกไฟล์ฐานข้อมูลอื่นได้ด้วย python maingui.py --db สาขา2.sqlite3 (หรือตั้ง POS_DB_PATH)
+init_db_from_args(sys.argv)
+# POS_SALE_JOURNAL=1: บิลเงินสดเขียนลง journal ก่อนแล้วบันทึกลงฐานข้อมูลใน background
+# (replay บิลที่ค้างจากครั้งก่อนตรงนี้ ก่อนโหลด catalog และก่อนเริ่มขาย)
+if sale_journal.SALE_JOURNAL_ENABLED:
+    sale_journal.open_journal()
+# โหลดสินค้าทั้งหมดเข้า catalog ใน background ให้การสแกนไม่ต้องถามฐานข้อมูล
+catalog.load_async()
 
 # Color Scheme - สีสำหรับแต่ละ Tab
 COLORS = {
@@ -107,6 +122,7 @@ class CustomTabSystem:
         self.tab_frames = []
         self.tab_buttons = []
         self.current_tab = 0
+        self.on_show = None           # callback(index) เมื่อแท็บถูกแสดง (ใช้รีเฟรชแท็บที่ข้อมูลเก่า)
         
         # Container หลัก
         self.container = Frame(parent, bg=COLORS['background'])
@@ -229,6 +245,9 @@ class CustomTabSystem:
                 btn.config(bg=color, relief=FLAT, borderwidth=0)
                 if icon:
                     icon.config(bg=color)
+        
+        if self.on_show:
+            self.on_show(index)
     
     def select(self, frame):
         """สลับไปยัง Tab ตาม Frame"""
@@ -285,9 +304,143 @@ filemenu = Menu(menubar, tearoff=0,
 menubar.add_cascade(label='File', menu=filemenu)
 filemenu.add_command(label='เปิดเมนูเพิ่มสินค้า', command=switch_to_product_tab)
 filemenu.add_command(label='จัดการลูกค้าและเครดิต', command=switch_to_credit_tab)
+filemenu.add_command(label='สำรองฐานข้อมูล', command=lambda: BackupMenu())
+filemenu.add_command(label='แปลงไฟล์ฐานข้อมูล (คืนพื้นที่อัตโนมัติ)', command=lambda: VacuumConvertMenu())
+filemenu.add_command(label='สถิติการใช้ฐานข้อมูล', command=lambda: QueryStatsMenu())
 filemenu.add_separator()
 filemenu.add_command(label='ออกจากโปรแกรม', command=lambda: GUI.quit())
 
+# Backup (ทำใน background thread หน้าขายใช้งานต่อได้ระหว่างสำรอง)
+def BackupMenu(event=None):
+    GUI4 = Toplevel()
+    GUI4.geometry('420x140')
+    GUI4.configure(bg=COLORS['background'])
+    GUI4.title('สำรองฐานข้อมูล')
+    
+    status = Label(GUI4, text='กำลังสำรองฐานข้อมูล...', bg=COLORS['background'],
+                   fg=COLORS['text_dark'], font=('Helvetica', 11))
+    status.pack(pady=(20, 10))
+    bar = ttk.Progressbar(GUI4, length=360, mode='determinate', maximum=100)
+    bar.pack()
+    
+    # thread สำรองเขียนค่าลง dict ส่วน Tk อ่านผ่าน after() เท่านั้น
+    state = {'done': 0, 'total': 0, 'finished': False, 'path': None}
+    
+    def on_progress(done, total):
+        state['done'], state['total'] = done, total
+    
+    def on_done(path):
+        state['path'] = path
+        state['finished'] = True
+    
+    def poll():
+        if not GUI4.winfo_exists():
+            return
+        if state['total']:
+            bar['value'] = state['done'] * 100 / state['total']
+        if not state['finished']:
+            GUI4.after(100, poll)
+            return
+        if state['path']:
+            bar['value'] = 100
+            status.config(text=f"✅ สำรองเรียบร้อย: {state['path']}")
+        else:
+            status.config(text='❌ สำรองไม่สำเร็จ (ดูรายละเอียดใน console)')
+        ttk.Button(GUI4, text='ปิด', command=GUI4.destroy).pack(pady=10)
+    
+    backup_database_async(done=on_done, progress=on_progress)
+    poll()
+
+# แปลงไฟล์เดิมเป็น auto_vacuum=INCREMENTAL (VACUUM ครั้งเดียว ใช้เวลาตามขนาดไฟล์ ขายไม่ได้ระหว่างนั้น)
+def VacuumConvertMenu(event=None):
+    if not needs_vacuum_conversion():
+        messagebox.showinfo('แปลงไฟล์ฐานข้อมูล', 'ไฟล์ฐานข้อมูลแปลงแล้ว ไม่ต้องทำซ้ำ')
+        return
+    if not messagebox.askyesno('แปลงไฟล์ฐานข้อมูล',
+                               'ต้องจัดเรียงไฟล์ฐานข้อมูลใหม่ทั้งไฟล์หนึ่งครั้ง\n'
+                               'อาจใช้เวลาหลายนาทีและขายไม่ได้ระหว่างนั้น\n\n'
+                               'ควรสำรองฐานข้อมูลก่อน ต้องการทำต่อหรือไม่?'):
+        return
+    
+    GUI5 = Toplevel()
+    GUI5.geometry('420x140')
+    GUI5.configure(bg=COLORS['background'])
+    GUI5.title('แปลงไฟล์ฐานข้อมูล')
+    # ห้ามใช้หน้าต่างอื่นจนกว่าจะเสร็จ (หน้าขายจะรอ connection เขียนอยู่ดี)
+    GUI5.grab_set()
+    GUI5.protocol('WM_DELETE_WINDOW', lambda: None)
+    
+    status = Label(GUI5, text='กำลังแปลงไฟล์ฐานข้อมูล...', bg=COLORS['background'],
+                   fg=COLORS['text_dark'], font=('Helvetica', 11))
+    status.pack(pady=(20, 10))
+    bar = ttk.Progressbar(GUI5, length=360, mode='indeterminate')
+    bar.pack()
+    bar.start(50)
+    
+    # thread แปลงเขียนค่าลง dict ส่วน Tk อ่านผ่าน after() เท่านั้น
+    state = {'elapsed': 0, 'finished': False, 'converted': False}
+    
+    def on_progress(elapsed):
+        state['elapsed'] = elapsed
+    
+    def on_done(converted):
+        state['converted'] = converted
+        state['finished'] = True
+    
+    def poll():
+        if not state['finished']:
+            status.config(text=f"กำลังแปลงไฟล์ฐานข้อมูล... ({state['elapsed']:.0f} วินาที)")
+            GUI5.after(200, poll)
+            return
+        bar.stop()
+        GUI5.grab_release()
+        GUI5.protocol('WM_DELETE_WINDOW', GUI5.destroy)
+        if state['converted']:
+            status.config(text='✅ แปลงเรียบร้อย ระบบจะคืนพื้นที่ว่างเองตอนเครื่องว่าง')
+        else:
+            status.config(text='❌ แปลงไม่สำเร็จ (ดูรายละเอียดใน console)')
+        ttk.Button(GUI5, text='ปิด', command=GUI5.destroy).pack(pady=10)
+    
+    convert_to_incremental_vacuum_async(done=on_done, progress=on_progress)
+    poll()
+
+# Query Statistics
+def QueryStatsMenu(event=None):
+    GUI3 = Toplevel()
+    GUI3.geometry('1000x450')
+    GUI3.configure(bg=COLORS['background'])
+    GUI3.title('สถิติการใช้ฐานข้อมูล')
+    
+    text = Text(GUI3, font=('Consolas', 9), wrap=NONE)
+    text.pack(fill=BOTH, expand=True, padx=10, pady=10)
+    
+    def refresh_stats():
+        text.delete('1.0', END)
+        if not basicsql.QUERY_STATS_ENABLED:
+            text.insert(END, 'ยังไม่ได้เปิดการเก็บสถิติ (กด "เปิดการเก็บสถิติ" หรือรันด้วย POS_QUERY_STATS=1)\n\n')
+        text.insert(END, format_query_stats())
+    
+    def toggle_stats():
+        enable_query_stats(not basicsql.QUERY_STATS_ENABLED)
+        toggle_btn.config(text='ปิดการเก็บสถิติ' if basicsql.QUERY_STATS_ENABLED else 'เปิดการเก็บสถิติ')
+        refresh_stats()
+    
+    def reset_stats():
+        reset_query_stats()
+        refresh_stats()
+    
+    button_frame = Frame(GUI3, bg=COLORS['background'])
+    button_frame.pack(pady=(0, 10))
+    toggle_btn = ttk.Button(button_frame,
+                            text='ปิดการเก็บสถิติ' if basicsql.QUERY_STATS_ENABLED else 'เปิดการเก็บสถิติ',
+                            command=toggle_stats)
+    toggle_btn.pack(side=LEFT, padx=5)
+    ttk.Button(button_frame, text='รีเฟรช', command=refresh_stats).pack(side=LEFT, padx=5)
+    ttk.Button(button_frame, text='ล้างสถิติ', command=reset_stats).pack(side=LEFT, padx=5)
+    ttk.Button(button_frame, text='ปิด', command=GUI3.destroy).pack(side=LEFT, padx=5)
+    
+    refresh_stats()
+
 # About Menu
 def AboutMenu(event=None):
     GUI2 = Toplevel()
@@ -392,6 +545,27 @@ try:
         profit_tab=profit_tab
     )
     
+    # แต่ละแท็บรีเฟรชเมื่อถูกเปิดดูเท่านั้น (แท็บที่เปิดอยู่รีเฟรชตอน idle)
+    dirty_tabs = DirtyTabs(GUI)
+    dirty_tabs.register(0, sales_tab.refresh_product_buttons, [PRODUCT_CHANGED, STOCK_CHANGED],
+                        refresh_rows=sales_tab.update_product_buttons)
+    dirty_tabs.register(1, product_tab.update_table_product, [PRODUCT_CHANGED, STOCK_CHANGED],
+                        refresh_rows=product_tab.update_product_rows)
+    dirty_tabs.register(2, dashboard_tab.refresh_data, [PRODUCT_CHANGED, STOCK_CHANGED])
+    dirty_tabs.register(3, profit_tab.refresh_data, [SALE_COMMITTED])
+    dirty_tabs.register(5, credit_tab.refresh_data, [BILL_CHANGED])
+    dirty_tabs.visible = Tab.current_tab
+    Tab.on_show = dirty_tabs.show
+    # event จาก thread อื่น (sale journal) ถูกส่งต่อใน Tk thread
+    bus.start(GUI)
+    
+    # ดูแลฐานข้อมูล (checkpoint/optimize/vacuum) เมื่อไม่มีการใช้งาน 60 วินาที
+    maintenance = MaintenanceScheduler(GUI)
+    maintenance.start()
+    
+    # งานพิมพ์ใบเสร็จทำใน background สถานะส่งกลับเข้าหน้าจอผ่าน after()
+    print_queue.start(GUI)
+    
     print("=" * 70)
     print("🎉 โปรแกรมสำหรับ POS Version 1.3.1 (ฺBeta)")
     print("=" * 70)
@@ -413,4 +587,12 @@ except Exception as e:
     traceback.print_exc()
     GUI.quit()
 
-GUI.mainloop()
\ No newline at end of file
+GUI.mainloop()
+
+# บันทึกบิลที่ยังอยู่ใน sale journal ลงฐานข้อมูล (ที่ไม่ทันจะถูก replay ตอนเปิดครั้งถัดไป)
+if not sale_journal.close_journal(timeout=30):
+    print('⚠️ Sale journal not fully applied at exit, will replay on next start')
+
+# รองานพิมพ์ที่ยังค้างในคิวก่อนปิดโปรแกรม
+if not print_queue.wait(timeout=30):
+    print(f'⚠️ Print queue still has {print_queue.pending()} job(s) at exit')
\ No newline at end of file
@@ -0,0 +1,254 @@
+# maintenance.py - ดูแลฐานข้อมูลตอนเครื่องว่าง (ไม่มีการสแกน/กดปุ่มตามเวลาที่กำหนด)
+#
+# งานที่ทำ: WAL checkpoint, PRAGMA optimize (ANALYZE เฉพาะตารางที่สถิติเก่า),
+# snapshot ยอดสต็อกสิ้นวัน, incremental vacuum
+# แต่ละงานแบ่งเป็นช่วงสั้นๆ (slice) ครั้งละหนึ่ง slice ต่อรอบ after() ของ Tk
+# ทุก slice ถูกตัดด้วย progress handler เมื่อเกินงบเวลา จึงไม่ถือ write lock นานเกิน budget_ms
+# มีการใช้งานเมื่อไหร่จะหยุดรอจนกว่าเครื่องจะว่างอีกครั้ง
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import basicsql
+
+IDLE_SECONDS = 60             # ว่างนานเท่านี้ก่อนเริ่มงาน
+BUDGET_MS = 200               # ถือ connection เขียนได้นานสุดต่อ slice
+POLL_MS = 1000                # ตรวจสถานะทุกกี่มิลลิวินาที
+ANALYSIS_LIMIT = 1000         # จำนวนแถวที่ ANALYZE สุ่มอ่านต่อ index
+VACUUM_PAGES = 64             # จำนวนหน้าเริ่มต้นที่คืนพื้นที่ต่อ slice
+SNAPSHOT_MIN_BATCH = 25       # ลดจำนวนสินค้าต่อ slice ของ snapshot ได้ต่ำสุดเท่านี้
+
+# ชื่องาน: ทำซ้ำได้เมื่อผ่านไปกี่วินาที
+TASK_INTERVALS = {
+    'checkpoint': 10 * 60,
+    'optimize': 6 * 60 * 60,
+    'snapshot': 24 * 60 * 60,
+    'vacuum': 24 * 60 * 60,
+}
+
+class BudgetExceeded(Exception):
+    """slice ใช้เวลาเกินงบและถูกยกเลิก"""
+
+class WriterBusy(Exception):
+    """หน้าขายกำลังใช้ connection เขียนอยู่ ให้ลองใหม่รอบหน้า"""
+
+class MaintenanceScheduler:
+    """ตัวจัดงานดูแลฐานข้อมูลตอนว่าง
+
+    root: หน้าต่าง Tk (ใช้ after() และ bind_all() จับการกดแป้น/คลิก ซึ่งรวมการสแกนบาร์โค้ด)
+    ไม่มี root ก็เรียก run_slice() เองได้ (ใช้ทดสอบหรือรันจาก command line)
+    """
+
+    def __init__(self, root=None, idle_seconds=IDLE_SECONDS, budget_ms=BUDGET_MS, poll_ms=POLL_MS):
+        self.root = root
+        self.idle_seconds = idle_seconds
+        self.budget_ms = budget_ms
+        self.poll_ms = poll_ms
+        self.last_activity = time.monotonic()
+        self.last_run = {}            # ชื่องาน -> เวลาที่ทำเสร็จล่าสุด (monotonic)
+        self._current = None          # (ชื่องาน, generator ของ slice)
+        self._after_id = None
+        self._vacuum_pages = VACUUM_PAGES
+        self._snapshot_batch = basicsql.STOCK_SNAPSHOT_BATCH
+
+    # ---------- Tk ----------
+
+    def start(self):
+        """เริ่มจับการใช้งานและตรวจสถานะเป็นระยะ"""
+        for sequence in ('<Key>', '<Button>'):
+            self.root.bind_all(sequence, self.touch, add='+')
+        self._after_id = self.root.after(self.poll_ms, self._poll)
+        print(f'🧹 Maintenance scheduler started (idle {self.idle_seconds} s, budget {self.budget_ms} ms)')
+
+    def stop(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+    def touch(self, event=None):
+        """บันทึกว่ามีการใช้งาน (สแกน/พิมพ์/คลิก)"""
+        self.last_activity = time.monotonic()
+
+    def is_idle(self):
+        return time.monotonic() - self.last_activity >= self.idle_seconds
+
+    def _poll(self):
+        try:
+            if self.is_idle():
+                self.run_slice()
+        except Exception as e:
+            print(f'❌ Maintenance error: {e}')
+            self._current = None
+        self._after_id = self.root.after(self.poll_ms, self._poll)
+
+    # ---------- งาน ----------
+
+    def due_tasks(self):
+        """งานที่ถึงเวลาทำ เรียงตามลำดับใน TASK_INTERVALS"""
+        now = time.monotonic()
+        return [name for name, interval in TASK_INTERVALS.items()
+                if name not in self.last_run or now - self.last_run[name] >= interval]
+
+    def run_slice(self):
+        """ทำงานหนึ่ง slice ของงานที่ค้างหรือที่ถึงเวลา คืนค่า (ชื่องาน, ms, ข้อความ) หรือ None ถ้าไม่มีงาน"""
+        if self._current is None:
+            due = self.due_tasks()
+            if not due:
+                return None
+            name = due[0]
+            self._current = (name, getattr(self, f'_task_{name}')())
+        name, steps = self._current
+
+        start = time.perf_counter()
+        try:
+            message = next(steps)
+            finished = False
+        except StopIteration as stop:
+            message = stop.value or 'done'
+            finished = True
+        except BudgetExceeded:
+            message = f'stopped after {self.budget_ms} ms budget, will retry later'
+            finished = True
+        except WriterBusy:
+            # ไม่นับว่าทำแล้ว รอบ poll ถัดไปจะเริ่มงานนี้ใหม่
+            self._current = None
+            print(f'🧹 Maintenance {name}: writer busy, retry on next poll')
+            return name, (time.perf_counter() - start) * 1000, 'writer busy'
+        elapsed = (time.perf_counter() - start) * 1000
+
+        if finished:
+            self._current = None
+            self.last_run[name] = time.monotonic()
+        print(f'🧹 Maintenance {name}: {message} ({elapsed:.1f} ms)')
+        return name, elapsed, message
+
+    def run_all(self):
+        """ทำทุกงานที่ถึงเวลาจนเสร็จ (สำหรับ command line) คืนรายการผลของแต่ละ slice"""
+        results = []
+        while True:
+            result = self.run_slice()
+            if result is None:
+                return results
+            results.append(result)
+
+    @contextmanager
+    def _writer(self):
+        """ยืม connection เขียนเฉพาะเมื่อว่างทันที (ไม่ให้หน้าจอค้างรอหน้าขาย)"""
+        try:
+            with basicsql.db.writer(timeout=0) as connection:
+                yield connection
+        except TimeoutError as e:
+            raise WriterBusy() from e
+
+    @contextmanager
+    def _budget(self, connection):
+        """ยกเลิกคำสั่งที่รันภายใน with เมื่อเกิน budget_ms (และรอ lock ไม่เกินงบเดียวกัน)"""
+        deadline = time.perf_counter() + self.budget_ms / 1000
+        connection.set_progress_handler(lambda: time.perf_counter() > deadline, 1000)
+        connection.execute(f'PRAGMA busy_timeout={int(self.budget_ms)}')
+        try:
+            yield
+        except sqlite3.OperationalError as e:
+            if time.perf_counter() > deadline or 'interrupted' in str(e) or 'locked' in str(e):
+                raise BudgetExceeded() from e
+            raise
+        finally:
+            connection.set_progress_handler(None, 0)
+            connection.execute(f'PRAGMA busy_timeout={basicsql.DB_BUSY_TIMEOUT_MS}')
+
+    def _budgeted(self, connection, command, script=False):
+        """รันคำสั่งโดยยกเลิกเมื่อเกิน budget_ms
+
+        script=True ใช้ executescript ซึ่ง step คำสั่งจนจบ (incremental_vacuum คืนหน้าละหนึ่ง step)
+        """
+        with self._budget(connection):
+            if script:
+                connection.executescript(command)
+                return []
+            return connection.execute(command).fetchall()
+
+    def _task_checkpoint(self):
+        """ย้ายข้อมูลจากไฟล์ -wal กลับเข้าฐานข้อมูล แล้วลดขนาด -wal ถ้าย้ายได้ครบ"""
+        if basicsql.db.in_memory:
+            return 'skipped (in-memory database)'
+        with self._writer() as connection:
+            busy, log, done = self._budgeted(connection, 'PRAGMA wal_checkpoint(PASSIVE)')[0]
+        if log <= 0:
+            return 'WAL empty'
+        if busy or done < log:
+            return f'{done}/{log} pages checkpointed (readers still active)'
+        yield f'{done}/{log} pages checkpointed'
+        with self._writer() as connection:
+            self._budgeted(connection, 'PRAGMA wal_checkpoint(TRUNCATE)')
+        return 'WAL truncated'
+
+    def _task_optimize(self):
+        """ANALYZE เฉพาะตารางที่สถิติเก่า เพื่อให้ query planner เลือก index ได้ถูก"""
+        with self._writer() as connection:
+            connection.execute(f'PRAGMA analysis_limit={ANALYSIS_LIMIT}')
+            # 0x10002: ตรวจทุกตาราง ไม่ใช่เฉพาะตารางที่ connection นี้เคยค้น
+            self._budgeted(connection, 'PRAGMA optimize(0x10002)')
+        return 'statistics refreshed'
+        yield
+
+    def _task_snapshot(self):
+        """บันทึกยอดสต็อกสิ้นวันจนถึงเมื่อวาน เฉพาะสินค้าที่มีการเคลื่อนไหว ครั้งละหนึ่งชุดต่อ slice"""
+        with self._writer() as connection:
+            position = basicsql.stock_snapshot_position(connection)
+        written = 0
+        while position is not None:
+            day = position[0]
+            try:
+                with self._writer() as connection, self._budget(connection):
+                    position, count = basicsql.snapshot_stock_batch(connection, position, self._snapshot_batch)
+            except BudgetExceeded:
+                # ชุดถูก rollback ทั้งชุด ลดขนาดแล้วทำตำแหน่งเดิมใหม่ใน slice ถัดไป
+                if self._snapshot_batch <= SNAPSHOT_MIN_BATCH:
+                    raise
+                self._snapshot_batch = max(SNAPSHOT_MIN_BATCH, self._snapshot_batch // 2)
+                yield f'{day}: over budget, retrying with {self._snapshot_batch} products per slice'
+                continue
+            written += count
+            if position is not None:
+                yield f'{day}: {count} products'
+        return f'{written} snapshot rows written' if written else 'snapshots up to date'
+
+    def _task_vacuum(self):
+        """คืนหน้าว่างของไฟล์ทีละส่วน (ต้องใช้ auto_vacuum=INCREMENTAL)"""
+        with self._writer() as connection:
+            mode = connection.execute('PRAGMA auto_vacuum').fetchone()[0]
+            free = connection.execute('PRAGMA freelist_count').fetchone()[0]
+        if mode != 2:
+            # ไฟล์เดิมต้อง VACUUM เต็มรูปแบบหนึ่งครั้ง ซึ่งไม่มีทางเสร็จในงบ budget_ms
+            # ให้แปลงจากเมนู File > แปลงไฟล์ฐานข้อมูล (basicsql.convert_to_incremental_vacuum)
+            return 'skipped: auto_vacuum is not INCREMENTAL (convert once from the File menu)'
+        reclaimed = 0
+        while free > 0:
+            pages = min(free, self._vacuum_pages)
+            start = time.perf_counter()
+            with self._writer() as connection:
+                self._budgeted(connection, f'PRAGMA incremental_vacuum({pages})', script=True)
+                free = connection.execute('PRAGMA freelist_count').fetchone()[0]
+            elapsed = (time.perf_counter() - start) * 1000
+            reclaimed += pages
+            # ปรับจำนวนหน้าต่อ slice ให้ใช้ราวครึ่งหนึ่งของงบ
+            if elapsed < self.budget_ms / 4:
+                self._vacuum_pages *= 2
+            elif elapsed > self.budget_ms / 2:
+                self._vacuum_pages = max(8, self._vacuum_pages // 2)
+            if free > 0:
+                yield f'reclaimed {pages} pages, {free} free pages left'
+        return f'reclaimed {reclaimed} pages' if reclaimed else 'no free pages'
+
+
+if __name__ == '__main__':
+    import sys
+
+    # รันงานทั้งหมดทันทีโดยไม่รอเครื่องว่าง: python maintenance.py [--db ไฟล์]
+    basicsql.init_db_from_args(sys.argv)
+    # รันจาก command line (ร้านปิด) จึงแปลงไฟล์เดิมเป็น auto_vacuum=INCREMENTAL ได้เลย
+    if basicsql.needs_vacuum_conversion():
+        basicsql.convert_to_incremental_vacuum(
+            progress=lambda elapsed: print(f'\r  {elapsed:.0f} s', end='', flush=True))
+        print()
+    MaintenanceScheduler().run_all()
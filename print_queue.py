@@ -0,0 +1,244 @@
+# print_queue.py - คิวงานพิมพ์ใบเสร็จ/ใบวางบิลที่ทำใน background thread
+#
+# สร้าง PDF ด้วย ReportLab และส่งงานเข้าเครื่องพิมพ์ thermal ใช้เวลาหลายร้อยมิลลิวินาทีถึงหลายวินาที
+# หน้าขายแค่ส่ง job (ข้อมูลบิลและรายการสินค้าที่คัดลอกไว้แล้ว) เข้าคิวแล้วเริ่มบิลถัดไปได้ทันที
+# worker ทำทีละงานตามลำดับ ลองใหม่เมื่อพิมพ์ไม่สำเร็จ และแจ้งสถานะกลับผ่าน callback
+# (เมื่อ start(root) แล้ว callback ถูกเรียกใน Tk thread ผ่าน after() เท่านั้น)
+import itertools
+import queue
+import threading
+import time
+
+try:
+    from receipt_printer import ReceiptPrinter
+    RECEIPT_AVAILABLE = True
+except ImportError:
+    RECEIPT_AVAILABLE = False
+
+try:
+    from thermal_printer import ThermalPrinter
+    THERMAL_AVAILABLE = True
+except ImportError:
+    THERMAL_AVAILABLE = False
+
+PRINT_RETRIES = 2             # ลองใหม่ได้กี่ครั้งหลังครั้งแรกไม่สำเร็จ
+PRINT_RETRY_DELAY = 2.0       # รอกี่วินาทีก่อนลองใหม่ (เช่น เครื่องพิมพ์กระดาษหมด/ยังไม่พร้อม)
+POLL_MS = 100                 # Tk อ่านสถานะจาก worker ทุกกี่มิลลิวินาที
+
+# สถานะของงาน
+QUEUED = 'queued'
+PRINTING = 'printing'
+RETRYING = 'retrying'
+DONE = 'done'
+FAILED = 'failed'
+
+class PrintUnavailable(Exception):
+    """ไม่มีโมดูล/ไดรเวอร์สำหรับงานประเภทนี้ (ไม่ลองใหม่)"""
+
+class PrintJob:
+    """งานพิมพ์หนึ่งงาน
+
+    kind: 'pdf_receipt' (ใบเสร็จ A4 แล้วเปิดไฟล์), 'thermal_receipt' (เครื่องพิมพ์ 80mm),
+          'credit_bill' (PDF ใบวางบิลจากหน้าขาย) หรือ 'invoice' (PDF ใบวางบิลจากแท็บลูกค้า
+          transaction_data ต้องมี customer_info และ due_days เพิ่ม)
+    transaction_data: dict ข้อมูลบิลแบบเดียวกับที่ ReceiptPrinter/ThermalPrinter ใช้
+    cart_items: รายการ [barcode, title, price, quantity] (คัดลอกตอนส่งงาน ตะกร้าล้างได้ทันที)
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, kind, transaction_data, cart_items, filename=None, on_status=None):
+        if kind not in RENDERERS:
+            raise ValueError(f'Unknown print job kind: {kind}')
+        self.job_id = next(self._ids)
+        self.kind = kind
+        self.transaction_data = dict(transaction_data)
+        self.cart_items = [list(item) for item in cart_items]
+        self.filename = filename
+        self.on_status = on_status
+        self.status = QUEUED
+        self.attempts = 0
+        self.result = None            # ชื่อไฟล์ PDF หรือ True สำหรับ thermal
+        self.error = None
+
+    @property
+    def document_id(self):
+        return self.transaction_data.get('transaction_id', f'#{self.job_id}')
+
+    def __repr__(self):
+        return f'<PrintJob {self.job_id} {self.kind} {self.document_id} {self.status}>'
+
+class PrintQueue:
+    """คิวงานพิมพ์ที่มี worker thread เดียว (งานพิมพ์ออกตามลำดับที่ส่ง)"""
+
+    def __init__(self, retries=PRINT_RETRIES, retry_delay=PRINT_RETRY_DELAY):
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._jobs = queue.Queue()
+        self._status = queue.Queue()  # (job, status) จาก worker รอ Tk อ่าน
+        self._printers = {}           # ReceiptPrinter/ThermalPrinter ที่สร้างแล้ว (โหลดฟอนต์ครั้งเดียว)
+        self._thread = None
+        self._root = None
+        self._after_id = None
+        self._lock = threading.Lock()
+
+    def start(self, root):
+        """ส่ง callback สถานะเข้า Tk thread ผ่าน root.after()"""
+        self._root = root
+        self._after_id = root.after(POLL_MS, self._poll)
+
+    def submit(self, kind, transaction_data, cart_items, filename=None, on_status=None):
+        """ส่งงานเข้าคิว คืนค่า PrintJob ทันที on_status(job) ถูกเรียกทุกครั้งที่สถานะเปลี่ยน"""
+        job = PrintJob(kind, transaction_data, cart_items, filename, on_status)
+        self._ensure_worker()
+        self._jobs.put(job)
+        self._notify(job, QUEUED)
+        print(f'🖨️ Print job {job.job_id} queued: {job.kind} {job.document_id}')
+        return job
+
+    def pending(self):
+        """จำนวนงานที่ยังไม่เริ่ม"""
+        return self._jobs.qsize()
+
+    def wait(self, timeout=None):
+        """รอจนงานในคิวเสร็จหมด (ใช้ตอนปิดโปรแกรม) คืนค่า False ถ้าหมดเวลาก่อน"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._jobs.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stop(self):
+        if self._root is not None and self._after_id is not None:
+            self._root.after_cancel(self._after_id)
+            self._after_id = None
+
+    # ---------- worker ----------
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name='pos-print', daemon=True)
+                self._thread.start()
+
+    def _worker(self):
+        while True:
+            job = self._jobs.get()
+            try:
+                self._run(job)
+            finally:
+                self._jobs.task_done()
+
+    def _run(self, job):
+        while True:
+            job.attempts += 1
+            self._notify(job, PRINTING)
+            start = time.perf_counter()
+            try:
+                job.result = RENDERERS[job.kind](self, job)
+            except PrintUnavailable as e:
+                job.error = str(e)
+                break
+            except Exception as e:
+                job.error = str(e)
+                print(f'❌ Print job {job.job_id} attempt {job.attempts} failed: {e}')
+                if job.attempts > self.retries:
+                    break
+                self._notify(job, RETRYING)
+                time.sleep(self.retry_delay)
+                continue
+            job.error = None
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f'✅ Print job {job.job_id} done: {job.kind} {job.document_id} ({elapsed:.0f} ms)')
+            self._notify(job, DONE)
+            return
+        print(f'❌ Print job {job.job_id} failed: {job.error}')
+        self._notify(job, FAILED)
+
+    def _printer(self, name, factory):
+        if name not in self._printers:
+            self._printers[name] = factory()
+        return self._printers[name]
+
+    # ---------- สถานะ ----------
+
+    def _notify(self, job, status):
+        if self._root is None:
+            job.status = status
+            self._call(job)
+        else:
+            self._status.put((job, status))
+
+    def _poll(self, reschedule=True):
+        while True:
+            try:
+                job, status = self._status.get_nowait()
+            except queue.Empty:
+                break
+            job.status = status
+            self._call(job)
+        if reschedule and self._root is not None:
+            self._after_id = self._root.after(POLL_MS, self._poll)
+
+    @staticmethod
+    def _call(job):
+        if job.on_status is None:
+            return
+        try:
+            job.on_status(job)
+        except Exception as e:
+            print(f'❌ Print status callback error: {e}')
+
+# ---------- การพิมพ์แต่ละประเภท (ทำงานใน worker thread) ----------
+
+def _render_pdf_receipt(print_queue, job):
+    if not RECEIPT_AVAILABLE:
+        raise PrintUnavailable('receipt_printer (ReportLab) not available')
+    printer = print_queue._printer('pdf', ReceiptPrinter)
+    data = job.transaction_data
+    return printer.print_receipt_from_transaction(
+        transaction_id=data['transaction_id'],
+        subtotal=data['subtotal'],
+        vat=data['vat'],
+        grand_total=data['grand_total'],
+        received_amount=data['received_amount'],
+        change_amount=data['change_amount'],
+        cart_items=job.cart_items
+    )
+
+def _render_thermal_receipt(print_queue, job):
+    if not THERMAL_AVAILABLE:
+        raise PrintUnavailable('thermal_printer (pywin32) not available')
+    printer = print_queue._printer('thermal', ThermalPrinter)
+    return printer.print_receipt(job.transaction_data, job.cart_items)
+
+def _render_credit_bill(print_queue, job):
+    if not RECEIPT_AVAILABLE:
+        raise PrintUnavailable('receipt_printer (ReportLab) not available')
+    printer = print_queue._printer('pdf', ReceiptPrinter)
+    return printer.create_receipt(job.transaction_data, job.cart_items, job.filename)
+
+def _render_invoice(print_queue, job):
+    if not RECEIPT_AVAILABLE:
+        raise PrintUnavailable('receipt_printer (ReportLab) not available')
+    printer = print_queue._printer('pdf', ReceiptPrinter)
+    data = job.transaction_data
+    return printer.create_invoice(
+        transaction_id=data['transaction_id'],
+        subtotal=data['subtotal'],
+        vat=data['vat'],
+        grand_total=data['grand_total'],
+        cart_items=job.cart_items,
+        customer_info=data['customer_info'],
+        due_days=data['due_days']
+    )
+
+RENDERERS = {
+    'pdf_receipt': _render_pdf_receipt,
+    'thermal_receipt': _render_thermal_receipt,
+    'credit_bill': _render_credit_bill,
+    'invoice': _render_invoice,
+}
+
+print_queue = PrintQueue()
@@ -0,0 +1,240 @@
+# product_grid.py - ตารางปุ่มสินค้าของหน้าขายแบบ virtual
+#
+# สร้างปุ่มเท่าที่มองเห็นบนจอ (จำนวนแถวที่พอดีกับความสูง x จำนวนคอลัมน์) แล้วเปลี่ยนข้อความ
+# ของปุ่มชุดเดิมเมื่อเลื่อน จึงใช้เวลาเท่าเดิมไม่ว่าจะมีสินค้ากี่พันรายการ
+# กรองตามหมวดหมู่ และแบ่งหน้าตามจำนวนสินค้าต่อหน้า
+from tkinter import *
+from tkinter import ttk
+from basicsql import catalog, view_product
+
+COLUMNS = 4
+ROW_HEIGHT = 90              # ความสูงต่อแถวของปุ่ม (พิกเซล)
+PAGE_SIZES = (100, 200, 500, 1000)
+ALL_CATEGORIES = 'ทั้งหมด'
+
+class ProductGrid(Frame):
+    """ปุ่มสินค้าที่มีสต็อก กดแล้วเรียก on_select(barcode, title, price, 1)"""
+
+    def __init__(self, parent, on_select, columns=COLUMNS, row_height=ROW_HEIGHT,
+                 page_size=PAGE_SIZES[1], **kwargs):
+        super().__init__(parent, bg='#f0f0f0', **kwargs)
+        self.on_select = on_select
+        self.columns = columns
+        self.row_height = row_height
+
+        self.products = []          # สินค้าที่มีสต็อกทั้งหมด
+        self.filtered = []          # หลังกรองหมวดหมู่
+        self.positions = {}         # barcode -> (ตำแหน่งใน products, ตำแหน่งใน filtered หรือ None)
+        self.page = 0
+        self.first_row = 0          # แถวแรกที่แสดง (ภายในหน้าปัจจุบัน)
+        self.buttons = []           # ปุ่มที่สร้างไว้ใช้ซ้ำ
+        self.slots = []             # สินค้าที่ปุ่มแต่ละปุ่มแสดงอยู่
+
+        self.v_category = StringVar(value=ALL_CATEGORIES)
+        self.v_page_size = StringVar(value=str(page_size))
+        self.v_page = StringVar()
+
+        self.create_toolbar()
+
+        body = Frame(self, bg='#ffffff')
+        body.pack(fill=BOTH, expand=True)
+        self.scrollbar = ttk.Scrollbar(body, orient=VERTICAL, command=self.on_scrollbar)
+        self.scrollbar.pack(side=RIGHT, fill=Y)
+        self.body = Frame(body, bg='#ffffff')
+        self.body.pack(side=LEFT, fill=BOTH, expand=True)
+        self.body.bind('<Configure>', self.on_resize)
+        self.bind_wheel(self.body)
+
+        self.refresh()
+
+    def create_toolbar(self):
+        """แถบเลือกหมวดหมู่ จำนวนต่อหน้า และเปลี่ยนหน้า"""
+        toolbar = Frame(self, bg='#f0f0f0')
+        toolbar.pack(fill=X, padx=5, pady=5)
+
+        Label(toolbar, text='หมวดหมู่:', bg='#f0f0f0').pack(side=LEFT)
+        self.category_box = ttk.Combobox(toolbar, textvariable=self.v_category,
+                                         state='readonly', width=16)
+        self.category_box.pack(side=LEFT, padx=(2, 10))
+        self.category_box.bind('<<ComboboxSelected>>', lambda e: self.apply_filter())
+
+        Label(toolbar, text='ต่อหน้า:', bg='#f0f0f0').pack(side=LEFT)
+        page_size_box = ttk.Combobox(toolbar, textvariable=self.v_page_size, state='readonly',
+                                     values=[str(size) for size in PAGE_SIZES], width=5)
+        page_size_box.pack(side=LEFT, padx=(2, 10))
+        page_size_box.bind('<<ComboboxSelected>>', lambda e: self.apply_filter())
+
+        ttk.Button(toolbar, text='▶', width=3, command=lambda: self.go_page(1)).pack(side=RIGHT)
+        Label(toolbar, textvariable=self.v_page, bg='#f0f0f0', width=10).pack(side=RIGHT)
+        ttk.Button(toolbar, text='◀', width=3, command=lambda: self.go_page(-1)).pack(side=RIGHT)
+
+    # ---------- ข้อมูล ----------
+
+    def refresh(self):
+        """อ่านสินค้าใหม่ (หลังขาย/แก้ไขสินค้า) โดยคงหมวดหมู่ หน้า และตำแหน่งเลื่อนเดิม"""
+        products = catalog.products() if catalog.ready else view_product(allfield=False)
+        self.products = [p for p in products if self.in_stock(p)]
+
+        categories = sorted({str(p[6]) for p in self.products if len(p) > 6 and p[6]})
+        self.category_box['values'] = [ALL_CATEGORIES] + categories
+        if self.v_category.get() not in self.category_box['values']:
+            self.v_category.set(ALL_CATEGORIES)
+        self.apply_filter(keep_position=True)
+
+    def refresh_rows(self, barcodes):
+        """อัปเดตเฉพาะสินค้าที่เปลี่ยน (เช่น สต็อกลดหลังขาย) และข้อความของปุ่มที่แสดงสินค้านั้นอยู่
+
+        ถ้าสินค้าต้องเข้า/ออกจากรายการ (หมดสต็อก สินค้าใหม่ ถูกลบ หรือเปลี่ยนหมวดหมู่) จะ refresh() ทั้งหมด
+        """
+        if not catalog.ready:
+            self.refresh()
+            return
+        changed = set()
+        for barcode in barcodes:
+            record = catalog.get(barcode)
+            position = self.positions.get(barcode)
+            showing = record is not None and self.in_stock(record)
+            if position is None and not showing:
+                continue
+            if position is None or not showing or self.category(record) != self.category(self.products[position[0]]):
+                self.refresh()
+                return
+            index, filtered_index = position
+            self.products[index] = record
+            if filtered_index is not None and self.filtered is not self.products:
+                self.filtered[filtered_index] = record
+            changed.add(barcode)
+
+        for slot, product in enumerate(self.slots):
+            if product is not None and product[0] in changed:
+                record = catalog.get(product[0])
+                self.slots[slot] = record
+                self.buttons[slot].config(text=self.button_text(record))
+
+    @staticmethod
+    def category(product):
+        return str(product[6]) if len(product) > 6 and product[6] else ''
+
+    @staticmethod
+    def in_stock(product):
+        try:
+            return len(product) < 5 or int(product[4]) > 0
+        except (ValueError, TypeError):
+            return True
+
+    def apply_filter(self, keep_position=False):
+        category = self.v_category.get()
+        if category == ALL_CATEGORIES:
+            self.filtered = self.products
+        else:
+            self.filtered = [p for p in self.products if len(p) > 6 and str(p[6]) == category]
+        filtered_positions = {p[0]: index for index, p in enumerate(self.filtered)}
+        self.positions = {p[0]: (index, filtered_positions.get(p[0]))
+                          for index, p in enumerate(self.products)}
+        if not keep_position:
+            self.page = 0
+            self.first_row = 0
+        self.page = min(self.page, self.page_count() - 1)
+        self.render()
+
+    # ---------- หน้า ----------
+
+    def page_size(self):
+        return int(self.v_page_size.get())
+
+    def page_count(self):
+        return max(1, -(-len(self.filtered) // self.page_size()))
+
+    def page_items(self):
+        start = self.page * self.page_size()
+        return self.filtered[start:start + self.page_size()]
+
+    def go_page(self, step):
+        page = min(max(self.page + step, 0), self.page_count() - 1)
+        if page != self.page:
+            self.page = page
+            self.first_row = 0
+            self.render()
+
+    # ---------- การแสดงผล ----------
+
+    def visible_rows(self):
+        return max(1, self.body.winfo_height() // self.row_height)
+
+    def total_rows(self):
+        return -(-len(self.page_items()) // self.columns)
+
+    def on_resize(self, event=None):
+        """สร้าง/ลบปุ่มให้พอดีกับขนาดพื้นที่ (+1 แถวสำรองสำหรับแถวที่โผล่ครึ่งหนึ่ง)"""
+        needed = (self.visible_rows() + 1) * self.columns
+        while len(self.buttons) < needed:
+            slot = len(self.buttons)
+            button = ttk.Button(self.body, command=lambda slot=slot: self.select(slot))
+            self.bind_wheel(button)
+            self.buttons.append(button)
+        while len(self.buttons) > needed:
+            self.buttons.pop().destroy()
+        self.render()
+
+    def render(self):
+        """ใส่ข้อมูลสินค้าของแถวที่มองเห็นลงในปุ่มชุดเดิม"""
+        items = self.page_items()
+        total_rows = self.total_rows()
+        visible = self.visible_rows()
+        self.first_row = min(max(self.first_row, 0), max(total_rows - visible, 0))
+
+        width = max(self.body.winfo_width(), 1) / self.columns
+        first = self.first_row * self.columns
+        self.slots = []
+        for slot, button in enumerate(self.buttons):
+            index = first + slot
+            if index >= len(items):
+                button.place_forget()
+                self.slots.append(None)
+                continue
+            product = items[index]
+            self.slots.append(product)
+            row, col = divmod(slot, self.columns)
+            button.config(text=self.button_text(product))
+            button.place(x=col * width + 3, y=row * self.row_height + 3,
+                         width=width - 6, height=self.row_height - 6)
+
+        self.v_page.set(f'{self.page + 1}/{self.page_count()}')
+        if total_rows:
+            self.scrollbar.set(self.first_row / total_rows,
+                               min(self.first_row + visible, total_rows) / total_rows)
+        else:
+            self.scrollbar.set(0, 1)
+
+    @staticmethod
+    def button_text(product):
+        title = product[1] if len(product) > 1 else 'Unknown'
+        if len(product) >= 6:
+            return f"{title}\n[{product[0]}]\n({product[4]} {product[5]})"
+        return f"{title}\n[{product[0]}]"
+
+    def select(self, slot):
+        product = self.slots[slot] if slot < len(self.slots) else None
+        if product is not None:
+            self.on_select(product[0], product[1], product[2], 1)
+
+    # ---------- การเลื่อน ----------
+
+    def scroll_rows(self, rows):
+        self.first_row += rows
+        self.render()
+
+    def on_scrollbar(self, action, value, unit=None):
+        """รับคำสั่งจาก Scrollbar ('moveto', fraction) หรือ ('scroll', n, 'units'/'pages')"""
+        if action == 'moveto':
+            self.first_row = int(float(value) * self.total_rows())
+            self.render()
+        elif unit == 'pages':
+            self.scroll_rows(int(value) * self.visible_rows())
+        else:
+            self.scroll_rows(int(value))
+
+    def bind_wheel(self, widget):
+        widget.bind('<MouseWheel>', lambda e: self.scroll_rows(-1 if e.delta > 0 else 1))
+        widget.bind('<Button-4>', lambda e: self.scroll_rows(-1))
+        widget.bind('<Button-5>', lambda e: self.scroll_rows(1))
@@ -0,0 +1,340 @@
+# sale_journal.py - บันทึกการขายแบบเขียนล่วงหน้า (write-behind) ลงไฟล์ journal
+#
+# บิลเงินสดถูกเขียนต่อท้ายไฟล์ journal เป็น record เดียว (fsync แล้วจึงตอบกลับ) หน้าขายจึงรอแค่
+# การเขียนไฟล์เล็กๆ ไม่ต้องรอ transaction ของ SQLite จากนั้น writer thread นำ record ไปบันทึกลง
+# posdb.sqlite3 ทีละหลายบิลใน transaction เดียว แล้วล้างไฟล์ journal เมื่อบันทึกครบ
+# ถ้าเครื่องดับก่อนบันทึก เปิดโปรแกรมครั้งถัดไปจะ replay record ที่ค้างก่อนเริ่มขาย
+# (บิลที่บันทึกไปแล้วถูกข้ามด้วย transaction_id)
+# commit ของการบันทึกจาก journal ใช้ synchronous=FULL เสมอ (แม้ตั้ง POS_DB_SYNCHRONOUS=NORMAL)
+# ไฟล์ journal จึงถูกล้างหลังข้อมูลลง WAL บนดิสก์แล้วเท่านั้น บิลที่ตอบลูกค้าไปแล้วไม่หายเมื่อไฟดับ
+# ระดับ FULL ตั้งและคืนค่าภายใน lock ของ connection เขียนครั้งเดียวกับ commit นั้น
+# commit ของ thread อื่นจึงใช้ระดับที่ตั้งไว้ตามปกติ
+#
+# ไม่ได้ทำให้บันทึกได้เร็วขึ้นเมื่อไม่มีงานอื่นแย่งเขียน: แต่ละบิลยังต้อง fsync ไฟล์ journal หนึ่งครั้ง
+# ซึ่งใช้เวลาใกล้เคียงกับ commit_sale ตรงๆ (ดู bench_checkout.py ช่วงฐานข้อมูลว่าง)
+# ประโยชน์มีเฉพาะเวลาตอบกลับตอนมีงานอื่นถือ connection เขียนอยู่ (ดูแลฐานข้อมูล ย้ายข้อมูลเก่า
+# นำเข้าสินค้า) บิลไม่ต้องรองานนั้นจบ ตอบกลับได้ในเวลาเท่ากับการเขียนไฟล์เล็กๆ หนึ่งครั้ง
+#
+# รูปแบบ record: magic 'SJR1' | ความยาว payload (uint32) | crc32 ของ payload (uint32) | JSON (UTF-8)
+# record ท้ายไฟล์ที่เขียนไม่ครบหรือ crc ไม่ตรง (เครื่องดับระหว่างเขียน) ถือว่ายังไม่ได้ยืนยันกับลูกค้า
+#
+# เปิดใช้ด้วย POS_SALE_JOURNAL=1 บิลเครดิต (วางบิล) ยังบันทึกตรงผ่าน commit_sale
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from contextlib import contextmanager
+
+import basicsql
+from basicsql import InsufficientStockError, commit_sale
+
+SALE_JOURNAL_ENABLED = os.environ.get('POS_SALE_JOURNAL', '0') == '1'
+JOURNAL_SUFFIX = '.salejournal'
+RECORD_MAGIC = b'SJR1'
+RECORD_HEADER = struct.Struct('<4sII')
+APPLY_BATCH = 50              # บันทึกลงฐานข้อมูลครั้งละกี่บิล
+ID_BLOCK = 20                 # จองเลขที่ขายจากฐานข้อมูลครั้งละกี่เลข
+RETRY_SECONDS = 1.0           # บันทึกลงฐานข้อมูลไม่สำเร็จ รอกี่วินาทีก่อนลองใหม่
+
+def _sync(fd):
+    # fdatasync ไม่ต้องเขียน metadata (เวลาแก้ไขไฟล์) จึงเร็วกว่า fsync (Windows มีแค่ fsync)
+    if hasattr(os, 'fdatasync'):
+        os.fdatasync(fd)
+    else:
+        os.fsync(fd)
+
+@contextmanager
+def _full_sync_writer():
+    """ยืม connection เขียนโดย commit ของ with นี้ใช้ synchronous=FULL (ต้องลงดิสก์ก่อนล้าง journal)
+
+    คืนค่าระดับเดิมใน on_commit (หลัง commit แต่ยังถือ lock) หรือก่อน rollback
+    thread อื่นจึงไม่มีทาง commit ระหว่างที่ตั้งเป็น FULL ไว้
+    """
+    with basicsql.db.writer() as connection:
+        level = connection.execute('PRAGMA synchronous').fetchone()[0]
+        if level >= 2:
+            yield connection
+            return
+
+        def restore(connection):
+            connection.execute(f'PRAGMA synchronous={level}')
+
+        connection.execute('PRAGMA synchronous=FULL')
+        basicsql.db.on_commit(restore)
+        try:
+            yield connection
+        except BaseException:
+            restore(connection)
+            raise
+
+def encode_record(record):
+    payload = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return RECORD_HEADER.pack(RECORD_MAGIC, len(payload), zlib.crc32(payload)) + payload
+
+def read_records(path):
+    """อ่าน record ที่สมบูรณ์จากไฟล์ คืนค่า (records, จำนวน byte ที่อ่านได้ถูกต้อง)"""
+    if not os.path.exists(path):
+        return [], 0
+    with open(path, 'rb') as f:
+        data = f.read()
+    records = []
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        magic, length, crc = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        payload = data[start:start + length]
+        if magic != RECORD_MAGIC or len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        records.append(json.loads(payload.decode('utf-8')))
+        offset = start + length
+    if offset < len(data):
+        print(f'⚠️ Sale journal: ignored {len(data) - offset} bytes of incomplete record at the end')
+    return records, offset
+
+class SaleJournal:
+    """journal ของบิลเงินสด
+
+    open(): replay record ที่ค้างจากครั้งก่อน แล้วเริ่ม writer thread
+    submit(cart, payment): ตรวจสต็อก ออกเลขที่ขาย เขียน record แล้วคืนผลแบบเดียวกับ commit_sale
+    close(): รอบันทึกครบ คืนเลขที่ขายที่จองไว้แต่ไม่ได้ใช้ และหยุด writer thread
+    """
+
+    def __init__(self, path=None, sync=True, batch_size=APPLY_BATCH, id_block=ID_BLOCK):
+        if path is None:
+            if basicsql.db.in_memory:
+                raise ValueError('Sale journal needs a database file')
+            path = basicsql.db.path + JOURNAL_SUFFIX
+        self.path = path
+        self.sync = sync
+        self.batch_size = batch_size
+        self.id_block = id_block
+        self._cond = threading.Condition()
+        self._pending = []            # record ที่ยืนยันแล้วแต่ยังไม่ได้บันทึกลงฐานข้อมูล
+        self._pending_qty = {}        # barcode -> จำนวนที่ขายไปใน _pending (ยังไม่ถูกตัดในฐานข้อมูล)
+        self._ids = []                # เลขที่ขายที่จองไว้
+        self._fd = None
+        self._thread = None
+        self._closing = False
+
+    # ---------- เปิด/ปิด ----------
+
+    def open(self):
+        records, valid = read_records(self.path)
+        if records:
+            # replay ก่อนเริ่มขาย ให้สต็อกในฐานข้อมูลถูกต้องก่อนตรวจบิลใหม่
+            start = time.perf_counter()
+            with _full_sync_writer():
+                applied = basicsql.apply_journaled_sales(records)
+            print(f'✅ Sale journal: replayed {len(records)} record(s), {applied} new '
+                  f'({(time.perf_counter() - start) * 1000:.0f} ms)')
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, 'O_BINARY', 0))
+        if records or valid != os.fstat(self._fd).st_size:
+            self._truncate()
+        # จองเลขที่ไว้ก่อนเริ่มขาย หลังจากนี้ writer thread เติมให้ระหว่างบันทึก
+        self._ids.extend(basicsql.reserve_document_ids('T', self.id_block))
+        self._thread = threading.Thread(target=self._run, name='sale-journal', daemon=True)
+        self._thread.start()
+        print(f'✅ Sale journal ready: {self.path}')
+        return self
+
+    def close(self, timeout=None):
+        """รอบันทึกบิลที่ค้างลงฐานข้อมูล คืนค่า False ถ้าหมดเวลาก่อน (บิลยังอยู่ใน journal)"""
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if flushed and self._ids:
+            # คืนได้เฉพาะชุดท้ายที่เลขต่อเนื่องกัน (ระหว่างชุดที่จองอาจมีบิลเครดิตใช้เลขไปแล้ว)
+            tail = _contiguous_tail(self._ids)
+            if basicsql.release_document_ids('T', tail):
+                del self._ids[-len(tail):]
+        with self._cond:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+        return flushed
+
+    def flush(self, timeout=None):
+        """รอจนทุกบิลใน journal ถูกบันทึกลงฐานข้อมูล"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def pending(self):
+        return len(self._pending)
+
+    # ---------- รับบิล ----------
+
+    def submit(self, cart, payment):
+        """บันทึกบิลเงินสดลง journal คืนค่า dict: transaction_id, bill_id (None), datetime
+
+        สต็อกไม่พอโยน InsufficientStockError เหมือน commit_sale (ไม่มีการบันทึกใดๆ)
+        """
+        items = [list(item) for item in cart]
+        if not items:
+            raise ValueError('Cart is empty')
+        needed = {}
+        for barcode, title, price, quantity in items:
+            needed[str(barcode)] = needed.get(str(barcode), 0) + int(quantity)
+
+        if self._fd is None:
+            raise RuntimeError('Sale journal is not open')
+        if not self._ids:
+            # ปกติ writer thread เติมเลขไว้ก่อนหมด จองเองเฉพาะเมื่อขายเร็วกว่าที่เติมทัน
+            # (จองนอก _cond: writer thread ถือ lock ฐานข้อมูลแล้วจึงรอ _cond ดู _apply)
+            self._ids.extend(basicsql.reserve_document_ids('T', self.id_block))
+        with self._cond:
+            if self._fd is None:
+                raise RuntimeError('Sale journal is not open')
+            self._check_stock(needed)
+            transaction_id = self._ids[0]
+            record = {
+                'transaction_id': transaction_id,
+                'datetime': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'items': items,
+                'payment': {key: payment.get(key, 0) for key in
+                            ('subtotal', 'vat', 'grand_total', 'received_amount', 'change_amount')},
+            }
+            self._append(encode_record(record))
+            # ใช้เลขที่เมื่อ record ถูกเขียนแล้วเท่านั้น เขียนไม่สำเร็จเลขนี้ยังใช้กับบิลถัดไปได้
+            self._ids.pop(0)
+            self._pending.append(record)
+            for barcode, quantity in needed.items():
+                self._pending_qty[barcode] = self._pending_qty.get(barcode, 0) + quantity
+            self._cond.notify_all()
+
+        print(f'Sale {transaction_id} journaled ({len(items)} items)')
+        return {'transaction_id': transaction_id, 'bill_id': None, 'datetime': record['datetime']}
+
+    def _check_stock(self, needed):
+        """สต็อกคงเหลือ = ในฐานข้อมูล (catalog) - ที่ขายไปแล้วใน journal แต่ยังไม่ได้บันทึก"""
+        for barcode, quantity in needed.items():
+            record = basicsql.catalog.get(barcode)
+            if record is not None:
+                stock = record[4]
+            elif basicsql.catalog.ready:
+                stock = None
+            else:
+                row = basicsql.get_product_by_barcode(barcode)
+                stock = row[5] if row else None
+            if stock is None:
+                raise InsufficientStockError(barcode, 0, quantity)
+            available = (stock or 0) - self._pending_qty.get(barcode, 0)
+            if available < quantity:
+                raise InsufficientStockError(barcode, available, quantity)
+
+    def _append(self, frame):
+        view = memoryview(frame)
+        while view:
+            written = os.write(self._fd, view)
+            view = view[written:]
+        if self.sync:
+            _sync(self._fd)
+
+    def _truncate(self):
+        # ไม่ต้อง fsync: ถ้าไฟดับก่อนการล้างลงดิสก์ record เดิมจะถูก replay ซ้ำ ซึ่งถูกข้ามด้วย transaction_id
+        if self._fd is None:
+            return
+        os.ftruncate(self._fd, 0)
+
+    # ---------- writer thread ----------
+
+    def _run(self):
+        try:
+            while True:
+                with self._cond:
+                    while not self._pending and not self._closing:
+                        self._cond.wait()
+                    if not self._pending:
+                        return
+                    batch = self._pending[:self.batch_size]
+                try:
+                    self._apply(batch)
+                except Exception as e:
+                    print(f'❌ Sale journal apply failed, retry in {RETRY_SECONDS} s: {e}')
+                    time.sleep(RETRY_SECONDS)
+        finally:
+            basicsql.db.release_reader()
+
+    def _apply(self, batch):
+        # ถือ _cond ตั้งแต่ก่อน commit จนลด _pending_qty เสร็จ (ใน on_commit) _check_stock จึงไม่เห็น
+        # สต็อกที่ถูกหักแล้วในฐานข้อมูล/catalog แต่ยังนับอยู่ใน _pending_qty (หักซ้ำสองทาง)
+        state = {'locked': False}
+        try:
+            with _full_sync_writer():
+                basicsql.apply_journaled_sales(batch)
+                # เติมเลขที่ใน transaction เดียวกัน submit จึงแทบไม่ต้องรอ connection เขียน
+                ids = []
+                if len(self._ids) <= self.id_block // 2:
+                    ids = basicsql.reserve_document_ids('T', self.id_block)
+                basicsql.db.on_commit(lambda connection: self._applied(batch, ids, state))
+                self._cond.acquire()
+                state['locked'] = True
+        finally:
+            if state['locked']:
+                # commit ไม่สำเร็จ on_commit จึงไม่ถูกเรียก
+                state['locked'] = False
+                self._cond.release()
+
+    def _applied(self, batch, ids, state):
+        try:
+            self._ids.extend(ids)
+            del self._pending[:len(batch)]
+            for record in batch:
+                for barcode, title, price, quantity in record['items']:
+                    barcode = str(barcode)
+                    left = self._pending_qty.get(barcode, 0) - int(quantity)
+                    if left > 0:
+                        self._pending_qty[barcode] = left
+                    else:
+                        self._pending_qty.pop(barcode, None)
+            if not self._pending:
+                # ทุก record อยู่ในฐานข้อมูลแล้ว เริ่มไฟล์ใหม่
+                self._truncate()
+            self._cond.notify_all()
+        finally:
+            state['locked'] = False
+            self._cond.release()
+
+def _contiguous_tail(document_ids):
+    """เลขที่ชุดท้ายของรายการที่เรียงต่อกันโดยไม่มีเลขขาด"""
+    numbers = [int(document_id.lstrip('T')) for document_id in document_ids]
+    start = len(numbers) - 1
+    while start > 0 and numbers[start - 1] == numbers[start] - 1:
+        start -= 1
+    return document_ids[start:]
+
+# ---------- ใช้จากหน้าขาย ----------
+
+sale_journal = None
+
+def open_journal(path=None, **kwargs):
+    """เปิด journal (replay ของที่ค้าง) และให้ record_sale ใช้ journal กับบิลเงินสด"""
+    global sale_journal
+    sale_journal = SaleJournal(path, **kwargs).open()
+    return sale_journal
+
+def close_journal(timeout=None):
+    global sale_journal
+    if sale_journal is None:
+        return True
+    flushed = sale_journal.close(timeout)
+    sale_journal = None
+    return flushed
+
+def record_sale(cart, payment, customer=None):
+    """บันทึกการขาย: บิลเงินสดผ่าน journal (ถ้าเปิดไว้) นอกนั้นผ่าน commit_sale"""
+    if sale_journal is not None and customer is None:
+        return sale_journal.submit(cart, payment)
+    return commit_sale(cart, payment, customer=customer)
@@ -0,0 +1,79 @@
+# scan_queue.py - คิวรับ barcode จากเครื่องสแกน (keyboard wedge)
+#
+# เครื่องสแกนส่ง barcode ได้หลายครั้งต่อวินาที put() แค่ต่อคิวแล้วนัด flush() ด้วย after_idle
+# ครั้งเดียว flush() หา barcode ทั้งคิวจาก catalog ใส่ตะกร้า แล้วส่งผลรวมให้หน้าจออัปเดตทีเดียว
+# หน้าจอจึงไม่ต้องอัปเดตตาราง/ยอดรวมทุกครั้งที่สแกน และไม่มี messagebox มาขวางการสแกนถัดไป
+from collections import deque
+
+from basicsql import search_barcode
+
+class ScanQueue:
+    """คิว barcode ที่ประมวลผลเป็นชุด
+
+    cart: Cart ของหน้าขาย
+    schedule: ฟังก์ชันนัดเรียก flush (เช่น root.after_idle) None = flush ทันทีทุกครั้ง
+    on_applied: callback(result) หลังใส่ตะกร้าแล้ว result เป็น dict:
+        changed       barcode ในตะกร้าที่เปลี่ยน (เรียงตามลำดับที่สแกนครั้งแรก)
+        added         [(barcode, title)] ทุกครั้งที่เพิ่มสำเร็จ
+        not_found     [barcode] ที่ไม่พบสินค้า
+        out_of_stock  [(barcode, title, stock)] ที่สแกนเกินสต็อก
+        scans         จำนวน barcode ในชุดนี้
+    """
+
+    def __init__(self, cart, schedule=None, on_applied=None, lookup=search_barcode):
+        self.cart = cart
+        self.schedule = schedule
+        self.on_applied = on_applied
+        self.lookup = lookup
+        self.pending = deque()
+        self._scheduled = False
+
+    def __len__(self):
+        return len(self.pending)
+
+    def put(self, barcode):
+        """รับ barcode จากเครื่องสแกน (เรียกจาก event <Return> ใช้เวลาน้อยมาก)"""
+        barcode = str(barcode).strip()
+        if not barcode:
+            return
+        self.pending.append(barcode)
+        if self.schedule is None:
+            self.flush()
+        elif not self._scheduled:
+            self._scheduled = True
+            self.schedule(self.flush)
+
+    def flush(self):
+        """ใส่ทุก barcode ที่ค้างในคิวลงตะกร้า แล้วเรียก on_applied หนึ่งครั้ง"""
+        self._scheduled = False
+        result = {'changed': [], 'added': [], 'not_found': [], 'out_of_stock': [], 'scans': 0}
+        changed = {}
+        products = {}                 # barcode ซ้ำในชุดเดียวกันไม่ต้องหาใหม่
+        while self.pending:
+            barcode = self.pending.popleft()
+            result['scans'] += 1
+            if barcode not in products:
+                products[barcode] = self.lookup(barcode)
+            data = products[barcode]
+            if not data:
+                result['not_found'].append(barcode)
+                continue
+
+            barcode, title, price = data[0], data[1], data[2]
+            if len(data) >= 5:
+                try:
+                    available_stock = int(data[4])
+                    if self.cart.quantity(barcode) >= available_stock:
+                        result['out_of_stock'].append((barcode, title, available_stock))
+                        continue
+                except (ValueError, TypeError):
+                    pass
+
+            self.cart.add(barcode, title, price, 1)
+            changed[barcode] = True
+            result['added'].append((barcode, title))
+
+        result['changed'] = list(changed)
+        if result['scans'] and self.on_applied is not None:
+            self.on_applied(result)
+        return result
@@ -1,6 +1,11 @@
 from tkinter import *
 from tkinter import ttk, messagebox
 from basicsql import *
+from cart import Cart
+from scan_queue import ScanQueue
+from print_queue import print_queue, DONE, FAILED, RETRYING
+from sale_journal import record_sale
+from product_grid import ProductGrid
 import json
 from datetime import datetime, timedelta
 
@@ -40,8 +45,13 @@ class SalesTab(Frame):
         self.v_result = StringVar()
         self.v_search = StringVar()
         
-        # ตะกร้าสินค้า
-        self.cart = {}
+        # ตะกร้าสินค้า และ barcode -> item id ของแถวในตาราง table_sales
+        self.cart = Cart()
+        self.cart_rows = {}
+        
+        # barcode จากเครื่องสแกนเข้าคิว แล้วอัปเดตหน้าจอครั้งเดียวต่อรอบ idle
+        self.scan_queue = ScanQueue(self.cart, schedule=self.after_idle, on_applied=self.apply_scans)
+        self.status_timer = None
         
         # สร้าง GUI
         self.create_widgets()
@@ -57,43 +67,9 @@ class SalesTab(Frame):
         main_container = Frame(self, bg="#f0f0f0")
         main_container.pack(fill=BOTH, expand=True, padx=20, pady=20)
         
-        # ⭐ สร้าง Frame พร้อม Canvas และ Scrollbar สำหรับปุ่มสินค้า
-        product_container = Frame(self, bg="#f0f0f0", relief=RIDGE, bd=2)
-        product_container.place(x=65, y=60, width=618, height=588)
-        
-        # สร้าง Canvas
-        self.product_canvas = Canvas(product_container, bg="#f0f0f0", highlightthickness=0)
-        
-        # สร้าง Scrollbar แนวตั้ง
-        v_scrollbar = ttk.Scrollbar(product_container, orient=VERTICAL, 
-                                    command=self.product_canvas.yview)
-        v_scrollbar.pack(side=RIGHT, fill=Y)
-        
-        # สร้าง Scrollbar แนวนอน
-        h_scrollbar = ttk.Scrollbar(product_container, orient=HORIZONTAL,
-                                    command=self.product_canvas.xview)
-        h_scrollbar.pack(side=BOTTOM, fill=X)
-        
-        self.product_canvas.pack(side=LEFT, fill=BOTH, expand=True)
-        
-        # Configure canvas scrollbar
-        self.product_canvas.configure(yscrollcommand=v_scrollbar.set,
-                                     xscrollcommand=h_scrollbar.set)
-        
-        # สร้าง Frame ภายใน Canvas สำหรับใส่ปุ่ม
-        self.F1 = Frame(self.product_canvas, bg='#ffffff')
-        self.canvas_window = self.product_canvas.create_window((0, 0), 
-                                                               window=self.F1, 
-                                                               anchor='nw')
-        
-        # Bind event เพื่ออัปเดต scroll region
-        self.F1.bind('<Configure>', self.on_frame_configure)
-        
-        # เพิ่ม Mouse wheel scrolling
-        self.product_canvas.bind_all("<MouseWheel>", self.on_mousewheel)
-        
-        # สร้างปุ่มสินค้าจากฐานข้อมูล
-        self.create_product_buttons()
+        # ปุ่มสินค้า (สร้างปุ่มเฉพาะแถวที่มองเห็น กรองตามหมวดหมู่และแบ่งหน้าได้)
+        self.product_grid = ProductGrid(self, on_select=self.button_insert, relief=RIDGE, bd=2)
+        self.product_grid.place(x=65, y=60, width=618, height=588)
         
         # Frame สำหรับตารางขาย
         self.F2 = Frame(self)
@@ -133,62 +109,6 @@ class SalesTab(Frame):
         # ปุ่ม Checkout
         self.create_checkout_button()
     
-    def on_frame_configure(self, event=None):
-        """อัปเดต scroll region เมื่อ frame มีการเปลี่ยนแปลง"""
-        self.product_canvas.configure(scrollregion=self.product_canvas.bbox("all"))
-    
-    def on_mousewheel(self, event):
-        """เลื่อน canvas ด้วย mouse wheel"""
-        x, y = self.winfo_pointerxy()
-        widget = self.winfo_containing(x, y)
-        
-        if widget == self.product_canvas or self.is_child_of(widget, self.product_canvas):
-            self.product_canvas.yview_scroll(int(-1*(event.delta/120)), "units")
-    
-    def is_child_of(self, widget, parent):
-        """ตรวจสอบว่า widget เป็น child ของ parent หรือไม่"""
-        if widget is None:
-            return False
-        if widget == parent:
-            return True
-        return self.is_child_of(widget.master, parent)
-        
-    def create_product_buttons(self):
-        """สร้างปุ่มสินค้าจากฐานข้อมูล"""
-        col = 0
-        row = 0
-        
-        for i, db in enumerate(view_product(allfield=False), start=1):
-            try:
-                if len(db) >= 5 and int(db[4]) <= 0:
-                    continue
-                    
-                barcode_text = f"[{db[0]}]" if len(db) > 0 else ""
-                stock_text = f"({db[4]} {db[5] if len(db) >= 6 else 'ชิ้น'})" if len(db) >= 6 else ""
-                display_text = f"{db[1]}\n{barcode_text}\n{stock_text}"
-                
-                B = ttk.Button(self.F1, text=display_text, 
-                              command=lambda pd=db: self.button_insert(pd[0], pd[1], pd[2], 1))
-                B.grid(row=row, column=col, ipadx=10, ipady=20, padx=5, pady=5, sticky='ew')
-                col = col + 1
-                if i % 4 == 0:
-                    col = 0
-                    row = row + 1
-            except (ValueError, IndexError):
-                B = ttk.Button(self.F1, text=db[1] if len(db) > 1 else "Unknown", 
-                              command=lambda pd=db: self.button_insert(pd[0], pd[1], pd[2], 1))
-                B.grid(row=row, column=col, ipadx=10, ipady=20, padx=5, pady=5, sticky='ew')
-                col = col + 1
-                if i % 4 == 0:
-                    col = 0
-                    row = row + 1
-        
-        for i in range(4):
-            self.F1.grid_columnconfigure(i, weight=1, minsize=150)
-        
-        self.F1.update_idletasks()
-        self.product_canvas.configure(scrollregion=self.product_canvas.bbox("all"))
-                
     def create_sales_table(self):
         """สร้างตารางแสดงรายการขาย"""
         style = ttk.Style()
@@ -278,7 +198,9 @@ class SalesTab(Frame):
             
             selected_item = self.table_sales.item(selected[0])
             values = selected_item['values']
-            barcode = str(values[0])
+            # หา barcode จาก item id (ค่าใน Treeview อาจถูกแปลงเป็นตัวเลข เช่น '0012' เป็น 12)
+            barcode = next((b for b, row_id in self.cart_rows.items() if row_id == selected[0]),
+                           str(values[0]))
             product_name = values[1]
             
             confirm = messagebox.askyesno("⚠️ ยืนยันการลบสินค้า",
@@ -286,13 +208,10 @@ class SalesTab(Frame):
             
             if confirm:
                 if barcode in self.cart:
-                    del self.cart[barcode]
-                    self.table_sales.delete(selected[0])
-                    self.update_table_with_totals()
+                    self.cart.remove(barcode)
+                    self.update_cart_row(barcode)
                     
-                    self.v_last_barcode.set(f"🗑️ ลบสินค้าแล้ว: {product_name}")
-                    self.last_barcode_frame.config(bg='#fff9c4')
-                    self.after(2000, lambda: self.reset_barcode_label())
+                    self.show_status(f"🗑️ ลบสินค้าแล้ว: {product_name}", '#fff9c4')
                     self.search.focus()
                     
         except Exception as e:
@@ -312,8 +231,7 @@ class SalesTab(Frame):
             
             if confirm:
                 self.clear_cart()
-                self.v_last_barcode.set(f"✅ ล้างตะกร้าเรียบร้อยแล้ว!")
-                self.after(3000, lambda: self.reset_barcode_label())
+                self.show_status(f"✅ ล้างตะกร้าเรียบร้อยแล้ว!", self.last_barcode_frame['bg'], 3000)
                 
         except Exception as e:
             messagebox.showerror("เกิดข้อผิดพลาด", f"ไม่สามารถล้างตะกร้าได้\n\n{str(e)}")
@@ -367,17 +285,8 @@ class SalesTab(Frame):
         style.configure('Checkout.TButton', font=(None, 10, 'bold'))
         
     def calculate_totals(self):
-        """คำนวณยอดรวม"""
-        subtotal = 0
-        for item in self.cart.values():
-            price = float(item[2])
-            quantity = int(item[3])
-            subtotal += price * quantity
-            
-        vat = subtotal * 0.07
-        grand_total = subtotal + vat
-        
-        return subtotal, vat, grand_total
+        """คำนวณยอดรวม (ตะกร้าเก็บยอดสะสมไว้แล้ว)"""
+        return self.cart.totals()
         
     def update_summary(self):
         """อัปเดตการแสดงยอดรวม"""
@@ -387,31 +296,60 @@ class SalesTab(Frame):
         self.v_vat.set(f"{vat:,.2f} บาท")
         self.v_grand_total.set(f"{grand_total:,.2f} บาท")
         
+    def cart_row_values(self, item):
+        """ค่าของแถวในตาราง table_sales จากแถวในตะกร้า"""
+        barcode, title = item[0], item[1]
+        price = float(item[2])
+        quantity = int(item[3])
+        return [barcode, title, f"{price:,.2f}", quantity, f"{price * quantity:,.2f}"]
+        
+    def update_cart_row(self, barcode, summary=True):
+        """อัปเดตเฉพาะแถวของสินค้าที่เปลี่ยน (เพิ่ม/แก้จำนวน/ลบ) แล้วอัปเดตยอดรวม"""
+        item = self.cart.get(barcode)
+        row_id = self.cart_rows.get(barcode)
+        if item is None:
+            if row_id is not None:
+                index = self.table_sales.index(row_id)
+                self.table_sales.delete(row_id)
+                del self.cart_rows[barcode]
+                self.retag_cart_rows(index)
+        elif row_id is None:
+            tag = 'evenrow' if len(self.cart_rows) % 2 == 0 else 'oddrow'
+            row_id = self.table_sales.insert('', 'end', values=self.cart_row_values(item), tags=(tag,))
+            self.cart_rows[barcode] = row_id
+            self.table_sales.see(row_id)
+        else:
+            self.table_sales.item(row_id, values=self.cart_row_values(item))
+            self.table_sales.see(row_id)
+        if summary:
+            self.update_summary()
+        
+    def retag_cart_rows(self, start=0):
+        """ตั้งสีสลับแถว (odd/even) ใหม่ตั้งแต่แถวที่ start (หลังลบแถว แถวที่ตามมาเลื่อนขึ้น)"""
+        children = self.table_sales.get_children()
+        for idx in range(start, len(children)):
+            self.table_sales.item(children[idx], tags=('evenrow' if idx % 2 == 0 else 'oddrow',))
+        
     def update_table_with_totals(self):
-        """อัปเดตตาราง"""
+        """สร้างตารางใหม่ทั้งหมดจากตะกร้า (ใช้ตอนล้างตะกร้า)"""
         self.table_sales.delete(*self.table_sales.get_children())
+        self.cart_rows.clear()
         
         for idx, item in enumerate(self.cart.values()):
-            barcode = item[0]
-            title = item[1]
-            price = float(item[2])
-            quantity = int(item[3])
-            total = price * quantity
-            
             tag = 'evenrow' if idx % 2 == 0 else 'oddrow'
-            self.table_sales.insert('', 'end', 
-                                   values=[barcode, title, f"{price:,.2f}", quantity, f"{total:,.2f}"],
+            self.cart_rows[item[0]] = self.table_sales.insert('', 'end', 
+                                   values=self.cart_row_values(item),
                                    tags=(tag,))
             
         self.update_summary()
         
     def button_insert(self, b, t, p, q=1):
         """เพิ่มสินค้าลงตะกร้า"""
-        product_data = get_product_by_barcode(b)
-        if product_data and len(product_data) >= 7:
+        product_data = search_barcode(b)
+        if product_data and len(product_data) >= 5:
             try:
-                available_stock = int(product_data[5])
-                current_qty = self.cart[b][3] if b in self.cart else 0
+                available_stock = int(product_data[4])
+                current_qty = self.cart.quantity(b)
                 
                 if current_qty >= available_stock:
                     messagebox.showwarning("Warning", f"สินค้า {t} มีสต็อกเหลือ {available_stock} ชิ้น")
@@ -419,70 +357,63 @@ class SalesTab(Frame):
             except (ValueError, IndexError):
                 pass
         
-        if b not in self.cart:
-            self.cart[b] = [b, t, p, q]
-        else:
-            self.cart[b][3] = self.cart[b][3] + 1
-        
-        self.v_last_barcode.set(f"✅ เพิ่มแล้ว: {t}")
-        self.last_barcode_frame.config(bg='#c8e6c9')
+        # สินค้าใหม่เพิ่มตามจำนวน q สินค้าที่มีอยู่แล้วเพิ่มทีละ 1
+        self.cart.add(b, t, p, q if b not in self.cart else 1)
         
-        self.after(2000, lambda: self.reset_barcode_label())
+        self.show_status(f"✅ เพิ่มแล้ว: {t}", '#c8e6c9')
             
-        self.update_table_with_totals()
+        self.update_cart_row(b)
+    
+    def show_status(self, text, bg, ms=2000):
+        """แสดงข้อความใน label barcode แล้วรีเซ็ตหลัง ms (ใช้ timer เดียว ข้อความใหม่เลื่อนเวลารีเซ็ตออกไป)"""
+        self.v_last_barcode.set(text)
+        self.last_barcode_frame.config(bg=bg)
+        if self.status_timer is not None:
+            self.after_cancel(self.status_timer)
+        self.status_timer = self.after(ms, self.reset_barcode_label)
     
     def reset_barcode_label(self):
         """รีเซ็ต label barcode"""
+        if self.status_timer is not None:
+            self.after_cancel(self.status_timer)
+            self.status_timer = None
         self.last_barcode_frame.config(bg='#e8f5e9')
         self.v_last_barcode.set("พร้อมสแกนสินค้า...")
             
     def search_product(self, event=None):
-        """ค้นหาสินค้า"""
-        barcode = self.v_search.get()
+        """รับ barcode จากช่องค้นหา/เครื่องสแกนเข้าคิว แล้วล้างช่องรอการสแกนถัดไปทันที"""
+        self.scan_queue.put(self.v_search.get())
+        self.v_search.set('')
+        self.search.focus()
+    
+    def apply_scans(self, result):
+        """อัปเดตตารางและยอดรวมครั้งเดียวสำหรับทุก barcode ในชุด (เรียกจาก ScanQueue.flush)"""
         try:
-            data = search_barcode(barcode)
-            if data:
-                if len(data) >= 5:
-                    try:
-                        available_stock = int(data[4])
-                        current_qty = self.cart[data[0]][3] if data[0] in self.cart else 0
-                        
-                        if current_qty >= available_stock:
-                            messagebox.showwarning("Warning", f"สินค้า {data[1]} มีสต็อกเหลือ {available_stock} ชิ้น")
-                            self.v_search.set('')
-                            self.search.focus()
-                            return
-                    except (ValueError, IndexError):
-                        pass
-                
-                if data[0] not in self.cart:
-                    self.cart[data[0]] = [data[0], data[1], data[2], 1]
-                else:
-                    self.cart[data[0]][3] = self.cart[data[0]][3] + 1
-                
-                self.v_last_barcode.set(f"✅ เพิ่มแล้ว: {data[1]}")
-                self.last_barcode_frame.config(bg='#c8e6c9')
-                self.after(2000, lambda: self.reset_barcode_label())
-                    
-                self.update_table_with_totals()
-                    
-                self.v_search.set('')
-                self.search.focus()
-            else:
-                self.v_last_barcode.set(f"❌ ไม่พบสินค้า")
-                self.last_barcode_frame.config(bg='#ffcdd2')
-                self.after(2000, lambda: self.reset_barcode_label())
-                
-                messagebox.showerror("Error", "ไม่พบสินค้าที่มีรหัสสินค้านี้")
-                self.v_search.set('')
-                self.search.focus()
+            for barcode in result['changed']:
+                self.update_cart_row(barcode, summary=False)
+            if result['changed']:
+                self.update_summary()
+            
+            # แจ้งปัญหาใน label แทน messagebox เพื่อไม่ให้ขวางการสแกนถัดไป
+            if result['not_found'] or result['out_of_stock']:
+                self.bell()
+                messages = [f"❌ ไม่พบสินค้า: {barcode}" for barcode in result['not_found']]
+                messages += [f"⚠️ {title} มีสต็อกเหลือ {stock} ชิ้น"
+                             for barcode, title, stock in result['out_of_stock']]
+                self.show_status('\n'.join(dict.fromkeys(messages)), '#ffcdd2', 4000)
+            elif result['added']:
+                barcode, title = result['added'][-1]
+                count = len(result['added'])
+                text = f"✅ เพิ่มแล้ว: {title}" if count == 1 else f"✅ เพิ่มแล้ว {count} รายการ ล่าสุด: {title}"
+                self.show_status(text, '#c8e6c9')
         except Exception as e:
             messagebox.showerror("Error", f"เกิดข้อผิดพลาด: {str(e)}")
-            self.v_search.set('')
-            self.search.focus()
             
     def open_checkout_window(self):
         """เปิดหน้าต่าง Checkout พร้อมตัวเลือกวางบิล"""
+        # ใส่ barcode ที่ยังค้างในคิวลงตะกร้าก่อนคิดเงิน
+        if self.scan_queue:
+            self.scan_queue.flush()
         if not self.cart:
             messagebox.showwarning("Warning", "ไม่มีสินค้าในตะกร้า")
             return
@@ -693,26 +624,27 @@ class SalesTab(Frame):
         
         def save_transaction():
             try:
-                transaction_id = generate_transaction_id()
-                items_data = json.dumps(list(self.cart.values()))
-                
+                cart_items = list(self.cart.values())
+
                 if payment_type.get() == 'CASH':
                     # ชำระเงินสด
                     received = float(received_var.get().replace(',', ''))
                     change = received - grand_total
-                    
+
                     if received < grand_total:
                         messagebox.showerror("Error", "เงินที่รับไม่เพียงพอ")
                         return
-                    
-                    insert_transaction(transaction_id, subtotal, vat, grand_total, 
-                                     received, change, items_data)
-                    
-                    for item in self.cart.values():
-                        barcode = item[0]
-                        quantity = item[3]
-                        update_stock(barcode, quantity)
-                    
+
+                    # บันทึกการขายและตัดสต็อก (ผ่าน sale journal ถ้าเปิดใช้ ไม่เช่นนั้นใน transaction เดียว)
+                    sale = record_sale(cart_items, {
+                        'subtotal': subtotal,
+                        'vat': vat,
+                        'grand_total': grand_total,
+                        'received_amount': received,
+                        'change_amount': change
+                    })
+                    transaction_id = sale['transaction_id']
+
                     checkout_window.destroy()
                     self.show_print_options(transaction_id, subtotal, vat, grand_total, received, change)
                     
@@ -744,21 +676,16 @@ class SalesTab(Frame):
                         if not confirm:
                             return
                     
-                    # บันทึกธุรกรรม
-                    insert_transaction(transaction_id, subtotal, vat, grand_total, 0, 0, items_data)
-                    
-                    # สร้างบิลเครดิต
-                    bill_id = f"BILL{datetime.now().strftime('%Y%m%d%H%M%S')}"
+                    # บันทึกธุรกรรม สร้างบิลเครดิต และตัดสต็อกใน transaction เดียว
                     credit_days = customer[6]
-                    
-                    insert_credit_bill(bill_id, customer_id, transaction_id, credit_days, grand_total)
-                    
-                    # อัปเดตสต็อก
-                    for item in self.cart.values():
-                        barcode = item[0]
-                        quantity = item[3]
-                        update_stock(barcode, quantity)
-                    
+                    sale = commit_sale(cart_items, {
+                        'subtotal': subtotal,
+                        'vat': vat,
+                        'grand_total': grand_total
+                    }, customer={'customer_id': customer_id, 'credit_days': credit_days})
+                    transaction_id = sale['transaction_id']
+                    bill_id = sale['bill_id']
+
                     checkout_window.destroy()
                     
                     due_date = (datetime.now() + timedelta(days=credit_days)).strftime('%d/%m/%Y')
@@ -775,9 +702,18 @@ class SalesTab(Frame):
                     self.print_credit_bill(bill_id, customer, transaction_id, 
                                          subtotal, vat, grand_total, credit_days)
                 
+                # แท็บอื่นรีเฟรชเองเมื่อถูกเปิด (sale_committed/stock_changed/bill_changed)
                 self.clear_cart()
-                self.refresh_all_tabs()
-                
+
+            except InsufficientStockError as e:
+                # ไม่มีการบันทึกใดๆ เกิดขึ้น ตะกร้ายังอยู่ให้แก้ไขจำนวนได้
+                item = self.cart.get(e.barcode)
+                product_name = item[1] if item else e.barcode
+                messagebox.showerror("สต็อกไม่พอ",
+                    f"ไม่สามารถบันทึกการขายได้\n\n"
+                    f"สินค้า: {product_name} [{e.barcode}]\n"
+                    f"คงเหลือ: {e.available} ชิ้น\n"
+                    f"ต้องการ: {e.requested} ชิ้น")
             except Exception as e:
                 messagebox.showerror("Error", f"เกิดข้อผิดพลาด: {str(e)}")
                 import traceback
@@ -809,8 +745,6 @@ class SalesTab(Frame):
                 print("Receipt printer not available")
                 return
             
-            printer = ReceiptPrinter()
-            
             due_date = (datetime.now() + timedelta(days=credit_days)).strftime('%Y-%m-%d')
             
             transaction_data = {
@@ -828,10 +762,9 @@ class SalesTab(Frame):
                 'due_date': due_date
             }
             
-            filename = printer.create_receipt(transaction_data, list(self.cart.values()), 
-                                             f"credit_bill_{bill_id}.pdf")
-            
-            print(f"Credit bill created: {filename}")
+            # สร้าง PDF ใน background ตะกร้าถูกคัดลอกไปกับงานพิมพ์แล้ว ล้างได้ทันที
+            print_queue.submit('credit_bill', transaction_data, self.cart.values(),
+                               filename=f"credit_bill_{bill_id}.pdf", on_status=self.on_print_status)
             
         except Exception as e:
             print(f"Error printing credit bill: {e}")
@@ -905,41 +838,34 @@ class SalesTab(Frame):
         skip_btn.pack(pady=10, padx=20, fill=X)
 
     def export_pdf_receipt(self, transaction_data, cart_items, parent_window):
-        """Export ใบเสร็จเป็น PDF"""
-        try:
-            printer = ReceiptPrinter()
-            filename = printer.print_receipt_from_transaction(
-                transaction_id=transaction_data['transaction_id'],
-                subtotal=transaction_data['subtotal'],
-                vat=transaction_data['vat'],
-                grand_total=transaction_data['grand_total'],
-                received_amount=transaction_data['received_amount'],
-                change_amount=transaction_data['change_amount'],
-                cart_items=cart_items
-            )
-            
-            messagebox.showinfo("สำเร็จ", 
-                               f"Export PDF เรียบร้อย!\nไฟล์: {filename}\nไฟล์จะเปิดอัตโนมัติ")
-            parent_window.destroy()
-            
-        except Exception as e:
-            messagebox.showerror("ข้อผิดพลาด", f"ไม่สามารถ Export PDF ได้:\n{str(e)}")
+        """Export ใบเสร็จเป็น PDF (สร้างใน background แล้วเปิดไฟล์เมื่อเสร็จ)"""
+        print_queue.submit('pdf_receipt', transaction_data, cart_items, on_status=self.on_print_status)
+        parent_window.destroy()
+        self.show_status(f"📄 กำลังสร้าง PDF: {transaction_data['transaction_id']}", '#bbdefb')
 
     def print_thermal_receipt(self, transaction_data, cart_items, parent_window):
-        """พิมพ์ใบเสร็จด้วย Thermal Printer"""
-        try:
-            printer = ThermalPrinter()
-            transaction_data['datetime'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            success = printer.print_receipt(transaction_data, cart_items)
-            
-            if success:
-                messagebox.showinfo("สำเร็จ", 
-                                   f"พิมพ์ใบเสร็จเรียบร้อย!\nเลขที่: {transaction_data['transaction_id']}")
-                parent_window.destroy()
-            
-        except Exception as e:
-            messagebox.showerror("ข้อผิดพลาด", 
-                               f"ไม่สามารถพิมพ์ได้:\n{str(e)}\n\nกรุณาตรวจสอบ:\n• เครื่องพิมพ์เชื่อมต่อแล้ว\n• ติดตั้ง pywin32\n• เปิดเครื่องพิมพ์")
+        """พิมพ์ใบเสร็จด้วย Thermal Printer (ส่งเข้าคิวพิมพ์ เริ่มบิลถัดไปได้ทันที)"""
+        transaction_data['datetime'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        print_queue.submit('thermal_receipt', transaction_data, cart_items, on_status=self.on_print_status)
+        parent_window.destroy()
+        self.show_status(f"🖨️ กำลังพิมพ์ใบเสร็จ: {transaction_data['transaction_id']}", '#bbdefb')
+
+    def on_print_status(self, job):
+        """สถานะงานพิมพ์จาก print_queue (เรียกใน Tk thread)"""
+        if job.status == DONE:
+            if job.kind == 'thermal_receipt':
+                self.show_status(f"✅ พิมพ์ใบเสร็จเรียบร้อย: {job.document_id}", '#c8e6c9')
+            else:
+                self.show_status(f"✅ สร้าง PDF เรียบร้อย: {job.result}", '#c8e6c9', 4000)
+        elif job.status == RETRYING:
+            self.show_status(f"⚠️ พิมพ์ไม่สำเร็จ กำลังลองใหม่: {job.document_id}", '#fff9c4')
+        elif job.status == FAILED:
+            self.show_status(f"❌ พิมพ์ไม่สำเร็จ: {job.document_id}", '#ffcdd2', 4000)
+            if job.kind == 'thermal_receipt':
+                messagebox.showerror("ข้อผิดพลาด", 
+                                   f"ไม่สามารถพิมพ์ได้:\n{job.error}\n\nกรุณาตรวจสอบ:\n• เครื่องพิมพ์เชื่อมต่อแล้ว\n• ติดตั้ง pywin32\n• เปิดเครื่องพิมพ์")
+            else:
+                messagebox.showerror("ข้อผิดพลาด", f"ไม่สามารถสร้าง PDF ได้ ({job.document_id}):\n{job.error}")
 
     def test_thermal_printer(self):
         """ทดสอบ Thermal Printer"""
@@ -987,28 +913,6 @@ class SalesTab(Frame):
         self.reset_barcode_label()
         self.search.focus()
         
-    def refresh_all_tabs(self):
-        """รีเฟรชข้อมูลทุกแท็บหลังการขาย"""
-        try:
-            self.refresh_product_buttons()
-            
-            if self.product_tab:
-                self.product_tab.update_table_product()
-                
-            if self.dashboard_tab:
-                self.dashboard_tab.refresh_data()
-                
-            if self.profit_tab:
-                self.profit_tab.refresh_data()
-            
-            if self.credit_tab:
-                self.credit_tab.refresh_data()
-                
-            print("All tabs refreshed after checkout")
-            
-        except Exception as e:
-            print(f"Error refreshing tabs: {str(e)}")
-            
     def set_references(self, product_tab=None, dashboard_tab=None, profit_tab=None, credit_tab=None):
         """ตั้งค่า reference ไปยังแท็บอื่นๆ"""
         self.product_tab = product_tab
@@ -1017,7 +921,9 @@ class SalesTab(Frame):
         self.credit_tab = credit_tab
             
     def refresh_product_buttons(self):
-        """อัปเดตปุ่มสินค้าใหม่"""
-        for widget in self.F1.winfo_children():
-            widget.destroy()
-        self.create_product_buttons()
\ No newline at end of file
+        """อัปเดตปุ่มสินค้าใหม่ (เปลี่ยนเฉพาะข้อความของปุ่มที่มองเห็น)"""
+        self.product_grid.refresh()
+        
+    def update_product_buttons(self, barcodes):
+        """อัปเดตเฉพาะสินค้าที่เปลี่ยน (หลังขาย/แก้สต็อก) ไม่ต้องอ่านสินค้าทั้งหมดใหม่"""
+        self.product_grid.refresh_rows(barcodes)
\ No newline at end of file
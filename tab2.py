@@ -147,31 +147,23 @@ class ProductTab(Frame):
         """อัปเดตข้อมูลในตารางสินค้าพร้อมการค้นหา"""
         # ลบข้อมูลเดิมในตาราง
         self.table_product.delete(*self.table_product.get_children())
+        self.product_rows = {}
         
-        # ดึงข้อมูลทั้งหมด
-        data = view_product(allfield=False)
-        
-        # กรองข้อมูลตามคำค้นหา
-        search_text = self.v_search.get().strip().lower()
+        search_text = self.v_search.get().strip()
         
         if search_text:
-            # ค้นหาตามรหัสสินค้าหรือชื่อสินค้า
-            filtered_data = []
-            for d in data:
-                barcode = str(d[0]).lower()  # รหัสสินค้า
-                title = str(d[1]).lower()    # ชื่อสินค้า
-                
-                if search_text in barcode or search_text in title:
-                    filtered_data.append(d)
+            # ค้นหาตามรหัสสินค้าหรือชื่อสินค้าผ่านดัชนี product_fts
+            filtered_data = search_products(search_text, limit=None)
+            total = int(get_stats().get('total_products', 0))
             
             # แสดงข้อมูลที่กรองแล้ว
             for d in filtered_data:
-                self.table_product.insert('', 'end', values=d)
+                self.product_rows[str(d[0])] = self.table_product.insert('', 'end', values=d)
             
             # แสดงผลการค้นหา
             if filtered_data:
                 self.search_result_label.config(
-                    text=f'พบสินค้า {len(filtered_data)} รายการจากทั้งหมด {len(data)} รายการ',
+                    text=f'พบสินค้า {len(filtered_data)} รายการจากทั้งหมด {total} รายการ',
                     fg='green'
                 )
             else:
@@ -181,13 +173,39 @@ class ProductTab(Frame):
                 )
         else:
             # แสดงข้อมูลทั้งหมด
+            data = view_product(allfield=False)
             for d in data:
-                self.table_product.insert('', 'end', values=d)
+                self.product_rows[str(d[0])] = self.table_product.insert('', 'end', values=d)
             
-            self.search_result_label.config(
-                text=f'แสดงสินค้าทั้งหมด {len(data)} รายการ',
-                fg='#666'
-            )
+            self.show_total_label()
+    
+    def show_total_label(self):
+        self.search_result_label.config(
+            text=f'แสดงสินค้าทั้งหมด {len(self.product_rows)} รายการ',
+            fg='#666'
+        )
+    
+    def update_product_rows(self, barcodes):
+        """อัปเดตเฉพาะแถวของสินค้าที่เปลี่ยน (เรียกจาก DirtyTabs เมื่อแท็บถูกเปิด)"""
+        if self.v_search.get().strip():
+            # ผลการค้นหาอาจเปลี่ยนตามชื่อสินค้า ค้นใหม่ทั้งหมด
+            self.update_table_product()
+            return
+        for barcode in barcodes:
+            product = catalog.get(barcode) if catalog.ready else None
+            if product is None:
+                product = get_product_by_barcode(barcode)
+                product = product[1:9] if product else None
+            item = self.product_rows.get(barcode)
+            if product is None:
+                if item is not None:
+                    self.table_product.delete(item)
+                    del self.product_rows[barcode]
+            elif item is not None:
+                self.table_product.item(item, values=product)
+            else:
+                self.product_rows[barcode] = self.table_product.insert('', 'end', values=product)
+        self.show_total_label()
         
     def create_product_form(self, parent):
         """สร้างฟอร์มเพิ่ม/แก้ไขสินค้า"""
@@ -287,10 +305,6 @@ class ProductTab(Frame):
             return
         
         try:
-            success_count = 0
-            error_count = 0
-            error_details = []
-            
             with open(file_path, 'r', encoding='utf-8-sig') as file:
                 csv_reader = csv.DictReader(file)
                 
@@ -303,36 +317,17 @@ class ProductTab(Frame):
                     messagebox.showerror("Error", f"ไฟล์ CSV ขาดคอลัมน์: {', '.join(missing_fields)}")
                     return
                 
-                # อ่านข้อมูลและเพิ่มลงฐานข้อมูล
-                for row_num, row in enumerate(csv_reader, start=2):
-                    try:
-                        # ทำความสะอาดข้อมูล
-                        barcode = row.get('รหัสสินค้า', '').strip() 
-                        title = row.get('title', '').strip()
-                        price = float(row.get('price', '0').strip())
-                        cost = float(row.get('cost', '0').strip())
-                        quantity = int(row.get('quantity', '0').strip())
-                        unit = row.get('unit', 'ชิ้น').strip()
-                        category = row.get('category', '').strip()
-                        reorder_point = int(row.get('reorder_point', '1').strip())
-                        supplier = row.get('supplier', '').strip()
-                        
-                        # ตรวจสอบข้อมูลที่จำเป็น
-                        if not all([barcode, title, price, cost, quantity, unit, category]):
-                            error_details.append(f"แถว {row_num}: ข้อมูลไม่ครบถ้วน")
-                            error_count += 1
-                            continue
-                        
-                        # เพิ่มข้อมูลลงฐานข้อมูล
-                        insert_product(barcode, title, price, cost, quantity, unit, category, reorder_point, supplier)
-                        success_count += 1
-                        
-                    except ValueError as e:
-                        error_details.append(f"แถว {row_num}: ข้อมูลตัวเลขไม่ถูกต้อง ({str(e)})")
-                        error_count += 1
-                    except Exception as e:
-                        error_details.append(f"แถว {row_num}: {str(e)}")
-                        error_count += 1
+                # อ่านทีละแถวส่งให้ upsert_products บันทึกเป็นชุดใน transaction เดียว
+                rows = ((row.get('รหัสสินค้า', ''), row.get('title', ''), row.get('price', '0'),
+                         row.get('cost', '0'), row.get('quantity', '0'), row.get('unit', 'ชิ้น'),
+                         row.get('category', ''), row.get('reorder_point', '1'),
+                         row.get('supplier', ''))
+                        for row in csv_reader)
+                success_count, errors = upsert_products(rows)
+            
+            # แถวแรกของไฟล์เป็น header ข้อมูลจึงเริ่มที่แถว 2
+            error_details = [f"แถว {index + 2}: {message}" for index, message in errors]
+            error_count = len(error_details)
             
             # แสดงผลลัพธ์
             result_message = f"นำเข้าข้อมูลสำเร็จ: {success_count} รายการ"
@@ -345,10 +340,6 @@ class ProductTab(Frame):
             
             messagebox.showinfo("Import CSV", result_message)
             
-            # อัปเดตตารางและแท็บอื่นๆ
-            self.update_table_product()
-            self.refresh_other_tabs()
-            
         except Exception as e:
             messagebox.showerror("Error", f"เกิดข้อผิดพลาดในการอ่านไฟล์: {str(e)}")
     
@@ -418,12 +409,6 @@ class ProductTab(Frame):
                 self.clear_form()
                 self.status_label.config(text='✅ บันทึกสำเร็จ - พร้อมเพิ่มสินค้าใหม่', fg='green')
             
-            # อัปเดตตาราง
-            self.update_table_product()
-            
-            # อัปเดตแท็บอื่นๆ
-            self.refresh_other_tabs()
-                
             # กลับไป focus ที่ช่องรหัสสินค้า และรีเซ็ตสถานะ
             self.entries['Barcode:'].focus()
             self.L2.config(text='เพิ่มสินค้าใหม่')
@@ -497,16 +482,12 @@ class ProductTab(Frame):
                 delete_product(self.v_barcode2.get())
                 messagebox.showinfo("Success", "ลบสินค้าเรียบร้อยแล้ว")
                 self.clear_form()
-                self.update_table_product()
                 
                 # รีเซ็ตสถานะหลังลบ
                 self.L2.config(text='เพิ่มสินค้าใหม่')
                 self.btn_save.config(state='normal')  # Enable ปุ่มบันทึกหลังลบ
                 self.status_label.config(text='✅ ลบสำเร็จ - พร้อมเพิ่มสินค้าใหม่', fg='green')
                 self.entries['Barcode:'].focus()
-                
-                # อัปเดตแท็บอื่นๆ
-                self.refresh_other_tabs()
                     
             except Exception as e:
                 messagebox.showerror("Error", f"เกิดข้อผิดพลาด: {str(e)}")
@@ -520,18 +501,6 @@ class ProductTab(Frame):
         self.clear_form()
         self.entries['Barcode:'].focus()
         
-    def refresh_other_tabs(self):
-        """รีเฟรชแท็บอื่นๆ"""
-        try:
-            if self.sales_tab:
-                self.sales_tab.refresh_product_buttons()
-            if self.dashboard_tab:
-                self.dashboard_tab.refresh_data()
-            if self.profit_tab:
-                self.profit_tab.refresh_data()
-        except Exception as e:
-            print(f"Error refreshing other tabs: {e}")
-                
     def set_references(self, sales_tab=None, dashboard_tab=None, profit_tab=None):
         """ตั้งค่า reference ไปยังแท็บอื่นๆ (เรียกหลังสร้างแท็บทั้งหมดแล้ว)"""
         self.sales_tab = sales_tab
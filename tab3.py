@@ -245,19 +245,18 @@ class DashboardTab(Frame):
     
     def apply_filters(self):
         """ใช้ตัวกรองทั้งการค้นหาและสถานะ"""
-        search_text = self.search_var.get().strip().lower()
+        search_text = self.search_var.get().strip()
         status_filter = self.filter_status.get()
         
-        # เริ่มจากข้อมูลทั้งหมด
-        filtered = self.all_products.copy()
-        
-        # กรองตามคำค้นหา
+        # มีคำค้นหา: ใช้เฉพาะแถวที่ค้นผ่านดัชนี product_fts ไม่ต้องไล่สินค้าทั้งหมด
         if search_text:
-            filtered = [
-                product for product in filtered
-                if search_text in str(product.get('barcode', '')).lower() 
-                or search_text in str(product.get('title', '')).lower()
-            ]
+            filtered = []
+            for row in search_products(search_text, limit=None, allfield=True):
+                product = self.make_product_dict(row)
+                if product:
+                    filtered.append(product)
+        else:
+            filtered = self.all_products.copy()
         
         # กรองตามสถานะ
         if status_filter != "ทั้งหมด":
@@ -347,6 +346,44 @@ class DashboardTab(Frame):
         self.v_out_of_stock.set(f"{out_of_stock_count} รายการ")
         self.v_total_value.set(f"{total_value:,.2f} บาท")
         
+    def make_product_dict(self, product):
+        """แปลงแถวจากตาราง product (ทุกคอลัมน์) เป็น dictionary พร้อมสถานะสต็อก (แถวผิดรูปแบบคืน None)"""
+        if len(product) < 9:
+            return None
+        try:
+            id_val, barcode, title, price, cost, quantity, unit, category, reorder_point = product[:9]
+            
+            # แปลงข้อมูลให้เป็นชนิดที่ถูกต้อง
+            price = float(price)
+            cost = float(cost) 
+            quantity = int(quantity)
+            reorder_point = int(reorder_point) if reorder_point else 5
+        except (ValueError, TypeError) as e:
+            print(f"Error processing product {product}: {e}")
+            return None
+        
+        # กำหนดสถานะ
+        if quantity == 0:
+            status = "หมดสต็อก"
+        elif quantity <= reorder_point:
+            status = "ต้องสั่งซื้อ"
+        else:
+            status = "ปกติ"
+        
+        return {
+            'id': id_val,
+            'barcode': barcode,
+            'title': title,
+            'price': price,
+            'cost': cost,
+            'quantity': quantity,
+            'unit': unit,
+            'category': category,
+            'reorder_point': reorder_point,
+            'status': status,
+            'item_value': cost * quantity
+        }
+    
     def refresh_data(self):
         """รีเฟรชข้อมูลทั้งหมด"""
         try:
@@ -359,49 +396,17 @@ class DashboardTab(Frame):
             
             # วนลูปผ่านสินค้าแต่ละรายการ
             for product in products:
-                if len(product) >= 9:
-                    try:
-                        id_val, barcode, title, price, cost, quantity, unit, category, reorder_point = product[:9]
-                        
-                        # แปลงข้อมูลให้เป็นชนิดที่ถูกต้อง
-                        price = float(price)
-                        cost = float(cost) 
-                        quantity = int(quantity)
-                        reorder_point = int(reorder_point) if reorder_point else 5
-                        
-                        # คำนวณมูลค่า
-                        item_value = cost * quantity
-                        
-                        # กำหนดสถานะ
-                        if quantity == 0:
-                            status = "หมดสต็อก"
-                            alert_messages.append(f"⚠️ {title} - หมดสต็อก!")
-                        elif quantity <= reorder_point:
-                            status = "ต้องสั่งซื้อ"
-                            alert_messages.append(f"🔄 {title} - สต็อกเหลือ {quantity} {unit} (ต้องสั่งซื้อ)")
-                        else:
-                            status = "ปกติ"
-                        
-                        # เก็บข้อมูลในรูปแบบ dictionary
-                        product_dict = {
-                            'id': id_val,
-                            'barcode': barcode,
-                            'title': title,
-                            'price': price,
-                            'cost': cost,
-                            'quantity': quantity,
-                            'unit': unit,
-                            'category': category,
-                            'reorder_point': reorder_point,
-                            'status': status,
-                            'item_value': item_value
-                        }
-                        
-                        self.all_products.append(product_dict)
-                        
-                    except (ValueError, IndexError) as e:
-                        print(f"Error processing product {product}: {e}")
-                        continue
+                product_dict = self.make_product_dict(product)
+                if not product_dict:
+                    continue
+                
+                if product_dict['status'] == "หมดสต็อก":
+                    alert_messages.append(f"⚠️ {product_dict['title']} - หมดสต็อก!")
+                elif product_dict['status'] == "ต้องสั่งซื้อ":
+                    alert_messages.append(f"🔄 {product_dict['title']} - สต็อกเหลือ "
+                                          f"{product_dict['quantity']} {product_dict['unit']} (ต้องสั่งซื้อ)")
+                
+                self.all_products.append(product_dict)
             
             # แสดงข้อมูลทั้งหมด
             self.display_products(self.all_products)
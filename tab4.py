@@ -1,7 +1,6 @@
 from tkinter import *
 from tkinter import ttk, messagebox, filedialog
 from basicsql import *
-import json
 import csv
 from datetime import datetime, timedelta
 from tkcalendar import DateEntry
@@ -370,72 +369,60 @@ class ProfitTab(Frame):
             start_date_str = self.start_date.get_date().strftime('%Y-%m-%d')
             end_date_str = self.end_date.get_date().strftime('%Y-%m-%d')
             
-            transactions = get_sales_by_date_range(start_date_str, end_date_str)
-            
+            # รายการสินค้าที่ขาย พร้อมต้นทุน ณ เวลาขาย (จากตาราง sale_items) อ่านทีละชุด
+            sale_lines = iter_sale_lines_by_date_range(start_date_str, end_date_str)
+
             # คำนวณข้อมูลสรุป
             total_sales = 0
             total_cost = 0
             total_profit = 0
-            
+
             # เคลียร์ข้อมูลเก่า
             self.all_data = []
             self.current_data = []
-            
+
             # ล้างการค้นหา
             self.search_var.set("")
             self.search_result_label.config(text="")
-                
-            # วิเคราะห์แต่ละ transaction
-            for transaction in transactions:
+
+            # วิเคราะห์แต่ละรายการสินค้า
+            for trans_date, trans_id, barcode, title, quantity, price, cost in sale_lines:
                 try:
-                    trans_id, trans_date, subtotal, vat, grand_total, received, change, items_json = transaction[1:9]
-                    
-                    # แปลง JSON เป็นข้อมูลสินค้า
-                    items = json.loads(items_json)
                     trans_date_short = trans_date.split(' ')[0]  # เอาแค่วันที่
-                    
-                    for item in items:
-                        barcode, title, price, quantity = item
-                        price = float(price)
-                        quantity = int(quantity)
-                        
-                        # ดึงข้อมูลต้นทุนจากฐานข้อมูล
-                        product_data = get_product_by_barcode(barcode)
-                        if product_data and len(product_data) >= 5:
-                            cost = float(product_data[4])  # cost field
-                        else:
-                            cost = 0  # หากไม่พบข้อมูลต้นทุน
-                        
-                        # คำนวณ
-                        revenue = price * quantity
-                        total_item_cost = cost * quantity
-                        profit = revenue - total_item_cost
-                        profit_margin = (profit / revenue * 100) if revenue > 0 else 0
-                        
-                        # รวมยอด
-                        total_sales += revenue
-                        total_cost += total_item_cost
-                        total_profit += profit
-                        
-                        # เก็บข้อมูลทั้งหมด
-                        data_item = {
-                            'date': trans_date_short,
-                            'transaction_id': trans_id,
-                            'barcode': barcode,
-                            'product': title,
-                            'quantity': quantity,
-                            'price': price,
-                            'cost': cost,
-                            'revenue': revenue,
-                            'total_cost': total_item_cost,
-                            'profit': profit,
-                            'profit_margin': profit_margin
-                        }
-                        
-                        self.all_data.append(data_item)
-                        
-                except (ValueError, KeyError, json.JSONDecodeError) as e:
-                    print(f"Error processing transaction: {e}")
+                    price = float(price)
+                    quantity = int(quantity)
+                    cost = float(cost or 0)
+
+                    # คำนวณ
+                    revenue = price * quantity
+                    total_item_cost = cost * quantity
+                    profit = revenue - total_item_cost
+                    profit_margin = (profit / revenue * 100) if revenue > 0 else 0
+
+                    # รวมยอด
+                    total_sales += revenue
+                    total_cost += total_item_cost
+                    total_profit += profit
+
+                    # เก็บข้อมูลทั้งหมด
+                    data_item = {
+                        'date': trans_date_short,
+                        'transaction_id': trans_id,
+                        'barcode': str(barcode),
+                        'product': title,
+                        'quantity': quantity,
+                        'price': price,
+                        'cost': cost,
+                        'revenue': revenue,
+                        'total_cost': total_item_cost,
+                        'profit': profit,
+                        'profit_margin': profit_margin
+                    }
+
+                    self.all_data.append(data_item)
+
+                except (ValueError, TypeError) as e:
+                    print(f"Error processing sale item: {e}")
                     continue
             
             # แสดงข้อมูลทั้งหมด
@@ -3,6 +3,7 @@ from tkinter import *
 from tkinter import ttk, messagebox
 from datetime import datetime, timedelta
 from basicsql import *
+from print_queue import print_queue, DONE, FAILED, RETRYING
 
 # Import receipt printer
 try:
@@ -17,12 +18,6 @@ class CreditManagementTab(Frame):
         super().__init__(parent, bg='#f0f0f0')
         self.pack(fill=BOTH, expand=True)
         
-        # สร้าง ReceiptPrinter instance
-        if RECEIPT_PRINTER_AVAILABLE:
-            self.receipt_printer = ReceiptPrinter()
-        else:
-            self.receipt_printer = None
-        
         # สร้าง Canvas และ Scrollbar สำหรับทั้ง Tab
         self.canvas = Canvas(self, bg='#ffffff', highlightthickness=0)
         self.main_scrollbar = ttk.Scrollbar(self, orient=VERTICAL, command=self.canvas.yview)
@@ -402,6 +397,10 @@ class CreditManagementTab(Frame):
                   command=lambda: self.invoice_vars['transaction_id'].set(
                       self.generate_invoice_id())).pack(side=LEFT)
         
+        # เลขที่แสดงเป็นเพียงตัวอย่าง เลขจริงจองตอนบันทึก (อาจต่างกันถ้ามีการออกใบวางบิลอื่นก่อน)
+        Label(transaction_frame, text="(เลขที่ชั่วคราว ยืนยันเลขจริงตอนบันทึก)",
+              font=('Arial', 9), bg='#ffffff', fg='#757575').pack(side=LEFT, padx=5)
+        
         # กำหนดชำระ
         Label(form_frame, text="ระยะเวลาชำระ (วัน):", font=('Arial', 11), 
               bg='#ffffff').grid(row=2, column=0, sticky='e', padx=10, pady=10)
@@ -725,8 +724,6 @@ class CreditManagementTab(Frame):
                     if success:
                         messagebox.showinfo("Success", message)
                         pay_window.destroy()
-                        self.refresh_credit_table()
-                        self.refresh_customer_table()
                     else:
                         messagebox.showerror("Error", message)
                         
@@ -749,7 +746,7 @@ class CreditManagementTab(Frame):
     def print_credit_bill(self):
         """พิมพ์ใบวางบิล"""
         try:
-            if not RECEIPT_PRINTER_AVAILABLE or not self.receipt_printer:
+            if not RECEIPT_PRINTER_AVAILABLE:
                 messagebox.showerror("Error", 
                     "ไม่พบ receipt_printer.py\nกรุณาตรวจสอบว่าไฟล์อยู่ในโฟลเดอร์เดียวกัน")
                 return
@@ -772,19 +769,13 @@ class CreditManagementTab(Frame):
             # แปลง transaction_id จากบิลเป็นข้อมูล sales
             transaction_id = bill[2]
             
-            # ดึงข้อมูลสินค้าจาก sales
-            with conn:
-                c.execute('SELECT * FROM sales WHERE transaction_id=?', (transaction_id,))
-                sale = c.fetchone()
-            
-            if not sale:
+            # ดึงรายการสินค้าของการขายจาก sale_items
+            cart_items = get_sale_items(transaction_id)
+
+            if not cart_items:
                 messagebox.showerror("Error", "ไม่พบข้อมูลการขาย")
                 return
             
-            # แปลง items จาก string เป็น list
-            import json
-            cart_items = json.loads(sale[8])  # items column
-            
             # เตรียมข้อมูลลูกค้า
             customer_info = {
                 'name': bill[11] if len(bill) > 11 else 'N/A',  # customer_name
@@ -797,29 +788,38 @@ class CreditManagementTab(Frame):
             due_date = datetime.strptime(bill[4], '%Y-%m-%d')
             due_days = (due_date - bill_date).days
             
-            # สร้างใบวางบิล
-            try:
-                filename = self.receipt_printer.create_invoice(
-                    transaction_id=bill_id,
-                    subtotal=bill[5],  # total_amount (ก่อน VAT)
-                    vat=bill[5] * 0.07,  # คำนวณ VAT 7%
-                    grand_total=bill[5] * 1.07,  # รวม VAT
-                    cart_items=cart_items,
-                    customer_info=customer_info,
-                    due_days=due_days
-                )
-                
-                messagebox.showinfo("Success", 
-                    f"พิมพ์ใบวางบิล {bill_id} เรียบร้อย\nไฟล์: {filename}")
-                
-            except Exception as e:
-                messagebox.showerror("Error", f"ไม่สามารถพิมพ์ได้: {str(e)}")
+            # สร้างใบวางบิลใน background ผลแจ้งกลับที่ on_print_status
+            self.submit_invoice_print(bill_id, bill[5], bill[5] * 0.07, bill[5] * 1.07,
+                                      cart_items, customer_info, due_days)
             
         except Exception as e:
             messagebox.showerror("Error", f"เกิดข้อผิดพลาด: {str(e)}")
             import traceback
             traceback.print_exc()
     
+    def submit_invoice_print(self, transaction_id, subtotal, vat, grand_total,
+                             cart_items, customer_info, due_days):
+        """ส่งงานสร้าง PDF ใบวางบิลเข้า print_queue (ไม่บล็อกหน้าจอ)"""
+        transaction_data = {
+            'transaction_id': transaction_id,
+            'subtotal': subtotal,
+            'vat': vat,
+            'grand_total': grand_total,
+            'customer_info': customer_info,
+            'due_days': due_days
+        }
+        print_queue.submit('invoice', transaction_data, cart_items, on_status=self.on_print_status)
+    
+    def on_print_status(self, job):
+        """สถานะงานพิมพ์จาก print_queue (เรียกใน Tk thread)"""
+        if job.status == DONE:
+            messagebox.showinfo("Success", 
+                f"พิมพ์ใบวางบิล {job.document_id} เรียบร้อย\nไฟล์: {job.result}")
+        elif job.status == RETRYING:
+            print(f"⚠️ พิมพ์ใบวางบิลไม่สำเร็จ กำลังลองใหม่: {job.document_id}")
+        elif job.status == FAILED:
+            messagebox.showerror("Error", f"ไม่สามารถพิมพ์ใบวางบิล {job.document_id} ได้:\n{job.error}")
+    
     def view_bill_details(self):
         """ดูรายละเอียดบิล"""
         try:
@@ -932,33 +932,15 @@ class CreditManagementTab(Frame):
             if not confirm:
                 return
             
-            # ดึงข้อมูลบิลเพื่อหา customer_id
-            bill = get_credit_bill_by_id(bill_id)
-            if not bill:
+            # ลบบิลและอัพเดทยอดหนี้ลูกค้า (ลดยอดค้างชำระ)
+            if not delete_credit_bill(bill_id):
                 messagebox.showerror("Error", "ไม่พบข้อมูลบิล")
                 return
             
-            customer_id = bill[1]
-            
-            # ลบบิลและอัพเดทยอดหนี้ลูกค้า
-            with conn:
-                # ลบบิลเครดิต
-                c.execute('DELETE FROM credit_bills WHERE bill_id=?', (bill_id,))
-                
-                # อัพเดทยอดหนี้ลูกค้า (ลดยอดค้างชำระ)
-                c.execute('UPDATE customers SET total_debt = total_debt - ? WHERE customer_id=?', 
-                         (remaining, customer_id))
-                
-                conn.commit()
-            
             messagebox.showinfo("Success", 
                 f"ลบบิล {bill_id} เรียบร้อย\n"
                 f"ยอดหนี้ลูกค้าลดลง {remaining:,.2f} บาท")
             
-            # รีเฟรชข้อมูล
-            self.refresh_credit_table()
-            self.refresh_customer_table()
-            
         except Exception as e:
             messagebox.showerror("Error", f"เกิดข้อผิดพลาด: {str(e)}")
             import traceback
@@ -977,15 +959,12 @@ class CreditManagementTab(Frame):
         else:
             bills = get_all_credit_bills()
         
-        # อัปเดตสถิติ
-        pending_bills = get_pending_credit_bills()
-        overdue_bills = get_overdue_credit_bills()
-        
-        total_debt = sum(b[7] for b in pending_bills)  # remaining_amount
+        # อัปเดตสถิติ (อ่านจากตัวนับ ไม่ต้องดึงบิลทั้งหมดมานับ)
+        stats = get_credit_statistics()
         
-        self.stats_labels['pending'].config(text=f"{len(pending_bills)} บิล")
-        self.stats_labels['overdue'].config(text=f"{len(overdue_bills)} บิล")
-        self.stats_labels['total_debt'].config(text=f"{total_debt:,.2f} ฿")
+        self.stats_labels['pending'].config(text=f"{stats['pending_count']} บิล")
+        self.stats_labels['overdue'].config(text=f"{stats['overdue_count']} บิล")
+        self.stats_labels['total_debt'].config(text=f"{stats['pending_amount']:,.2f} ฿")
         
         # ถ้ามีการค้นหา ให้กรองข้อมูล
         search_term = getattr(self, 'bill_search_var', StringVar()).get().lower()
@@ -1024,14 +1003,12 @@ class CreditManagementTab(Frame):
     # ==================== Invoice Creation Functions ====================
     
     def generate_invoice_id(self):
-        """สร้างเลขที่ใบวางบิลอัตโนมัติ"""
+        """แสดงเลขที่ใบวางบิลถัดไปแบบชั่วคราว (ยังไม่จองเลข commit_invoice จองจริงตอนบันทึก)"""
         try:
-            with conn:
-                c.execute("SELECT COUNT(*) FROM credit_bills")
-                count = c.fetchone()[0]
-                return f"INV{count + 1:06d}"
+            self.invoice_preview_id = peek_document_id('INV')
         except:
-            return f"INV{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            self.invoice_preview_id = f"INV{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        return self.invoice_preview_id
     
     def refresh_customer_combo(self):
         """รีเฟรช Combobox ลูกค้า"""
@@ -1088,14 +1065,13 @@ class CreditManagementTab(Frame):
         # โหลดสินค้า
         def load_products(search_term=''):
             product_table.delete(*product_table.get_children())
-            products = view_product(allfield=False)
+            products = search_products(search_term, limit=None)
             
             for product in products:
                 barcode, title, price, cost, quantity, unit, category, reorder = product
-                if search_term.lower() in title.lower() or search_term in barcode:
-                    product_table.insert('', 'end', values=(
-                        barcode, title, f"{price:,.2f}", quantity
-                    ))
+                product_table.insert('', 'end', values=(
+                    barcode, title, f"{price:,.2f}", quantity
+                ))
         
         load_products()
         
@@ -1199,7 +1175,7 @@ class CreditManagementTab(Frame):
     def create_and_print_invoice(self):
         """สร้างและพิมพ์ใบวางบิล"""
         try:
-            if not RECEIPT_PRINTER_AVAILABLE or not self.receipt_printer:
+            if not RECEIPT_PRINTER_AVAILABLE:
                 messagebox.showerror("Error", 
                     "ไม่พบ receipt_printer.py\nไม่สามารถพิมพ์ใบวางบิลได้")
                 return
@@ -1223,8 +1199,10 @@ class CreditManagementTab(Frame):
                 messagebox.showerror("Error", "ระยะเวลาชำระต้องเป็นตัวเลข")
                 return
             
-            # เตรียมข้อมูล
+            # เตรียมข้อมูล (ถ้าไม่ได้แก้เลขที่เอง ให้ commit_invoice จองเลขจริงตอนบันทึก)
             transaction_id = self.invoice_vars['transaction_id'].get()
+            if transaction_id == getattr(self, 'invoice_preview_id', None):
+                transaction_id = None
             notes = self.notes_text.get('1.0', 'end-1c').strip()
             
             # คำนวณยอด
@@ -1256,37 +1234,24 @@ class CreditManagementTab(Frame):
                 'address': customer[4] or '-'
             }
             
-            # บันทึกลงฐานข้อมูล
-            # 1. บันทึก sales
-            import json
-            items_json = json.dumps(cart_items, ensure_ascii=False)
-            insert_transaction(transaction_id, subtotal, vat, grand_total, 0, 0, items_json)
-            
-            # 2. สร้างบิลเครดิต
-            insert_credit_bill(transaction_id, customer_id, transaction_id, 
-                             due_days, grand_total, notes)
-            
-            # 3. พิมพ์ใบวางบิล
-            filename = self.receipt_printer.create_invoice(
-                transaction_id=transaction_id,
-                subtotal=subtotal,
-                vat=vat,
-                grand_total=grand_total,
-                cart_items=cart_items,
-                customer_info=customer_info,
-                due_days=due_days
-            )
+            # บันทึก sales และบิลเครดิตใน transaction เดียว
+            result = commit_invoice(cart_items,
+                                    {'subtotal': subtotal, 'vat': vat, 'grand_total': grand_total},
+                                    customer_id, due_days, notes, transaction_id)
+            transaction_id = result['transaction_id']
+            # แสดงเลขที่ที่บันทึกจริงในฟอร์ม (เลขตัวอย่างอาจถูกใช้ไปแล้ว)
+            self.invoice_vars['transaction_id'].set(transaction_id)
+            
+            # พิมพ์ใบวางบิลใน background (บันทึกแล้ว ไม่ต้องรอ PDF)
+            self.submit_invoice_print(transaction_id, subtotal, vat, grand_total,
+                                      cart_items, customer_info, due_days)
             
             messagebox.showinfo("Success", 
-                f"สร้างใบวางบิล {transaction_id} เรียบร้อย\nไฟล์: {filename}")
+                f"บันทึกใบวางบิล {transaction_id} เรียบร้อย\nกำลังสร้างไฟล์ PDF")
             
             # ล้างฟอร์ม
             self.clear_invoice_form()
             
-            # รีเฟรช
-            self.refresh_credit_table()
-            self.refresh_customer_table()
-            
         except Exception as e:
             messagebox.showerror("Error", f"เกิดข้อผิดพลาด: {str(e)}")
             import traceback
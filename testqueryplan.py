@@ -0,0 +1,360 @@
+# testqueryplan.py - ตรวจแผนการค้นหา (EXPLAIN QUERY PLAN) ของทุก query ใน basicsql
+# บนฐานข้อมูลจำลองขนาดร้านจริง (สินค้า 100k, การขาย 1M, บิลเครดิต 50k)
+#
+# query ในเส้นทางหลัก (ค้นบาร์โค้ด, ยอดขายตามวันที่, บิลค้าง/เกินกำหนด, บิลของลูกค้า, ขายสินค้า)
+# ต้องค้นผ่าน index ถ้ามี SCAN ทั้งตารางจะแสดง ❌ และจบด้วย exit code 1
+# ทุกฟังก์ชันสาธารณะของ basicsql ที่ห่อด้วย _timed ต้องถูกเรียกใน cases() อย่างน้อยหนึ่งครั้ง
+# (ตรวจจากสถิติ query) ฟังก์ชันใหม่ที่ยังไม่มี case จะทำให้จบด้วย exit code 1 เช่นกัน
+# เวลาที่ใช้ของแต่ละฟังก์ชันถูกเก็บไว้ใน queryplan_times.json ในโฟลเดอร์ทดสอบ
+# รันครั้งถัดไปจะเทียบกับครั้งก่อนและเตือนถ้าช้าลงมาก
+#
+# ใช้งาน: python testqueryplan.py [สัดส่วนขนาดข้อมูล เช่น 0.1] [โฟลเดอร์ทดสอบ]
+# ฐานข้อมูลจำลองถูกสร้างครั้งแรกครั้งเดียว (ใช้เวลาหลายสิบวินาที) ครั้งต่อไปใช้ไฟล์เดิม
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+PRODUCTS = 100000
+SALES = 1000000
+CUSTOMERS = 2000
+CREDIT_BILLS = 50000
+SALES_DAYS = 3 * 365
+SEED_BATCH = 10000
+
+TIMES_FILE = 'queryplan_times.json'
+REGRESSION_FACTOR = 2.0      # ช้ากว่าครั้งก่อนเกิน 2 เท่า...
+REGRESSION_MIN_MS = 5.0      # ...และช้าลงอย่างน้อย 5 ms จึงนับว่าช้าลง
+
+# ตารางเล็กที่อ่านทั้งตารางได้โดยไม่มีปัญหา
+SMALL_TABLES = ('stats', 'sequences', 'schema_version')
+
+# ฟังก์ชันที่ไม่รันในการทดสอบนี้: ชื่อ -> เหตุผล
+NOT_RUN = {
+    'convert_to_incremental_vacuum': 'VACUUM ทั้งไฟล์ ไม่มี query ให้ตรวจแผน',
+}
+
+
+def seed(basicsql, scale):
+    """สร้างข้อมูลจำลองถ้ายังไม่มี"""
+    products = int(PRODUCTS * scale)
+    sales = int(SALES * scale)
+    bills = int(CREDIT_BILLS * scale)
+    connection = basicsql.db.reader()
+    # นับจากสินค้า เพราะ archive_old_sales ใน cases() ย้ายการขายเก่าออกจากตาราง sales
+    if connection.execute('SELECT COUNT(*) FROM product').fetchone()[0] >= products:
+        return
+
+    random.seed(1)
+    now = datetime.now()
+    items = json.dumps([['P000001', 'สินค้าทดสอบ', 25.0, 2]])
+    titles = ['น้ำดื่ม', 'ขนมปัง', 'บะหมี่กึ่งสำเร็จรูป', 'นมกล่อง', 'Coffee', 'สบู่']
+    start = time.perf_counter()
+    with basicsql.db.writer() as connection:
+        connection.executemany(
+            'INSERT INTO product (barcode, title, price, cost, quantity, unit, category, reorder_point, supplier) '
+            'VALUES (?,?,?,?,?,?,?,?,?)',
+            ((f'P{n:06d}', f'{titles[n % len(titles)]} รุ่น {n}', 25.0, 15.0, 1000, 'ชิ้น', 'ทดสอบ', 5, '')
+             for n in range(1, products + 1)))
+
+        connection.executemany(
+            'INSERT INTO customers VALUES (?,?,?,?,?,?,?,0,?,?)',
+            ((f'C{n:05d}', f'ลูกค้า {n}', '', '', '', 50000, 30, now.strftime('%Y-%m-%d %H:%M:%S'), '')
+             for n in range(1, CUSTOMERS + 1)))
+
+        for first in range(0, sales, SEED_BATCH):
+            sale_rows, item_rows = [], []
+            for n in range(first, min(first + SEED_BATCH, sales)):
+                when = now - timedelta(minutes=(sales - n) * SALES_DAYS * 24 * 60 // sales)
+                transaction_id = f'S{n + 1:07d}'
+                sale_rows.append((transaction_id, when.strftime('%Y-%m-%d %H:%M:%S'),
+                                  50.0, 3.5, 53.5, 100.0, 46.5, items))
+                item_rows.append((transaction_id, f'P{n % products + 1:06d}', 'สินค้าทดสอบ', 25.0, 2))
+            connection.executemany(
+                'INSERT INTO sales (transaction_id, datetime, subtotal, vat, grand_total, '
+                'received_amount, change_amount, items) VALUES (?,?,?,?,?,?,?,?)', sale_rows)
+            connection.executemany(
+                'INSERT INTO sale_items (transaction_id, barcode, title, unit_price, quantity) '
+                'VALUES (?,?,?,?,?)', item_rows)
+
+        bill_rows = []
+        for n in range(1, bills + 1):
+            billed = now - timedelta(days=random.randint(0, SALES_DAYS))
+            status = random.choices(('PAID', 'PENDING', 'PARTIAL'), (70, 20, 10))[0]
+            paid = {'PAID': 500.0, 'PENDING': 0.0, 'PARTIAL': 200.0}[status]
+            bill_rows.append((f'BILL{n:08d}', f'C{n % CUSTOMERS + 1:05d}', f'S{n:07d}',
+                              billed.strftime('%Y-%m-%d %H:%M:%S'),
+                              (billed + timedelta(days=30)).strftime('%Y-%m-%d'),
+                              500.0, paid, 500.0 - paid, status))
+        connection.executemany(
+            'INSERT INTO credit_bills (bill_id, customer_id, transaction_id, bill_date, due_date, '
+            'total_amount, paid_amount, remaining_amount, status) VALUES (?,?,?,?,?,?,?,?,?)', bill_rows)
+        connection.execute('ANALYZE')
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        basicsql.reconcile_stats()
+    print(f'🛠️ สร้างข้อมูลจำลอง: สินค้า {products:,} ขาย {sales:,} บิลเครดิต {bills:,} '
+          f'({time.perf_counter() - start:.1f} s)')
+
+
+def first_row(rows):
+    """อ่านแถวแรกจาก iter_* (พอให้ query ถูกส่งไปโดยไม่ต้องอ่านทั้งตาราง)"""
+    for row in rows:
+        return row
+
+
+def journal_sales(basicsql, cart, payment):
+    """บิลจาก sale journal สองบิลพร้อมเลขที่จองไว้ (แบบเดียวกับที่ sale_journal.py ส่งให้ apply_journaled_sales)"""
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return [{'transaction_id': transaction_id, 'datetime': now, 'items': cart, 'payment': payment}
+            for transaction_id in basicsql.reserve_document_ids('T', 2)]
+
+
+def snapshot_batch(basicsql, day):
+    """snapshot หนึ่งชุดแบบที่งาน snapshot ของ maintenance.py ทำในแต่ละ slice"""
+    with basicsql.db.writer() as connection:
+        return basicsql.snapshot_stock_batch(connection, (day, ''))
+
+
+def cases(basicsql):
+    """(ชื่อ, ฟังก์ชันที่เรียก, เป็นเส้นทางหลักหรือไม่)
+
+    case ที่เพิ่ม/ลบข้อมูลทำเป็นคู่ (เพิ่มแล้วลบ) ฐานข้อมูลจำลองจึงใช้ซ้ำได้ทุกครั้ง
+    """
+    today = datetime.now()
+    month_start = (today - timedelta(days=60)).strftime('%Y-%m-%d')
+    month_end = (today - timedelta(days=30)).strftime('%Y-%m-%d')
+    yesterday = (today - timedelta(days=1)).strftime('%Y-%m-%d')
+    # การขายที่เก่ากว่า archive_days ถูกย้ายไป archive (ประมาณหนึ่งวันแรกของข้อมูลจำลอง)
+    archive_days = SALES_DAYS - 1
+    archived_start = (today - timedelta(days=SALES_DAYS + 5)).strftime('%Y-%m-%d')
+    archived_end = (today - timedelta(days=SALES_DAYS - 30)).strftime('%Y-%m-%d')
+    cart = [['P000010', 'สินค้าทดสอบ', 25.0, 1], ['P000020', 'สินค้าทดสอบ', 25.0, 2]]
+    payment = {'subtotal': 75.0, 'vat': 5.25, 'grand_total': 80.25,
+               'received_amount': 100.0, 'change_amount': 19.75}
+    product = ('PQP00001', 'สินค้าทดสอบแผน', 25.0, 15.0, 10, 'ชิ้น', 'ทดสอบ', 5, '')
+    import_rows = [(f'P{n:06d}', f'สินค้านำเข้า {n}', 25.0, 15.0, 1000, 'ชิ้น', 'ทดสอบ', 5, '')
+                   for n in range(100, 110)]
+    return [
+        # สินค้า
+        ('search_barcode', lambda: basicsql.search_barcode('P050000'), True),
+        ('get_product_by_barcode', lambda: basicsql.get_product_by_barcode('P050000'), True),
+        ('search_products (FTS)', lambda: basicsql.search_products('บะหมี่'), True),
+        ('search_products (LIKE)', lambda: basicsql.search_products('P0'), False),
+        ('update_stock', lambda: basicsql.update_stock('P000030', 1), True),
+        ('adjust_stock', lambda: basicsql.adjust_stock('P000030', 5), True),
+        ('update_product', lambda: basicsql.update_product(
+            'P000040', 'สินค้าแก้ไข', 30.0, 15.0, 900, 'ชิ้น', 'ทดสอบ', 5, ''), True),
+        ('iter_products', lambda: first_row(basicsql.iter_products()), False),
+        ('upsert_products', lambda: basicsql.upsert_products(import_rows), True),
+        ('insert_product', lambda: basicsql.insert_product(*product), True),
+        ('delete_product', lambda: basicsql.delete_product(product[0]), True),
+        # การขาย
+        ('commit_sale', lambda: basicsql.commit_sale(cart, payment), True),
+        ('commit_sale (credit)', lambda: basicsql.commit_sale(
+            cart, payment, {'customer_id': 'C00001', 'credit_days': 30}), True),
+        ('commit_invoice', lambda: basicsql.commit_invoice(cart, payment, 'C00001', 30), True),
+        ('apply_journaled_sales', lambda: basicsql.apply_journaled_sales(
+            journal_sales(basicsql, cart, payment)), True),
+        ('release_document_ids', lambda: basicsql.release_document_ids(
+            'T', basicsql.reserve_document_ids('T', 2)), True),
+        ('insert_transaction', lambda: basicsql.insert_transaction(
+            basicsql.next_document_id('T'), 75.0, 5.25, 80.25, 100.0, 19.75, json.dumps(cart)), True),
+        ('get_sales_by_date_range', lambda: basicsql.get_sales_by_date_range(month_start, month_end), True),
+        ('get_sale_lines_by_date_range', lambda: basicsql.get_sale_lines_by_date_range(month_start, month_end), True),
+        ('get_product_sales_summary', lambda: basicsql.get_product_sales_summary(month_start, month_end), True),
+        ('get_daily_sales_summary', lambda: basicsql.get_daily_sales_summary(month_start, month_end), True),
+        ('get_sale_items', lambda: basicsql.get_sale_items('S0500000'), True),
+        ('iter_transactions', lambda: first_row(basicsql.iter_transactions()), False),
+        ('peek_document_id', lambda: basicsql.peek_document_id('INV'), True),
+        # ย้ายการขายเก่าไป archive แล้วอ่านรายงาน/รายการย้อนหลังผ่าน ATTACH
+        ('archive_old_sales', lambda: basicsql.archive_old_sales(archive_days), False),
+        ('get_sales_by_date_range (archive)', lambda: basicsql.get_sales_by_date_range(
+            archived_start, archived_end), True),
+        ('get_daily_sales_summary (archive)', lambda: basicsql.get_daily_sales_summary(
+            archived_start, archived_end), True),
+        ('get_sale_items (archive)', lambda: basicsql.get_sale_items('S0000001'), True),
+        # ลูกค้าและบิลเครดิต
+        ('get_customer_by_id', lambda: basicsql.get_customer_by_id('C00010'), True),
+        ('get_all_customers', basicsql.get_all_customers, False),
+        ('insert_customer', lambda: basicsql.insert_customer('CQP01', 'ลูกค้าทดสอบแผน'), True),
+        ('update_customer', lambda: basicsql.update_customer(
+            'CQP01', 'ลูกค้าทดสอบแผน', '', '', '', 1000, 30, ''), True),
+        ('update_customer_debt', lambda: basicsql.update_customer_debt('CQP01', 0), True),
+        ('insert_credit_bill', lambda: basicsql.insert_credit_bill(
+            'BILLQP01', 'CQP01', None, 30, 100.0), True),
+        ('delete_credit_bill', lambda: basicsql.delete_credit_bill('BILLQP01'), True),
+        ('delete_customer', lambda: basicsql.delete_customer('CQP01'), True),
+        ('get_pending_credit_bills', basicsql.get_pending_credit_bills, True),
+        ('get_overdue_credit_bills', basicsql.get_overdue_credit_bills, True),
+        ('get_customer_credit_bills', lambda: basicsql.get_customer_credit_bills('C00010'), True),
+        ('get_credit_bill_by_id', lambda: basicsql.get_credit_bill_by_id('BILL00000100'), True),
+        ('get_credit_statistics', basicsql.get_credit_statistics, True),
+        ('pay_credit_bill', lambda: basicsql.pay_credit_bill('BILL00000100', 0.0), True),
+        ('iter_credit_bills', lambda: first_row(basicsql.iter_credit_bills()), False),
+        # สต็อกย้อนหลังและสถิติ
+        ('get_stock_on', lambda: basicsql.get_stock_on('P000010', yesterday), True),
+        ('get_stock_movements', lambda: basicsql.get_stock_movements('P000010'), True),
+        ('get_stock_levels_on', lambda: basicsql.get_stock_levels_on(yesterday), False),
+        ('snapshot_stock_batch', lambda: snapshot_batch(basicsql, yesterday), True),
+        ('take_stock_snapshots', basicsql.take_stock_snapshots, True),
+        ('get_database_info', basicsql.get_database_info, True),
+        ('get_stats', basicsql.get_stats, True),
+        ('reconcile_stats', lambda: basicsql.reconcile_stats(fix=False), False),
+    ]
+
+
+def timed_functions(basicsql):
+    """ชื่อฟังก์ชันสาธารณะของ basicsql ที่ห่อด้วย _timed (ทุกฟังก์ชันที่ส่ง query)"""
+    return {name for name, value in vars(basicsql).items()
+            if not name.startswith('_') and callable(value) and hasattr(value, '__wrapped__')
+            and getattr(value, '__module__', None) == basicsql.__name__}
+
+
+def trace(basicsql, call):
+    """เรียกฟังก์ชันพร้อมเก็บ SQL ที่ส่งผ่านทั้ง reader และ writer คืนค่า (statements, เวลา ms)"""
+    statements = []
+    with basicsql.db.writer() as writer:
+        pass
+    connections = {id(c): c for c in (basicsql.db.reader(), writer)}.values()
+    for connection in connections:
+        connection.set_trace_callback(statements.append)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            call()
+            elapsed = (time.perf_counter() - start) * 1000
+    finally:
+        for connection in connections:
+            connection.set_trace_callback(None)
+    return statements, elapsed
+
+
+def plan_of(basicsql, connection, sql):
+    """EXPLAIN QUERY PLAN ของ SELECT/INSERT/UPDATE/DELETE (คำสั่งอื่นคืน None)
+
+    คำสั่งที่อ้างถึง archive_YYYY จะ ATTACH ไฟล์นั้นชั่วคราว (รายงาน DETACH ไปแล้วหลังจบ)
+    """
+    keyword = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+    if keyword not in ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE'):
+        return None
+    aliases = [basicsql._attach_archive(connection, year)
+               for year in sorted(set(re.findall(r'\barchive_(\d{4})\.', sql)))]
+    try:
+        return [row[3] for row in connection.execute('EXPLAIN QUERY PLAN ' + sql)]
+    finally:
+        for alias in aliases:
+            basicsql._detach_archive(connection, alias)
+
+
+def partial_indexes(connection):
+    """ชื่อ index ที่มี WHERE (partial index อ่านทั้ง index ได้ เพราะมีเฉพาะแถวที่ต้องการ)"""
+    rows = connection.execute("SELECT name, sql FROM sqlite_master WHERE type='index' AND sql IS NOT NULL")
+    return {name for name, sql in rows if ' WHERE ' in sql.upper()}
+
+
+def full_scans(details, partial=()):
+    """รายการ SCAN ที่อ่านทั้งตาราง (ไม่นับ FTS, ตารางเล็ก/ตารางระบบ, partial index, subquery คงที่
+    และผลของ CTE/subquery ที่ SQLite สร้างไว้ในหน่วยความจำ)"""
+    derived = {detail.split()[1] for detail in details
+               if detail.startswith(('MATERIALIZE', 'CO-ROUTINE')) and len(detail.split()) > 1}
+    scans = []
+    for detail in details:
+        if not detail.startswith('SCAN'):
+            continue
+        if 'VIRTUAL TABLE' in detail or 'CONSTANT ROW' in detail:
+            continue
+        if detail.split()[1] in derived:
+            continue
+        if 'INDEX' in detail and detail.split()[-1] in partial:
+            continue
+        table = detail.split()[1].split('.')[-1]
+        # ตารางระบบและตารางภายในของ FTS5 ที่ product_fts อ่านเอง
+        if table in SMALL_TABLES or table.startswith('sqlite_') or table.startswith('product_fts_'):
+            continue
+        scans.append(detail)
+    return scans
+
+
+def main():
+    scale = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    folder = sys.argv[2] if len(sys.argv) > 2 else os.path.join(tempfile.gettempdir(), f'posplan_{scale:g}')
+    os.makedirs(folder, exist_ok=True)
+
+    # import basicsql แล้วเปิดฐานข้อมูลจำลองในโฟลเดอร์ทดสอบ ไม่แตะ posdb.sqlite3 ของร้าน
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(folder)
+    import basicsql
+    with contextlib.redirect_stdout(io.StringIO()):
+        basicsql.init_db(os.path.join(folder, 'queryplan.sqlite3'))
+        basicsql.db.reader()
+
+    print('=' * 100)
+    print(f'Query plan check: scale {scale:g}, folder {folder}')
+    print('=' * 100)
+    seed(basicsql, scale)
+
+    previous = {}
+    if os.path.exists(TIMES_FILE):
+        with open(TIMES_FILE, encoding='utf-8') as f:
+            previous = json.load(f)
+
+    failed, slower, times = [], [], {}
+    connection = basicsql.db.reader()
+    partial = partial_indexes(connection)
+    # ใช้สถิติ query ของ basicsql ตรวจว่า cases() เรียกครบทุกฟังก์ชัน
+    basicsql.enable_query_stats(True)
+    basicsql.reset_query_stats()
+    for name, call, hot in cases(basicsql):
+        statements, elapsed = trace(basicsql, call)
+        times[name] = round(elapsed, 3)
+        scans = []
+        for sql in dict.fromkeys(statements):
+            details = plan_of(basicsql, connection, sql)
+            if details:
+                scans.extend(f'{detail}  ←  {" ".join(sql.split())[:60]}' for detail in full_scans(details, partial))
+
+        before = previous.get(name)
+        change = ''
+        if before is not None:
+            change = f'(เดิม {before:.2f} ms)'
+            if elapsed > before * REGRESSION_FACTOR and elapsed - before > REGRESSION_MIN_MS:
+                slower.append(name)
+                change += ' ⚠️ ช้าลง'
+
+        mark = '❌' if hot and scans else ('➖' if scans else '✅')
+        print(f'{mark} {name:<30} {elapsed:9.2f} ms  {len(statements):3d} sql  {change}')
+        for detail in scans:
+            print(f'      {detail}')
+        if hot and scans:
+            failed.append(name)
+
+    with open(TIMES_FILE, 'w', encoding='utf-8') as f:
+        json.dump(times, f, ensure_ascii=False, indent=2)
+
+    missing = sorted(timed_functions(basicsql) - set(basicsql.get_query_stats()) - set(NOT_RUN))
+    basicsql.enable_query_stats(False)
+
+    print('-' * 100)
+    print('➖ = อ่านทั้งตารางโดยตั้งใจ (รายงาน/ส่งออกทั้งหมด)')
+    for name, reason in NOT_RUN.items():
+        print(f'⏭️ ไม่ได้ทดสอบ {name}: {reason}')
+    if slower:
+        print(f'⚠️ ช้ากว่าครั้งก่อน: {", ".join(slower)}')
+    if missing:
+        print(f'❌ ฟังก์ชันที่ยังไม่มี case ใน cases(): {", ".join(missing)}')
+        sys.exit(1)
+    if failed:
+        print(f'❌ query เส้นทางหลักที่อ่านทั้งตาราง: {", ".join(failed)}')
+        sys.exit(1)
+    print('✅ query เส้นทางหลักทั้งหมดค้นผ่าน index')
+
+
+if __name__ == '__main__':
+    main()